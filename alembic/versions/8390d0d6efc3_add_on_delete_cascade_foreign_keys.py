@@ -0,0 +1,70 @@
+"""Add ON DELETE CASCADE foreign keys for students and teachers
+
+Revision ID: 8390d0d6efc3
+Revises: 84c57c643c3d
+Create Date: 2026-10-19 07:14:31.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8390d0d6efc3'
+down_revision: Union[str, Sequence[str], None] = '84c57c643c3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (table, column, referred table, ON DELETE action)
+FOREIGN_KEYS = [
+    ('applications', 'teacher_id', 'teachers', 'SET NULL'),
+    ('attendances', 'student_id', 'applications', 'CASCADE'),
+    ('attendances', 'teacher_id', 'teachers', 'CASCADE'),
+    ('attendances', 'schedule_id', 'schedules', 'SET NULL'),
+    ('schedules', 'student_id', 'applications', 'CASCADE'),
+    ('schedules', 'teacher_id', 'teachers', 'CASCADE'),
+]
+
+# Gives the unnamed foreign keys SQLite reflects a predictable name in batch mode
+NAMING_CONVENTION = {"fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"}
+
+
+def _fk_name(table: str, column: str, referred: str) -> str:
+    if op.get_bind().dialect.name == 'postgresql':
+        # Postgres' default name, used by the earlier migrations and create_all
+        return f'{table}_{column}_fkey'
+    return f'fk_{table}_{column}_{referred}'
+
+
+def _recreate_foreign_keys(with_ondelete: bool) -> None:
+    is_sqlite = op.get_bind().dialect.name == 'sqlite'
+    if is_sqlite:
+        # Batch mode copies and drops tables, which SQLite refuses while enforcing foreign keys
+        op.execute('PRAGMA foreign_keys=OFF')
+
+    for table in sorted({fk[0] for fk in FOREIGN_KEYS}):
+        with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+            for fk_table, column, referred, ondelete in FOREIGN_KEYS:
+                if fk_table != table:
+                    continue
+                name = _fk_name(table, column, referred)
+                batch_op.drop_constraint(name, type_='foreignkey')
+                batch_op.create_foreign_key(
+                    name, referred, [column], ['id'],
+                    ondelete=ondelete if with_ondelete else None,
+                )
+
+    if is_sqlite:
+        op.execute('PRAGMA foreign_keys=ON')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _recreate_foreign_keys(with_ondelete=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _recreate_foreign_keys(with_ondelete=False)
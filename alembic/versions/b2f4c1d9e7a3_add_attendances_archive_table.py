@@ -0,0 +1,56 @@
+"""Add attendances_archive cold storage table
+
+Revision ID: b2f4c1d9e7a3
+Revises: 8390d0d6efc3
+Create Date: 2026-10-19 08:02:11.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b2f4c1d9e7a3'
+down_revision: Union[str, Sequence[str], None] = '8390d0d6efc3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # On Postgres this is a partitioned parent; archive_attendance creates the
+    # monthly partitions (attendances_archive_yYYYYmMM) as it moves rows in.
+    op.create_table('attendances_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('class_date', sa.Date(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('teacher_status', sa.String(), nullable=True),
+    sa.Column('schedule_id', sa.Integer(), nullable=True),
+    sa.Column('notes', sa.String(), nullable=True),
+    sa.Column('student_id', sa.Integer(), nullable=False),
+    sa.Column('teacher_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.ForeignKeyConstraint(['schedule_id'], ['schedules.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['student_id'], ['applications.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['teacher_id'], ['teachers.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', 'class_date'),
+    postgresql_partition_by='RANGE (class_date)'
+    )
+    op.create_index('ix_attendances_archive_teacher_date', 'attendances_archive', ['teacher_id', 'class_date'], unique=False)
+    op.create_index('ix_attendances_archive_student_date', 'attendances_archive', ['student_id', 'class_date'], unique=False)
+    op.create_index(op.f('ix_attendances_archive_schedule_id'), 'attendances_archive', ['schedule_id'], unique=False)
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE TABLE IF NOT EXISTS attendances_archive_default PARTITION OF attendances_archive DEFAULT')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_attendances_archive_schedule_id'), table_name='attendances_archive')
+    op.drop_index('ix_attendances_archive_student_date', table_name='attendances_archive')
+    op.drop_index('ix_attendances_archive_teacher_date', table_name='attendances_archive')
+    # Dropping the partitioned parent drops every partition with it
+    op.drop_table('attendances_archive')
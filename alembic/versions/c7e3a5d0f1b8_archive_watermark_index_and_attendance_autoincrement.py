@@ -0,0 +1,51 @@
+"""Index attendances_archive.class_date and never reuse attendance ids
+
+Revision ID: c7e3a5d0f1b8
+Revises: b2f4c1d9e7a3
+Create Date: 2026-10-19 16:40:27.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e3a5d0f1b8'
+down_revision: Union[str, Sequence[str], None] = 'b2f4c1d9e7a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # max(class_date) (the archive watermark, read on every hot attendance query)
+    # becomes an index lookup instead of a scan of the whole cold table
+    op.create_index('ix_attendances_archive_class_date', 'attendances_archive', ['class_date'], unique=False)
+
+    if op.get_bind().dialect.name == 'sqlite':
+        # Archived rows keep their id. Without AUTOINCREMENT SQLite hands out the
+        # highest rowid again once those rows are archived, so rebuild the table
+        # with it and start the sequence above every id in either table.
+        # (Postgres sequences never go back; nothing to do there.)
+        op.execute('PRAGMA foreign_keys=OFF')
+        with op.batch_alter_table('attendances', recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+            pass
+        op.execute('PRAGMA foreign_keys=ON')
+        op.execute("DELETE FROM sqlite_sequence WHERE name = 'attendances'")
+        op.execute(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT 'attendances', max("
+            "coalesce((SELECT max(id) FROM attendances), 0), "
+            "coalesce((SELECT max(id) FROM attendances_archive), 0))"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('PRAGMA foreign_keys=OFF')
+        with op.batch_alter_table('attendances', recreate='always', table_kwargs={'sqlite_autoincrement': False}):
+            pass
+        op.execute('PRAGMA foreign_keys=ON')
+    op.drop_index('ix_attendances_archive_class_date', table_name='attendances_archive')
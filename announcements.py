@@ -0,0 +1,164 @@
+# announcements.py
+
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from jinja2.sandbox import SandboxedEnvironment
+from jinja2 import StrictUndefined
+from sqlalchemy.orm import Session
+import crud
+import email_outbox
+import email_sender
+import email_templates
+import models
+
+# Admin announcements go out from email_worker.py, never from the request:
+# the endpoint only stores an AnnouncementJob with its recipients, and the
+# worker sends one Brevo request per batch using `messageVersions`
+# (one personalised version per recipient).
+
+# Brevo accepts up to 1000 versions per request; smaller batches make progress visible sooner
+ANNOUNCEMENT_BATCH_SIZE = int(os.getenv("ANNOUNCEMENT_BATCH_SIZE", "100"))
+# Pacing: the next batch of a job is not sent before batch_size / rate seconds have passed
+ANNOUNCEMENT_MAX_RECIPIENTS_PER_SECOND = float(os.getenv("ANNOUNCEMENT_MAX_RECIPIENTS_PER_SECOND", "20"))
+
+# Announcement bodies are written by admins, so they run in Jinja's sandbox.
+# Autoescaping is off here because the result is plain text; the HTML layout
+# (templates/email/announcement.html) escapes it.
+sandbox = SandboxedEnvironment(undefined=StrictUndefined, autoescape=False)
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+# The variables a body can use; every recipient's context has exactly these keys
+SAMPLE_CONTEXT = {"first_name": "Aisha", "last_name": "Rahman", "course": "Quran Reading (Nazra)", "shift": "Morning", "teacher": "Ustadh Karim"}
+
+
+def compile_body(body: str):
+    """Compiles an announcement body. Raises jinja2.TemplateError if it is invalid."""
+    return sandbox.from_string(body)
+
+
+def validate_body(body: str):
+    """
+    Compiles the body and renders it once against SAMPLE_CONTEXT, so a misspelt
+    variable ({{ frist_name }}) is rejected here instead of failing every batch
+    in the worker. Raises jinja2.TemplateError (UndefinedError included).
+    """
+    compile_body(body).render(**SAMPLE_CONTEXT)
+
+
+def create_job(db: Session, announcement, created_by: str = None, gender: str = None):
+    """Validates the body, selects the recipients once and stores the job for the worker."""
+    validate_body(announcement.body)
+    rows = crud.get_announcement_recipients(
+        db,
+        course_id=announcement.course_id,
+        shift=announcement.shift,
+        teacher_id=announcement.teacher_id,
+        status=announcement.status,
+        gender=gender,
+    )
+    recipients = [{
+        "email": row.email,
+        "name": f"{row.first_name or ''} {row.last_name or ''}".strip(),
+        "context": {
+            "first_name": row.first_name or "",
+            "last_name": row.last_name or "",
+            "course": row.course or "",
+            "shift": row.shift or "",
+            "teacher": row.teacher or "",
+        },
+    } for row in rows]
+
+    audience = announcement.model_dump(include={"course_id", "shift", "teacher_id", "status"})
+    audience["gender"] = gender
+    job = models.AnnouncementJob(
+        subject=announcement.subject,
+        body=announcement.body,
+        audience=json.dumps(audience),
+        recipients=json.dumps(recipients),
+        status="pending" if recipients else "done",
+        total_recipients=len(recipients),
+        next_run_at=_now(),
+        created_by=created_by,
+        finished_at=None if recipients else _now(),
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def build_batch_message(job: models.AnnouncementJob, recipients: list) -> dict:
+    """Builds one Brevo request with a personalised message version per recipient."""
+    template = compile_body(job.body)
+    versions = []
+    for recipient in recipients:
+        body = template.render(**recipient["context"])
+        html_content, text_content = email_templates.render(
+            "announcement", subject=job.subject, body=body, paragraphs=body.split("\n\n"),
+        )
+        to = {"email": recipient["email"]}
+        if recipient["name"]:
+            to["name"] = recipient["name"]
+        versions.append({
+            "to": [to],
+            "htmlContent": html_content,
+            "textContent": text_content,
+        })
+    return {
+        "sender": {"name": email_sender.FROM_NAME, "email": email_sender.FROM_EMAIL},
+        "subject": job.subject,
+        # Brevo requires a top-level body; every version overrides it
+        "htmlContent": versions[0]["htmlContent"],
+        "messageVersions": versions,
+    }
+
+
+async def process_next_batch(db: Session, transport) -> int:
+    """
+    Sends the next batch of one due job. Returns the number of recipients handled
+    (0 if no job was due). A failed batch is retried with the outbox's backoff and
+    counted as failed after email_outbox.MAX_ATTEMPTS.
+    """
+    job = db.query(models.AnnouncementJob).filter(
+        models.AnnouncementJob.status.in_(["pending", "running"]),
+        models.AnnouncementJob.next_run_at <= _now(),
+    ).order_by(models.AnnouncementJob.next_run_at).limit(1).with_for_update(skip_locked=True).first()
+    if job is None:
+        db.rollback()
+        return 0
+
+    recipients = json.loads(job.recipients or "[]")
+    batch = recipients[job.cursor:job.cursor + ANNOUNCEMENT_BATCH_SIZE]
+    job.status = "running"
+    # Lease the job while the request is in flight, so another worker skips it
+    job.next_run_at = _now() + timedelta(seconds=email_outbox.CLAIM_LEASE_SECONDS)
+    db.commit()
+
+    try:
+        await transport.send(build_batch_message(job, batch))
+    except Exception as e:
+        job.batch_attempts += 1
+        job.last_error = str(e)[:500]
+        if job.batch_attempts < email_outbox.MAX_ATTEMPTS:
+            job.next_run_at = _now() + timedelta(seconds=email_outbox.retry_delay(job.batch_attempts))
+            db.commit()
+            return 0
+        job.failed_count += len(batch)
+    else:
+        job.sent_count += len(batch)
+
+    job.cursor += len(batch)
+    job.batch_attempts = 0
+    if job.cursor >= job.total_recipients:
+        job.status = "done" if job.sent_count else "failed"
+        job.finished_at = _now()
+        job.recipients = None # Drop the address list once the job is finished
+    else:
+        job.next_run_at = _now() + timedelta(seconds=len(batch) / ANNOUNCEMENT_MAX_RECIPIENTS_PER_SECOND)
+    db.commit()
+    return len(batch)
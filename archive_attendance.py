@@ -0,0 +1,33 @@
+# archive_attendance.py
+# Scheduled job: moves attendance older than the hot horizon into cold storage
+# ('attendances_archive'). Reads stay transparent, see crud.attendance_tables_for.
+#
+# Run it from cron, e.g. nightly:
+#   python archive_attendance.py            # uses ATTENDANCE_HOT_DAYS (default 365)
+#   python archive_attendance.py --days 180
+
+import argparse
+from datetime import date, timedelta
+
+import crud
+import models
+from database import SessionLocal, engine
+
+def run(days: int, batch_size: int):
+    models.Base.metadata.create_all(bind=engine)
+    cutoff = date.today() - timedelta(days=days)
+    print(f"--- ARCHIVE: Moving attendance before {cutoff} into cold storage ---")
+    db = SessionLocal()
+    try:
+        moved = crud.archive_attendance(db, before=cutoff, batch_size=batch_size)
+        print(f"--- ARCHIVE: Moved {moved} attendance records ---")
+        return moved
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old attendance records.")
+    parser.add_argument("--days", type=int, default=crud.ATTENDANCE_HOT_DAYS, help="Keep this many days of attendance hot.")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    run(args.days, args.batch_size)
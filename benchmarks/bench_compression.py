@@ -0,0 +1,66 @@
+# bench_compression.py
+# CPU time versus bytes on the wire for the /api/admin/teachers/ roster
+# (teachers with their nested students and schedules), at each gzip level
+# and, if the brotli package is installed, a range of brotli qualities.
+# Pick GZIP_LEVEL / BROTLI_QUALITY (compression.py) from the output.
+#
+#   python benchmarks/bench_compression.py --students 1000 --rounds 20
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import compression
+import crud
+import models
+import serializers
+from bench_serialization import seed
+
+GZIP_LEVELS = [1, 3, 6, 9]
+BROTLI_QUALITIES = [1, 4, 6, 9, 11]
+
+
+def timed(fn, rounds: int) -> float:
+    fn() # Warm-up
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds
+
+
+def run(students: int, teachers: int, rounds: int):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    seed(db, students, teachers)
+    payload = serializers.dump(serializers.teachers, crud.get_teachers(db, limit=teachers))
+
+    settings = [("gzip", level) for level in GZIP_LEVELS]
+    if compression.brotli is not None:
+        settings += [("br", quality) for quality in BROTLI_QUALITIES]
+    else:
+        print("(brotli not installed - gzip only)")
+
+    print(f"Roster of {teachers} teachers / {students} students: {len(payload) / 1024:.0f} KB of JSON, {rounds} rounds")
+    print(f"  {'encoding':<10}{'level':>6}{'KB':>10}{'ratio':>8}{'ms':>9}{'MB/s':>9}")
+    for encoding, level in settings:
+        size = len(compression.compress(payload, encoding, level))
+        seconds = timed(lambda: compression.compress(payload, encoding, level), rounds)
+        print(f"  {encoding:<10}{level:>6}{size / 1024:>10.1f}{len(payload) / size:>8.1f}"
+              f"{seconds * 1000:>9.2f}{len(payload) / seconds / 1e6:>9.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Response compression CPU/size benchmark on a teacher roster.")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--teachers", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    run(args.students, args.teachers, args.rounds)
@@ -0,0 +1,49 @@
+# bench_email_render.py
+# Micro-benchmark for composing emails from the Jinja templates (HTML + text).
+#
+#   python benchmarks/bench_email_render.py --emails 10000
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import email_sender
+import email_templates
+
+APPLICATION = {
+    "first_name": "Fatima", "last_name": "Rahman", "email": "fatima@example.com",
+    "phone_number": "01700000000", "whatsapp_number": "01700000000", "gender": "Female",
+    "age": 12, "country": "Bangladesh", "preferred_course": "Quran Reading", "shift": "Morning",
+    "parent_name": "Abdur Rahman", "parent_number": "01800000000", "status": "Pending",
+}
+
+SAMPLES = [
+    ("send_student_confirmation", {"application_data": APPLICATION}),
+    ("send_admin_notification", {"application_data": APPLICATION}),
+    ("send_teacher_credentials_email", {"teacher_data": {"email": "t@example.com", "name": "Ustadh"}, "temp_password": "Xy12Ab34"}),
+    ("send_forgot_password_email", {"email": "user@example.com", "temp_password": "Xy12Ab34"}),
+    ("send_manual_admission_email", {"student_data": APPLICATION}),
+]
+
+
+def run(emails: int):
+    started = time.perf_counter()
+    email_templates.compile_all()
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    for i in range(emails):
+        kind, payload = SAMPLES[i % len(SAMPLES)]
+        email_sender.compose(kind, payload)
+    elapsed = time.perf_counter() - started
+    print(f"compile: {compile_ms:.1f}ms; {emails} emails in {elapsed:.3f}s "
+          f"-> {elapsed / emails * 1e6:.1f}us/email ({emails / elapsed:.0f} emails/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Email template rendering benchmark.")
+    parser.add_argument("--emails", type=int, default=10000)
+    run(parser.parse_args().emails)
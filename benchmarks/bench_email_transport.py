@@ -0,0 +1,45 @@
+# bench_email_transport.py
+# Measures email throughput against the local Brevo stand-in (brevo_stub.py),
+# so it never touches the real service.
+#
+#   python benchmarks/bench_email_transport.py --emails 2000 --latency 0.05 --concurrency 8
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import brevo_stub
+import email_sender
+from brevo_transport import BrevoTransport
+
+
+async def run(emails: int, latency: float, concurrency: int, connections: int):
+    stub = brevo_stub.create_stub_app(latency=latency, keep_messages=False)
+    message = email_sender.compose("send_forgot_password_email", {"email": "bench@test.com", "temp_password": "x"})
+    async with BrevoTransport(
+        api_key="stub",
+        base_url="http://brevo-stub/v3",
+        max_connections=connections,
+        max_concurrency=concurrency,
+        transport=httpx.ASGITransport(app=stub),
+    ) as transport:
+        started = time.perf_counter()
+        await asyncio.gather(*(transport.send(message) for _ in range(emails)))
+        elapsed = time.perf_counter() - started
+    print(f"{emails} emails in {elapsed:.2f}s -> {emails / elapsed:.0f} emails/s "
+          f"(latency={latency}s, concurrency={concurrency}, errors={transport.stats['errors']})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Email transport throughput benchmark.")
+    parser.add_argument("--emails", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated provider latency in seconds.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--connections", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.emails, args.latency, args.concurrency, args.connections))
@@ -0,0 +1,91 @@
+# bench_serialization.py
+# Serialization time of the /api/admin/students/ response: FastAPI's default
+# response_model path (validate, serialize to dicts, json.dumps) versus the
+# precompiled TypeAdapter + ORJSONResponse path in serializers.py.
+#
+#   python benchmarks/bench_serialization.py --students 1000 --rounds 20
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import time as clock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import crud
+import models
+import schemas
+import serializers
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def seed(db, students: int, teachers: int = 20):
+    for t in range(teachers):
+        db.add(models.Teacher(
+            id=t + 1, name=f"Teacher {t}", email=f"teacher{t}@example.com", phone_number="01700000000",
+            shift="Morning", gender="Female", hashed_password="x",
+        ))
+    for s in range(students):
+        db.add(models.Application(
+            id=s + 1, first_name="Fatima", last_name=f"Rahman {s}", email=f"student{s}@example.com",
+            phone_number="01700000000", country="Bangladesh", preferred_course="Quran Reading",
+            age=12, gender="Female", shift="Morning", status="Active", teacher_id=s % teachers + 1,
+            parent_name="Abdur Rahman", learning_goals="Read fluently with tajweed.",
+        ))
+        for d in range(2):
+            db.add(models.Schedule(
+                day_of_week=DAYS[(s + d) % 7], start_time=clock(9), end_time=clock(10),
+                student_id=s + 1, teacher_id=s % teachers + 1,
+            ))
+    db.commit()
+
+
+def timed(fn, rounds: int) -> float:
+    fn() # Warm-up (lazy loads, adapter caches)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds
+
+
+def run(students: int, rounds: int):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    seed(db, students)
+    rows = crud.get_applications(db, skip=0, limit=students)
+
+    field = create_model_field(name="Response_read_students", type_=list[schemas.Application], mode="serialization")
+
+    def default_path():
+        content = asyncio.run(serialize_response(field=field, response_content=rows, is_coroutine=False))
+        return JSONResponse(content).body
+
+    def fast_path():
+        return serializers.respond(serializers.students, rows).body
+
+    assert json.loads(default_path()) == json.loads(fast_path()), "Both paths must produce the same JSON"
+    before, after = timed(default_path, rounds), timed(fast_path, rounds)
+    per_k = 1000 / len(rows)
+    print(f"{len(rows)} students, {rounds} rounds")
+    print(f"  response_model + JSONResponse:  {before * per_k * 1000:7.2f}ms per 1k students")
+    print(f"  TypeAdapter + ORJSONResponse:   {after * per_k * 1000:7.2f}ms per 1k students ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List response serialization benchmark.")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    run(args.students, args.rounds)
@@ -0,0 +1,52 @@
+# brevo_stub.py
+# Local stand-in for Brevo's transactional email API, for tests and load benchmarks.
+#
+# In-process (tests):  BrevoTransport(api_key="stub", base_url="http://brevo-stub/v3",
+#                                     transport=httpx.ASGITransport(app=brevo_stub.create_stub_app()))
+# As a server:         uvicorn brevo_stub:app --port 8025
+#                      BREVO_API_URL=http://localhost:8025/v3 python email_worker.py
+
+import asyncio
+import os
+import random
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def create_stub_app(latency: float = 0.0, failure_rate: float = 0.0, keep_messages: bool = True) -> FastAPI:
+    """
+    Builds a stub app. `latency` (seconds) simulates the provider's response time;
+    `failure_rate` (0..1) answers that share of requests with a 503.
+    Accepted messages are kept in `app.state.messages` unless keep_messages is False.
+    """
+    stub = FastAPI(title="Brevo stub")
+    stub.state.messages = []
+    stub.state.requests = 0
+
+    @stub.post("/v3/smtp/email")
+    async def send_transac_email(request: Request):
+        stub.state.requests += 1
+        body = await request.json()
+        if latency:
+            await asyncio.sleep(latency)
+        if not request.headers.get("api-key"):
+            return JSONResponse(status_code=401, content={"code": "unauthorized", "message": "Key not found"})
+        if failure_rate and random.random() < failure_rate:
+            return JSONResponse(status_code=503, content={"code": "unavailable", "message": "Simulated failure"})
+        if keep_messages:
+            stub.state.messages.append(body)
+        return JSONResponse(status_code=201, content={"messageId": f"<{uuid.uuid4()}@brevo-stub>"})
+
+    @stub.get("/v3/_stub/messages")
+    def list_messages():
+        return {"requests": stub.state.requests, "messages": stub.state.messages}
+
+    return stub
+
+
+app = create_stub_app(
+    latency=float(os.getenv("BREVO_STUB_LATENCY", "0")),
+    failure_rate=float(os.getenv("BREVO_STUB_FAILURE_RATE", "0")),
+    keep_messages=False,
+)
@@ -0,0 +1,85 @@
+# brevo_transport.py
+
+import asyncio
+import os
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configuration ---
+BREVO_API_KEY = os.getenv("BREVO_API_KEY")
+# Point this at brevo_stub.py (e.g. http://localhost:8025/v3) for tests and load benchmarks
+BREVO_API_URL = os.getenv("BREVO_API_URL", "https://api.brevo.com/v3")
+BREVO_TIMEOUT_SECONDS = float(os.getenv("BREVO_TIMEOUT_SECONDS", "10"))
+BREVO_CONNECT_TIMEOUT_SECONDS = float(os.getenv("BREVO_CONNECT_TIMEOUT_SECONDS", "3"))
+BREVO_MAX_CONNECTIONS = int(os.getenv("BREVO_MAX_CONNECTIONS", "10"))
+BREVO_MAX_CONCURRENCY = int(os.getenv("BREVO_MAX_CONCURRENCY", "8"))
+
+
+class BrevoError(Exception):
+    """Raised when the transactional email API rejects or fails a request."""
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class BrevoTransport:
+    """
+    Async client for Brevo's transactional email API.
+    One instance owns a keep-alive connection pool; share it across sends.
+    `max_concurrency` caps in-flight requests; every request has a timeout.
+    Pass `transport=httpx.ASGITransport(app=brevo_stub.app)` to talk to the local stand-in.
+    """
+
+    def __init__(
+        self,
+        api_key: str = BREVO_API_KEY,
+        base_url: str = BREVO_API_URL,
+        timeout: float = BREVO_TIMEOUT_SECONDS,
+        max_connections: int = BREVO_MAX_CONNECTIONS,
+        max_concurrency: int = BREVO_MAX_CONCURRENCY,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.api_key = api_key
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"api-key": api_key or "", "accept": "application/json"},
+            timeout=httpx.Timeout(timeout, connect=BREVO_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.stats = {"in_flight": 0, "sent": 0, "errors": 0}
+
+    async def _post(self, path: str, body: dict) -> dict:
+        if not self.api_key:
+            raise BrevoError("BREVO_API_KEY not found. Cannot send email.")
+        async with self._semaphore:
+            self.stats["in_flight"] += 1
+            try:
+                response = await self._client.post(path, json=body)
+            except httpx.HTTPError as e:
+                self.stats["errors"] += 1
+                raise BrevoError(f"{type(e).__name__}: {e}") from e
+            finally:
+                self.stats["in_flight"] -= 1
+
+        if response.status_code >= 400:
+            self.stats["errors"] += 1
+            raise BrevoError(f"Brevo returned {response.status_code}: {response.text[:200]}", status_code=response.status_code)
+        self.stats["sent"] += 1
+        return response.json() if response.content else {}
+
+    async def send(self, message: dict) -> dict:
+        """Sends one transactional email. `message` is the Brevo JSON body (sender, to, subject, htmlContent...)."""
+        return await self._post("/smtp/email", message)
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
@@ -0,0 +1,175 @@
+# compression.py
+
+import gzip
+import os
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError: # Optional: without it only gzip is offered
+    brotli = None
+
+# Negotiated response compression. Roster and student listings are hundreds of
+# KB of repetitive JSON and compress 10-20x; sending them compressed saves far
+# more time on the wire (and through the Next.js proxy) than it costs in CPU.
+# Brotli is preferred when the client accepts it and the package is installed,
+# gzip otherwise. Small bodies are sent as they are, and so are uploaded files
+# (/api/files/*, images, PDFs): they are already compressed, and file responses
+# must keep their Content-Length and Range support.
+#
+# Starlette's GZipMiddleware is gzip-only and would also re-compress photos, so
+# this is a small ASGI middleware of our own. Levels trade CPU for bytes; see
+# benchmarks/bench_compression.py.
+
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6")) # 1-9
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4")) # 0-11
+
+SKIP_PATH_PREFIXES = ("/api/files/", "/uploads/", "/bucket/")
+SKIP_MEDIA_TYPES = ("image/", "video/", "audio/", "application/pdf", "application/zip", "application/gzip", "font/woff")
+
+
+def choose_encoding(accept_encoding: str) -> str:
+    """Picks 'br', 'gzip' or None from an Accept-Encoding header (q=0 means refused)."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS) # gzip container
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+def compress(data: bytes, encoding: str, level: int = None) -> bytes:
+    """One-shot compression with the configured (or given) level."""
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY if level is None else level)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL if level is None else level)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES,
+                 gzip_level: int = GZIP_LEVEL, brotli_quality: int = BROTLI_QUALITY):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(SKIP_PATH_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressedResponse(self, encoding, send).run(scope, receive)
+
+
+class _CompressedResponse:
+    """Wraps `send` for one response: holds the start message until the first body chunk decides."""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def run(self, scope, receive):
+        await self.middleware.app(scope, receive, self.wrapped_send)
+
+    def _compressible(self, headers: Headers) -> bool:
+        status = self.start["status"]
+        if status < 200 or status in (204, 206, 304) or "content-encoding" in headers:
+            return False
+        media_type = headers.get("content-type", "").lower()
+        return not media_type.startswith(SKIP_MEDIA_TYPES)
+
+    def _new_encoder(self):
+        if self.encoding == "br":
+            return _BrotliEncoder(self.middleware.brotli_quality)
+        return _GzipEncoder(self.middleware.gzip_level)
+
+    async def wrapped_send(self, message):
+        if self.passthrough:
+            await self.send(message)
+            return
+        kind = message["type"]
+        if kind == "http.response.start":
+            self.start = message
+            if not self._compressible(Headers(raw=message["headers"])):
+                self.passthrough = True
+                await self.send(message)
+            return
+        if kind != "http.response.body":
+            # e.g. http.response.pathsend: send the file as it is
+            self.passthrough = True
+            await self.send(self.start)
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        headers = MutableHeaders(raw=self.start["headers"])
+        if self.encoder is None:
+            if not more_body and len(body) < self.middleware.minimum_size:
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+            self.encoder = self._new_encoder()
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if "etag" in headers and not headers["etag"].startswith("W/"):
+                # The compressed bytes differ from the identity ones
+                headers["ETag"] = "W/" + headers["etag"]
+            if more_body:
+                del headers["Content-Length"]
+                await self.send(self.start)
+            else:
+                compressed = self.encoder.compress(body) + self.encoder.finish()
+                headers["Content-Length"] = str(len(compressed))
+                await self.send(self.start)
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+
+        chunk = self.encoder.compress(body)
+        if not more_body:
+            chunk += self.encoder.finish()
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
@@ -0,0 +1,66 @@
+# course_registry.py
+
+import hashlib
+import json
+import os
+import threading
+import time
+from sqlalchemy.orm import Session
+import models
+import schemas
+
+# Courses change a handful of times a year but are looked up on every application.
+# The registry keeps them in memory, keyed by a normalized name, and is reloaded
+# whenever this process writes a course (crud.create_course) or after the TTL
+# expires, so course writes made by another worker are picked up as well.
+
+COURSE_REGISTRY_TTL = int(os.getenv("COURSE_REGISTRY_TTL", "300"))  # seconds
+
+
+def normalize_course_name(name: str) -> str:
+    """'  quran  READING (Nazra)' -> 'quran reading (nazra)'"""
+    return " ".join(name.split()).casefold()
+
+
+class CourseRegistry:
+    def __init__(self, ttl: int = COURSE_REGISTRY_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._courses = []
+        self._by_name = {}
+        self._loaded_at = None
+        self.etag = None
+
+    def load(self, db: Session):
+        """(Re)loads every course from the database in one query."""
+        courses = [schemas.Course.model_validate(c) for c in db.query(models.Course).order_by(models.Course.id).all()]
+        payload = json.dumps([c.model_dump(mode="json") for c in courses], sort_keys=True)
+        with self._lock:
+            self._courses = courses
+            self._by_name = {normalize_course_name(c.name): c for c in courses}
+            self.etag = '"' + hashlib.sha1(payload.encode("utf-8")).hexdigest() + '"'
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _ensure_loaded(self, db: Session):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            self.load(db)
+
+    def all(self, db: Session):
+        """Returns every course as a schemas.Course snapshot."""
+        self._ensure_loaded(db)
+        return list(self._courses)
+
+    def get_by_name(self, db: Session, name: str):
+        """Case/whitespace-insensitive lookup, e.g. 'quran reading (nazra)'."""
+        if not name:
+            return None
+        self._ensure_loaded(db)
+        return self._by_name.get(normalize_course_name(name))
+
+
+# Shared, process-wide registry
+registry = CourseRegistry()
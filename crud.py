@@ -1,9 +1,15 @@
 # crud.py
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import event, func, update, delete, insert, select, text, union
+from sqlalchemy.orm import Session, joinedload, selectinload, load_only, noload
+from sqlalchemy.exc import IntegrityError
 import models
 import schemas
-from datetime import datetime, date
+import course_registry
+from datetime import datetime, date, timedelta, timezone
+from typing import Optional
+import heapq
+import os
 import secrets, string
 
 # CRUD (Create, Read, Update, Delete) functions interact directly with the database.
@@ -18,6 +24,65 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifies a plain text password against a hashed password."""
     return pwd_context.verify(plain_password, hashed_password)
 
+# --- Resource Versions ---
+# Version counters behind the ETags of the list/stats endpoints. Every write
+# below marks the resources it changes before its commit; the counters are
+# incremented right after that commit, in a short transaction of their own, so
+# writers never hold the shared counter row while their own transaction runs.
+# (Bumping after the data is committed is the safe order: a reader can at worst
+# see new data under the old version and revalidate again, never cache old data
+# under the new version.) A rollback drops the marks. A view depending on
+# several resources combines their versions; see get_resource_versions.
+
+STUDENTS, TEACHERS, USERS, SCHEDULES, ATTENDANCE = "students", "teachers", "users", "schedules", "attendance"
+
+_PENDING_VERSIONS_KEY = "crud.pending_versions"
+
+def bump_versions(db: Session, *resources: str):
+    """Marks resources as changed; their versions are incremented once `db` commits the current transaction."""
+    if not db.in_transaction():
+        db.begin() # So a rollback or close before any query still drops the marks
+    db.info.setdefault(_PENDING_VERSIONS_KEY, set()).update(resources)
+
+def _increment_versions(bind, resources):
+    increment = lambda resource: (
+        update(models.ResourceVersion)
+        .where(models.ResourceVersion.resource == resource)
+        .values(version=models.ResourceVersion.version + 1)
+    )
+    with bind.begin() as conn:
+        missing = [r for r in sorted(resources) if not conn.execute(increment(r)).rowcount]
+    for resource in missing:
+        try:
+            with bind.begin() as conn:
+                conn.execute(insert(models.ResourceVersion).values(resource=resource, version=1))
+        except IntegrityError:
+            # Another writer created the counter first
+            with bind.begin() as conn:
+                conn.execute(increment(resource))
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_versions(session):
+    resources = session.info.pop(_PENDING_VERSIONS_KEY, None)
+    if resources:
+        _increment_versions(session.get_bind(), resources)
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_pending_versions(session, transaction):
+    # Runs after after_commit, so anything left here was rolled back or closed
+    if transaction.parent is None:
+        session.info.pop(_PENDING_VERSIONS_KEY, None)
+
+def get_resource_versions(db: Session, resources) -> dict:
+    """Current version of each resource (0 if never written), in one query."""
+    rows = db.execute(
+        select(models.ResourceVersion.resource, models.ResourceVersion.version)
+        .where(models.ResourceVersion.resource.in_(list(resources)))
+    ).all()
+    versions = dict.fromkeys(resources, 0)
+    versions.update(dict(rows))
+    return versions
+
 def update_password(db: Session, user_obj, new_password: str):
     """Updates the password for a given user or teacher object."""
     new_hashed_password = get_password_hash(new_password)
@@ -33,6 +98,7 @@ def create_user(db: Session, user: schemas.UserCreate, password: str):
         hashed_password=hashed_password
     )
     db.add(db_user)
+    bump_versions(db, USERS)
     db.commit()
     db.refresh(db_user)
     return db_user
@@ -46,6 +112,7 @@ def update_user(db: Session, user_id: int, user_update_data: dict):
     for key, value in user_update_data.items():
         setattr(db_user, key, value)
 
+    bump_versions(db, USERS)
     db.commit()
     db.refresh(db_user)
     return db_user
@@ -54,10 +121,13 @@ def update_user(db: Session, user_id: int, user_update_data: dict):
 def create_course(db: Session, course: schemas.CourseCreate):
     """Creates one of the 4 course types."""
     db_course = models.Course(**course.model_dump())
-    db.add(db_course); db.commit(); db.refresh(db_course); return db_course
+    db.add(db_course); db.commit(); db.refresh(db_course)
+    course_registry.registry.load(db) # Keep the in-memory registry in sync
+    return db_course
 
 def get_courses(db: Session):
-    return db.query(models.Course).all()
+    """Lists courses from the in-memory registry (no query once loaded)."""
+    return course_registry.registry.all(db)
 
 def get_course_by_name(db: Session, name: str):
     # Case insensitive search to match "Quran Reading" with "quran reading"
@@ -75,20 +145,44 @@ def create_application(db: Session, application: schemas.ApplicationCreate):
     # Logic: If the string entered in "preferred_course" matches a Course in our DB,
     # we link the ID. This "connects" the text to the system.
     if application.preferred_course:
-        course = get_course_by_name(db, application.preferred_course)
+        course = course_registry.registry.get_by_name(db, application.preferred_course)
         if course:
             app_data['course_id'] = course.id
             
     db_application = models.Application(**app_data)
-    db.add(db_application); db.commit(); db.refresh(db_application); return db_application
+    db.add(db_application); bump_versions(db, STUDENTS); db.commit(); db.refresh(db_application); return db_application
 
 def get_user_by_email(db: Session, email: str):
     """Queries the database for a user with a specific email address."""
     return db.query(models.User).filter(models.User.email == email).first()
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    """Retrieves all user records from the database with pagination."""
-    return db.query(models.User).offset(skip).limit(limit).all()
+# --- Sparse Fieldsets ---
+
+def sparse_options(model, fields):
+    """
+    Loader options for a `fields=` listing: only the requested columns are selected
+    (plus the primary key), requested relationships are loaded in bulk and the rest
+    are not loaded at all.
+    """
+    mapper = model.__mapper__
+    columns = [getattr(model, c.key) for c in mapper.column_attrs if c.key in fields or c.columns[0].primary_key]
+    options = [load_only(*columns)]
+    for rel in mapper.relationships:
+        attr = getattr(model, rel.key)
+        if rel.key not in fields:
+            options.append(noload(attr))
+        elif rel.uselist:
+            options.append(selectinload(attr))
+        else:
+            options.append(joinedload(attr))
+    return options
+
+def get_users(db: Session, skip: int = 0, limit: int = 100, fields: set = None):
+    """Retrieves all user records from the database with pagination (optionally only `fields`)."""
+    query = db.query(models.User)
+    if fields:
+        query = query.options(*sparse_options(models.User, fields))
+    return query.offset(skip).limit(limit).all()
 
 def get_user(db: Session, user_id: int):
     """Queries the database for a user with a specific ID."""
@@ -99,9 +193,81 @@ def delete_user(db: Session, user_id: int):
     db_user = db.query(models.User).filter(models.User.id == user_id).first()
     if db_user:
         db.delete(db_user)
+        bump_versions(db, USERS)
         db.commit()
     return db_user
 
+def count_file_references(db: Session, file_url: str) -> int:
+    """How many users/teachers rows point at an uploaded file (photos and CVs are content-addressed and shared)."""
+    counts = [
+        select(func.count()).select_from(model).where((model.profile_photo_url == file_url) | (model.cv_url == file_url)).scalar_subquery()
+        for model in (models.User, models.Teacher)
+    ]
+    return db.execute(select(counts[0] + counts[1])).scalar()
+
+def get_referenced_file_urls(db: Session, urls: list = None) -> set:
+    """
+    Every upload URL referenced by a users/teachers row, in one UNION projection query
+    (optionally only among `urls`). Used by the upload GC.
+    """
+    columns = [models.User.profile_photo_url, models.User.cv_url, models.Teacher.profile_photo_url, models.Teacher.cv_url]
+    selects = [select(column.label("url")).where(column.is_not(None)) for column in columns]
+    if urls is not None:
+        selects = [query.where(column.in_(urls)) for query, column in zip(selects, columns)]
+    return set(db.execute(union(*selects)).scalars())
+
+# --- Upload Manifest Functions ---
+
+def record_upload(db: Session, key: str, kind: str, size_bytes: int, digest: str, owner: str = None):
+    """
+    Adds a stored file to the manifest. A re-upload of the same content keeps the
+    first row and only marks it as referenced again (see gc_uploads).
+    """
+    entry = db.get(models.UploadManifest, key)
+    if entry is not None:
+        entry.reuploaded_at = datetime.now(timezone.utc)
+        db.commit()
+        return
+    db.add(models.UploadManifest(key=key, kind=kind, size_bytes=size_bytes, digest=digest, owner=owner))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback() # Stored concurrently by another request
+
+def get_reuploaded_keys(db: Session, since: datetime, keys: list = None) -> set:
+    """Manifest keys whose content was uploaded again after `since`, optionally restricted to `keys`."""
+    query = db.query(models.UploadManifest.key).filter(models.UploadManifest.reuploaded_at > since)
+    if keys is not None:
+        query = query.filter(models.UploadManifest.key.in_(keys))
+    return {key for (key,) in query}
+
+def delete_upload_record(db: Session, key: str):
+    delete_upload_records(db, [key])
+
+def delete_upload_records(db: Session, keys: list):
+    db.query(models.UploadManifest).filter(models.UploadManifest.key.in_(keys)).delete(synchronize_session=False)
+    db.commit()
+
+def get_upload_manifest(db: Session, kind: str = None, limit: int = 100):
+    query = db.query(models.UploadManifest)
+    if kind:
+        query = query.filter(models.UploadManifest.kind == kind)
+    return query.order_by(models.UploadManifest.created_at.desc()).limit(limit).all()
+
+def get_storage_stats(db: Session):
+    """File count and bytes per kind, with totals, from one GROUP BY over the manifest."""
+    rows = db.query(
+        models.UploadManifest.kind,
+        func.count(models.UploadManifest.key),
+        func.coalesce(func.sum(models.UploadManifest.size_bytes), 0),
+    ).group_by(models.UploadManifest.kind).all()
+    kinds = {kind: {"files": files, "bytes": size} for kind, files, size in rows}
+    return {
+        "files": sum(k["files"] for k in kinds.values()),
+        "bytes": sum(k["bytes"] for k in kinds.values()),
+        "by_kind": kinds,
+    }
+
 # --- Teacher CRUD Functions ---
 
 def get_teacher(db: Session, teacher_id: int):
@@ -112,9 +278,12 @@ def get_teacher_by_email(db: Session, email: str):
     """Queries for a single teacher by their email."""
     return db.query(models.Teacher).filter(models.Teacher.email == email).first()
 
-def get_teachers(db: Session, skip: int = 0, limit: int = 100):
-    """Retrieves all teacher records."""
-    return db.query(models.Teacher).offset(skip).limit(limit).all()
+def get_teachers(db: Session, skip: int = 0, limit: int = 100, fields: set = None):
+    """Retrieves all teacher records (optionally only `fields`)."""
+    query = db.query(models.Teacher)
+    if fields:
+        query = query.options(*sparse_options(models.Teacher, fields))
+    return query.offset(skip).limit(limit).all()
 
 def create_teacher(db: Session, teacher: schemas.TeacherCreate, password: str):
     """Creates a new teacher record in the database with a hashed password."""
@@ -124,15 +293,21 @@ def create_teacher(db: Session, teacher: schemas.TeacherCreate, password: str):
         hashed_password=hashed_password
     )
     db.add(db_teacher)
+    bump_versions(db, TEACHERS)
     db.commit()
     db.refresh(db_teacher)
     return db_teacher
 
 def delete_teacher(db: Session, teacher_id: int):
-    """Deletes a teacher from the database by their ID."""
+    """
+    Deletes a teacher from the database by their ID.
+    One DELETE statement: the database unassigns their students (ON DELETE SET NULL)
+    and removes their schedules and attendances (ON DELETE CASCADE).
+    """
     db_teacher = db.query(models.Teacher).filter(models.Teacher.id == teacher_id).first()
     if db_teacher:
-        db.delete(db_teacher)
+        db.execute(delete(models.Teacher).where(models.Teacher.id == teacher_id))
+        bump_versions(db, TEACHERS, STUDENTS, SCHEDULES, ATTENDANCE)
         db.commit()
     return db_teacher
 
@@ -145,6 +320,7 @@ def update_teacher(db: Session, teacher_id: int, teacher_update_data: dict):
     for key, value in teacher_update_data.items():
         setattr(db_teacher, key, value)
 
+    bump_versions(db, TEACHERS)
     db.commit()
     db.refresh(db_teacher)
     return db_teacher
@@ -156,52 +332,311 @@ def assign_teacher_and_shift(db: Session, student_id: int, teacher_id: int, shif
         db_student.teacher_id = teacher_id
         db_student.shift = shift
         db_student.status = "Approved"
+        bump_versions(db, STUDENTS)
         db.commit()
         db.refresh(db_student)
     return db_student
 
+def auto_assign_students(db: Session, capacity: int, gender: Optional[str] = None, shift: Optional[str] = None, dry_run: bool = True):
+    """
+    Matches unassigned 'Approved'/'Pending' applications to teachers.
+    A student is only matched with a teacher of the same gender and, if the
+    student picked a shift, the same shift. Each pick goes to the least-loaded
+    teacher (a min-heap per gender/shift bucket) until `capacity` is reached.
+    `gender` restricts the run to one gender, mirroring read_teachers for normal admins.
+    """
+    teacher_query = db.query(models.Teacher.id, models.Teacher.name, models.Teacher.gender, models.Teacher.shift)
+    student_query = db.query(
+        models.Application.id, models.Application.first_name, models.Application.last_name,
+        models.Application.gender, models.Application.shift, models.Application.status
+    ).filter(
+        models.Application.teacher_id == None,
+        models.Application.status.in_(["Approved", "Pending"])
+    )
+    if gender:
+        teacher_query = teacher_query.filter(models.Teacher.gender == gender)
+        student_query = student_query.filter(models.Application.gender == gender)
+    if shift:
+        teacher_query = teacher_query.filter(models.Teacher.shift == shift)
+        student_query = student_query.filter((models.Application.shift == shift) | (models.Application.shift == None))
+
+    teachers = {t.id: t for t in teacher_query.all()}
+
+    # Current load of every teacher in a single grouped query
+    loads = dict(
+        db.query(models.Application.teacher_id, func.count(models.Application.id))
+        .filter(models.Application.teacher_id.in_(list(teachers)))
+        .group_by(models.Application.teacher_id)
+        .all()
+    ) if teachers else {}
+
+    # One heap of (load, teacher_id) per (gender, shift) bucket
+    heaps = {}
+    for t in teachers.values():
+        load = loads.get(t.id, 0)
+        if load < capacity:
+            heaps.setdefault((t.gender, t.shift), []).append((load, t.id))
+    for bucket in heaps.values():
+        heapq.heapify(bucket)
+
+    assignments, unassigned = [], []
+    for s in student_query.order_by(models.Application.created_at, models.Application.id).all():
+        student_name = f"{s.first_name} {s.last_name}"
+        if s.shift:
+            candidates = [heaps.get((s.gender, s.shift))]
+        else:
+            # No preferred shift: any shift of the right gender will do
+            candidates = [h for (g, _), h in heaps.items() if g == s.gender]
+        candidates = [h for h in candidates if h]
+        if not candidates:
+            unassigned.append({"student_id": s.id, "student_name": student_name, "reason": "No teacher with free capacity for this gender/shift."})
+            continue
+
+        bucket = min(candidates, key=lambda h: h[0])
+        load, teacher_id = heapq.heappop(bucket)
+        if load + 1 < capacity:
+            heapq.heappush(bucket, (load + 1, teacher_id))
+
+        teacher = teachers[teacher_id]
+        assignments.append({
+            "student_id": s.id,
+            "student_name": student_name,
+            "teacher_id": teacher_id,
+            "teacher_name": teacher.name,
+            "shift": teacher.shift,
+            "previous_status": s.status,
+        })
+
+    if not dry_run and assignments:
+        # ORM bulk UPDATE by primary key, committed as one transaction
+        db.execute(update(models.Application), [
+            {"id": a["student_id"], "teacher_id": a["teacher_id"], "shift": a["shift"], "status": "Approved"}
+            for a in assignments
+        ])
+        bump_versions(db, STUDENTS)
+        db.commit()
+
+    return {"dry_run": dry_run, "capacity": capacity, "assignments": assignments, "unassigned": unassigned}
+
 def get_application_by_id(db: Session, application_id: int):
     """Queries for a single application by its ID."""
     return db.query(models.Application).filter(models.Application.id == application_id).first()
 
-def get_applications(db, skip=0, limit=100): 
+def get_applications(db, skip=0, limit=100, fields: set = None):
+    if fields:
+        # Sparse listing: only the requested columns and relationships
+        return db.query(models.Application).options(
+            *sparse_options(models.Application, fields)
+        ).offset(skip).limit(limit).all()
     # Eager load the course so frontend can see the official course details
     return db.query(models.Application).options(
         joinedload(models.Application.teacher), joinedload(models.Application.course)
     ).offset(skip).limit(limit).all()
 
 def delete_application(db: Session, student_id: int):
-    """Deletes a student application by ID."""
+    """Deletes a student application by ID. Attendances and schedules go with it via ON DELETE CASCADE."""
     db_student = db.query(models.Application).filter(models.Application.id == student_id).first()
     if db_student:
-        db.delete(db_student)
-        db.commit()
+        delete_applications(db, [student_id])
     return db_student
 
-def get_teachers_by_gender(db: Session, gender: str, skip: int = 0, limit: int = 100):
-    """Retrieves all teacher records of a specific gender."""
-    return db.query(models.Teacher).filter(models.Teacher.gender == gender).offset(skip).limit(limit).all()
+# --- Bulk Student Operations ---
+
+STUDENT_STATUSES = ["Pending", "Approved", "Finished"]
+
+def get_existing_application_ids(db: Session, ids: list):
+    """Returns the subset of `ids` that exist, using a single id-only query."""
+    if not ids:
+        return set()
+    return {row.id for row in db.query(models.Application.id).filter(models.Application.id.in_(ids))}
+
+def bulk_assign_teacher_and_shift(db: Session, student_ids: list, teacher_id: int, shift: str):
+    """Bulk version of assign_teacher_and_shift: one UPDATE ... WHERE id IN (...)."""
+    result = db.execute(
+        update(models.Application)
+        .where(models.Application.id.in_(student_ids))
+        .values(teacher_id=teacher_id, shift=shift, status="Approved")
+        .execution_options(synchronize_session=False)
+    )
+    bump_versions(db, STUDENTS)
+    db.commit()
+    return result.rowcount
+
+def bulk_update_status(db: Session, student_ids: list, status: str):
+    """Sets the same status on many students with one UPDATE statement."""
+    result = db.execute(
+        update(models.Application)
+        .where(models.Application.id.in_(student_ids))
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+    bump_versions(db, STUDENTS)
+    db.commit()
+    return result.rowcount
+
+def delete_applications(db: Session, student_ids: list):
+    """
+    Bulk delete for students: a single DELETE ... WHERE id IN (...).
+    Attendances and schedules are removed by the database (ON DELETE CASCADE),
+    so a student with years of attendance is still one statement.
+    Use archive_applications to keep their history instead.
+    """
+    result = db.execute(delete(models.Application).where(models.Application.id.in_(student_ids)))
+    bump_versions(db, STUDENTS, SCHEDULES, ATTENDANCE)
+    db.commit()
+    return result.rowcount
+
+ARCHIVED_STATUS = "Archived"
+
+def archive_applications(db: Session, student_ids: list):
+    """
+    Bulk archival for students who leave but whose history is kept: their
+    schedules are removed and the applications are unassigned and marked
+    'Archived', one statement each. Attendance rows stay where they are, so
+    years of history cost nothing here. Returns the number of students archived.
+    """
+    db.execute(delete(models.Schedule).where(models.Schedule.student_id.in_(student_ids)))
+    result = db.execute(
+        update(models.Application)
+        .where(models.Application.id.in_(student_ids))
+        .values(status=ARCHIVED_STATUS, teacher_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    bump_versions(db, STUDENTS, SCHEDULES)
+    db.commit()
+    return result.rowcount
+
+def get_announcement_recipients(db: Session, course_id: int = None, shift: str = None, teacher_id: int = None, status: str = None, gender: str = None):
+    """
+    Selects the students an announcement goes to, with the names it can mention,
+    in one query (courses and teachers are outer-joined, not lazy-loaded per row).
+    """
+    query = db.query(
+        models.Application.email,
+        models.Application.first_name,
+        models.Application.last_name,
+        models.Application.shift,
+        models.Course.name.label("course"),
+        models.Teacher.name.label("teacher"),
+    ).outerjoin(models.Course, models.Application.course_id == models.Course.id
+    ).outerjoin(models.Teacher, models.Application.teacher_id == models.Teacher.id
+    ).filter(models.Application.email.isnot(None))
+
+    if course_id is not None:
+        query = query.filter(models.Application.course_id == course_id)
+    if shift:
+        query = query.filter(models.Application.shift == shift)
+    if teacher_id is not None:
+        query = query.filter(models.Application.teacher_id == teacher_id)
+    if status:
+        query = query.filter(models.Application.status == status)
+    if gender:
+        query = query.filter(models.Application.gender == gender)
+    return query.order_by(models.Application.id).all()
+
+def get_teachers_by_gender(db: Session, gender: str, skip: int = 0, limit: int = 100, fields: set = None):
+    """Retrieves all teacher records of a specific gender (optionally only `fields`)."""
+    query = db.query(models.Teacher).filter(models.Teacher.gender == gender)
+    if fields:
+        query = query.options(*sparse_options(models.Teacher, fields))
+    return query.offset(skip).limit(limit).all()
 
 # --- Attendance CRUD Functions ---
 
+# --- Attendance Hot/Cold Storage ---
+# Recent attendance lives in 'attendances' (hot). archive_attendance() moves rows
+# older than ATTENDANCE_HOT_DAYS into 'attendances_archive' (cold). Read paths
+# below only query the cold table when the requested dates reach archived data.
+
+ATTENDANCE_HOT_DAYS = int(os.getenv("ATTENDANCE_HOT_DAYS", "365"))
+
+def get_archive_watermark(db: Session):
+    """
+    Returns the newest class_date in cold storage, or None if nothing is archived.
+    Answered from the end of ix_attendances_archive_class_date, not a table scan.
+    """
+    return db.query(func.max(models.AttendanceArchive.class_date)).scalar()
+
+def attendance_tables_for(db: Session, start_date: date):
+    """Returns the attendance models a query starting at `start_date` has to read."""
+    watermark = get_archive_watermark(db)
+    if watermark is not None and start_date <= watermark:
+        return [models.Attendance, models.AttendanceArchive]
+    return [models.Attendance]
+
+def _ensure_archive_partitions(db: Session, first: date, last: date):
+    """Creates the monthly Postgres partitions of attendances_archive covering [first, last]."""
+    db.execute(text("CREATE TABLE IF NOT EXISTS attendances_archive_default PARTITION OF attendances_archive DEFAULT"))
+    month = first.replace(day=1)
+    while month <= last:
+        next_month = (month + timedelta(days=32)).replace(day=1)
+        db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS attendances_archive_y{month.year}m{month.month:02d} "
+            f"PARTITION OF attendances_archive FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')"
+        ))
+        month = next_month
+
+def archive_attendance(db: Session, before: date, batch_size: int = 5000):
+    """
+    Moves attendance with class_date < `before` into cold storage.
+    Each batch is copied (INSERT ... SELECT) and deleted in one transaction.
+    Returns the number of rows moved.
+    """
+    hot = models.Attendance.__table__
+    columns = [c.name for c in hot.columns]
+
+    if db.bind.dialect.name == "postgresql":
+        oldest = db.query(func.min(models.Attendance.class_date)).filter(models.Attendance.class_date < before).scalar()
+        if oldest:
+            _ensure_archive_partitions(db, oldest, before - timedelta(days=1))
+            db.commit()
+
+    moved = 0
+    while True:
+        ids = [row.id for row in db.query(models.Attendance.id).filter(
+            models.Attendance.class_date < before
+        ).order_by(models.Attendance.id).limit(batch_size)]
+        if not ids:
+            break
+        db.execute(insert(models.AttendanceArchive.__table__).from_select(
+            columns, select(*[hot.c[name] for name in columns]).where(hot.c.id.in_(ids))
+        ))
+        db.execute(delete(models.Attendance).where(models.Attendance.id.in_(ids)).execution_options(synchronize_session=False))
+        bump_versions(db, ATTENDANCE)
+        db.commit()
+        moved += len(ids)
+    return moved
+
+def get_archived_attendance(db: Session, attendance_id: int):
+    """An attendance record in cold storage, by its original id."""
+    return db.query(models.AttendanceArchive).filter(models.AttendanceArchive.id == attendance_id).first()
+
 def get_attendance_for_teacher_by_date(db: Session, teacher_id: int, class_date: date):
     """Retrieves all attendance records for a specific teacher on a specific date."""
-    return db.query(models.Attendance).filter(
-        models.Attendance.teacher_id == teacher_id,
-        models.Attendance.class_date == class_date
-    ).all()
+    records = []
+    for model in attendance_tables_for(db, class_date):
+        records += db.query(model).filter(
+            model.teacher_id == teacher_id,
+            model.class_date == class_date
+        ).all()
+    return records
 
 def get_attendance_record(db: Session, student_id: int, class_date: date):
     """Checks if an attendance record already exists for a student on a specific date."""
-    return db.query(models.Attendance).filter(
-        models.Attendance.student_id == student_id,
-        models.Attendance.class_date == class_date
-    ).first()
+    for model in attendance_tables_for(db, class_date):
+        record = db.query(model).filter(
+            model.student_id == student_id,
+            model.class_date == class_date
+        ).first()
+        if record:
+            return record
+    return None
 
 def create_attendance_record(db: Session, attendance: schemas.AttendanceCreate):
     """Creates a new attendance record."""
     db_attendance = models.Attendance(**attendance.model_dump())
     db.add(db_attendance)
+    bump_versions(db, ATTENDANCE)
     db.commit()
     db.refresh(db_attendance)
     return db_attendance
@@ -233,6 +668,7 @@ def create_schedule(db: Session, schedule: schemas.ScheduleCreate):
     """Creates a new schedule record in the database."""
     db_schedule = models.Schedule(**schedule.model_dump())
     db.add(db_schedule)
+    bump_versions(db, SCHEDULES)
     db.commit()
     db.refresh(db_schedule)
     return db_schedule
@@ -249,6 +685,7 @@ def update_schedule(db: Session, schedule_id: int, schedule_update: schemas.Sche
     for key, value in update_data.items():
         setattr(db_schedule, key, value)
         
+    bump_versions(db, SCHEDULES)
     db.commit(); db.refresh(db_schedule)
     return db_schedule
 
@@ -257,6 +694,7 @@ def delete_schedule(db: Session, schedule_id: int):
     db_schedule = db.query(models.Schedule).filter(models.Schedule.id == schedule_id).first()
     if db_schedule:
         db.delete(db_schedule)
+        bump_versions(db, SCHEDULES, ATTENDANCE)
         db.commit()
     return db_schedule
 
@@ -273,16 +711,35 @@ def create_session_attendance(db: Session, schedule_id: int, class_date: date, t
         teacher_id=teacher_id
     )
     db.add(db_attendance)
+    bump_versions(db, ATTENDANCE)
     db.commit()
     db.refresh(db_attendance)
     return db_attendance
 
 def get_session_attendance_by_schedule_and_date(db: Session, schedule_id: int, class_date: date):
     """Gets session attendance for a specific schedule on a specific date."""
-    return db.query(models.Attendance).filter(
-        models.Attendance.schedule_id == schedule_id,
-        models.Attendance.class_date == class_date
-    ).first()
+    for model in attendance_tables_for(db, class_date):
+        record = db.query(model).filter(
+            model.schedule_id == schedule_id,
+            model.class_date == class_date
+        ).first()
+        if record:
+            return record
+    return None
+
+def get_session_attendance_for_teacher(db: Session, teacher_id: int, start_date: date, end_date: date):
+    """Gets session attendance of a teacher's schedules within a date range."""
+    records = []
+    for model in attendance_tables_for(db, start_date):
+        records += db.query(model).join(
+            models.Schedule, model.schedule_id == models.Schedule.id
+        ).filter(
+            models.Schedule.teacher_id == teacher_id,
+            model.class_date >= start_date,
+            model.class_date <= end_date,
+            model.schedule_id != None
+        ).all()
+    return records
 
 def update_attendance(db: Session, attendance_id: int, teacher_status: str = None, student_status: str = None):
     """
@@ -297,6 +754,7 @@ def update_attendance(db: Session, attendance_id: int, teacher_status: str = Non
     if student_status is not None:
         db_attendance.status = student_status
         
+    bump_versions(db, ATTENDANCE)
     db.commit()
     db.refresh(db_attendance)
     return db_attendance
@@ -314,13 +772,15 @@ def get_attendance_count_by_month(db: Session, teacher_id: int, year: int, month
     last = dt(year, month, calendar.monthrange(year, month)[1]).date()
     
     # Fetch attendance, joined with Student and their Course
-    records = db.query(models.Attendance).join(models.Application).outerjoin(models.Course).filter(
-        models.Attendance.teacher_id==teacher_id, 
-        models.Attendance.class_date>=first, 
-        models.Attendance.class_date<=last
-    ).options(
-        joinedload(models.Attendance.student).joinedload(models.Application.course)
-    ).all()
+    records = []
+    for model in attendance_tables_for(db, first):
+        records += db.query(model).join(models.Application).outerjoin(models.Course).filter(
+            model.teacher_id==teacher_id, 
+            model.class_date>=first, 
+            model.class_date<=last
+        ).options(
+            joinedload(model.student).joinedload(models.Application.course)
+        ).all()
     
     course_counts = {}
     student_counts = {}
@@ -1,9 +1,11 @@
 # database.py
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+import sqlite3
 from dotenv import load_dotenv
 
 # Load environment variables from a .env file
@@ -36,6 +38,16 @@ else:
     engine = create_engine(SQLALCHEMY_DATABASE_URL)
     print(f"--- DATA SOURCE: Using PostgreSQL ({DB_HOST}) ---")
 
+# --- SQLite Foreign Keys ---
+# SQLite ignores FOREIGN KEY clauses (including ON DELETE CASCADE) unless
+# this pragma is set on every new connection. Postgres always enforces them.
+@event.listens_for(Engine, "connect")
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
 # --- Database Session ---
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -0,0 +1,193 @@
+# email_outbox.py
+
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import models
+
+# Request handlers never talk to Brevo directly. They call enqueue(), which
+# only inserts an 'email_outbox' row; email_worker.py sends it later.
+
+MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "6"))
+RETRY_BASE_SECONDS = int(os.getenv("EMAIL_RETRY_BASE_SECONDS", "30"))
+RETRY_MAX_SECONDS = int(os.getenv("EMAIL_RETRY_MAX_SECONDS", "3600"))
+# A claimed row that is not finished within the lease (e.g. the worker crashed) is retried
+CLAIM_LEASE_SECONDS = int(os.getenv("EMAIL_CLAIM_LEASE_SECONDS", "300"))
+
+# 'digest' buffers new applications and sends the admin one summary email;
+# 'immediate' keeps one admin email per application.
+ADMIN_NOTIFICATION_MODE = os.getenv("ADMIN_NOTIFICATION_MODE", "digest").lower()
+ADMIN_DIGEST_INTERVAL_SECONDS = int(os.getenv("ADMIN_DIGEST_INTERVAL_SECONDS", "900"))
+ADMIN_DIGEST_MAX_ITEMS = int(os.getenv("ADMIN_DIGEST_MAX_ITEMS", "50"))
+
+# How long an idempotency key blocks the same email (see dispatch_key)
+EMAIL_IDEMPOTENCY_TTL_SECONDS = int(os.getenv("EMAIL_IDEMPOTENCY_TTL_SECONDS", "86400"))
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def dispatch_key(kind: str, recipient: str, entity_id, version=None) -> str:
+    """
+    Idempotency key for one email: sha256 of (kind, recipient, entity id, version).
+    `version` distinguishes legitimate re-sends, e.g. a new temporary password;
+    only its hash is stored.
+    """
+    raw = json.dumps([kind, (recipient or "").strip().lower(), str(entity_id), version], default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _claim_dispatch_key(db: Session, key: str, kind: str) -> bool:
+    """Stores `key`; returns False (and counts a duplicate) if a live key already exists."""
+    now = _now()
+    db.query(models.EmailDispatchKey).filter(
+        models.EmailDispatchKey.key == key,
+        models.EmailDispatchKey.expires_at <= now,
+    ).delete(synchronize_session=False)
+    try:
+        # Savepoint: a duplicate undoes only this insert, not the caller's pending work
+        with db.begin_nested():
+            db.add(models.EmailDispatchKey(
+                key=key, kind=kind, duplicates=0, created_at=now,
+                expires_at=now + timedelta(seconds=EMAIL_IDEMPOTENCY_TTL_SECONDS),
+            ))
+        return True
+    except IntegrityError:
+        db.query(models.EmailDispatchKey).filter(models.EmailDispatchKey.key == key).update(
+            {models.EmailDispatchKey.duplicates: models.EmailDispatchKey.duplicates + 1},
+            synchronize_session=False,
+        )
+        db.commit()
+        return False
+
+
+def enqueue(db: Session, kind: str, recipient: str = None, entity_id=None, version=None, **kwargs):
+    """
+    Queues an email. `kind` is the email_sender function to call and
+    `kwargs` its (JSON-serializable) keyword arguments.
+    With `entity_id` (and optionally `version`), a repeat of the same email
+    within EMAIL_IDEMPOTENCY_TTL_SECONDS is dropped and None is returned.
+    """
+    if entity_id is not None and not _claim_dispatch_key(db, dispatch_key(kind, recipient, entity_id, version), kind):
+        print(f"--- EMAIL OUTBOX: Suppressed duplicate '{kind}' for {recipient} ---")
+        return None
+
+    row = models.EmailOutbox(
+        kind=kind,
+        recipient=recipient,
+        payload=json.dumps(kwargs, default=str),
+        status="pending",
+        attempts=0,
+        next_attempt_at=_now(),
+    )
+    db.add(row)
+    # The key and the outbox row are committed together
+    db.commit()
+    db.refresh(row)
+    return row
+
+
+def purge_expired_dispatch_keys(db: Session) -> int:
+    """Deletes idempotency keys past their TTL. Run periodically by the email worker."""
+    deleted = db.query(models.EmailDispatchKey).filter(
+        models.EmailDispatchKey.expires_at <= _now()
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def notify_admin_of_application(db: Session, application_data: dict, recipient: str):
+    """Queues the admin notification for a new application, per ADMIN_NOTIFICATION_MODE."""
+    if ADMIN_NOTIFICATION_MODE != "digest":
+        return enqueue(db, "send_admin_notification", recipient=recipient, entity_id=application_data.get("id"), application_data=application_data)
+
+    db.add(models.AdminDigestItem(payload=json.dumps(application_data, default=str), created_at=_now()))
+    db.commit()
+    # A burst of submissions is sent as soon as it fills a digest instead of waiting for the interval
+    if db.query(func.count(models.AdminDigestItem.id)).scalar() >= ADMIN_DIGEST_MAX_ITEMS:
+        return flush_admin_digest(db, recipient, force=True)
+    return None
+
+
+def flush_admin_digest(db: Session, recipient: str, force: bool = False):
+    """
+    Turns buffered applications into one 'send_admin_digest' outbox row.
+    Without `force`, it waits until the oldest item is ADMIN_DIGEST_INTERVAL_SECONDS old
+    or ADMIN_DIGEST_MAX_ITEMS are buffered. Returns the outbox row, or None.
+    """
+    items = db.query(models.AdminDigestItem).order_by(models.AdminDigestItem.id).limit(ADMIN_DIGEST_MAX_ITEMS).with_for_update(skip_locked=True).all()
+    if not items:
+        db.rollback()
+        return None
+
+    oldest = items[0].created_at
+    if oldest.tzinfo is None: # SQLite returns naive datetimes
+        oldest = oldest.replace(tzinfo=timezone.utc)
+    due = force or len(items) >= ADMIN_DIGEST_MAX_ITEMS or oldest <= _now() - timedelta(seconds=ADMIN_DIGEST_INTERVAL_SECONDS)
+    if not due:
+        db.rollback()
+        return None
+
+    applications = [json.loads(item.payload) for item in items]
+    db.query(models.AdminDigestItem).filter(models.AdminDigestItem.id.in_([item.id for item in items])).delete(synchronize_session=False)
+    # enqueue() commits, so the buffered items and the digest email are swapped atomically
+    return enqueue(db, "send_admin_digest", recipient=recipient, applications=applications)
+
+
+def claim_batch(db: Session, limit: int = 50):
+    """
+    Claims up to `limit` due emails for this worker.
+    FOR UPDATE SKIP LOCKED lets several workers poll the same table without
+    double-sending (SQLite ignores it; run a single worker there).
+    """
+    now = _now()
+    rows = db.query(models.EmailOutbox).filter(
+        models.EmailOutbox.status.in_(["pending", "sending"]),
+        models.EmailOutbox.next_attempt_at <= now,
+    ).order_by(models.EmailOutbox.id).limit(limit).with_for_update(skip_locked=True).all()
+
+    for row in rows:
+        row.status = "sending"
+        row.attempts += 1
+        row.next_attempt_at = now + timedelta(seconds=CLAIM_LEASE_SECONDS)
+    ids = [row.id for row in rows]
+    db.commit()
+    # Reload the claimed rows in one query instead of one refresh per row
+    return db.query(models.EmailOutbox).filter(models.EmailOutbox.id.in_(ids)).order_by(models.EmailOutbox.id).all() if ids else []
+
+
+def retry_delay(attempts: int) -> int:
+    """Exponential backoff: 30s, 60s, 120s, ... capped at RETRY_MAX_SECONDS."""
+    return min(RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)), RETRY_MAX_SECONDS)
+
+
+def mark_sent(db: Session, row: models.EmailOutbox):
+    row.status = "sent"
+    row.sent_at = _now()
+    row.last_error = None
+    row.payload = None # Drop temporary passwords and personal data once delivered
+
+
+def mark_failed(db: Session, row: models.EmailOutbox, error: str):
+    """Schedules a retry with backoff, or gives up after MAX_ATTEMPTS."""
+    row.last_error = (error or "Unknown error")[:500]
+    if row.attempts >= MAX_ATTEMPTS:
+        row.status = "failed"
+    else:
+        row.status = "pending"
+        row.next_attempt_at = _now() + timedelta(seconds=retry_delay(row.attempts))
+
+
+def get_stats(db: Session):
+    """
+    Returns {status: count} for the outbox, plus 'suppressed_duplicates':
+    emails dropped by their idempotency key (over the keys' TTL window).
+    """
+    stats = dict(db.query(models.EmailOutbox.status, func.count(models.EmailOutbox.id)).group_by(models.EmailOutbox.status).all())
+    stats["suppressed_duplicates"] = db.query(func.coalesce(func.sum(models.EmailDispatchKey.duplicates), 0)).scalar()
+    return stats
@@ -1,16 +1,13 @@
 # email.py
 
 import os
-import sib_api_v3_sdk
-from sib_api_v3_sdk.rest import ApiException
 from dotenv import load_dotenv
+import email_templates
 
 # Load environment variables from the .env file
 load_dotenv()
 
 # --- Configuration ---
-# Get the API Key from the environment variable for Brevo
-BREVO_API_KEY = os.getenv("BREVO_API_KEY")
 # This is the verified email address you created in Brevo
 FROM_EMAIL = 'almursalaatonline@gmail.com' 
 # This is the name associated with your sender email
@@ -18,211 +15,105 @@ FROM_NAME = 'Al-Mursalaat'
 # The email address where you want to receive admin notifications
 ADMIN_EMAIL = 'almursalaatonline@gmail.com'
 
-# --- Brevo API Client Setup ---
-# This setup is done once and reused by the functions below
-configuration = sib_api_v3_sdk.Configuration()
-configuration.api_key['api-key'] = BREVO_API_KEY
-api_instance = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
+# The functions below only *compose* emails as Brevo JSON bodies.
+# Delivery happens in email_worker.py through brevo_transport.BrevoTransport.
+# The bodies are Jinja templates in templates/email/ (see email_templates.py).
 
 
-def send_student_confirmation(application_data: dict):
-    """Sends a confirmation email to the student using Brevo."""
-    if not BREVO_API_KEY:
-        print("ERROR: BREVO_API_KEY not found. Cannot send email.")
-        return
+def _message(to: list, subject: str, template: str, **context) -> dict:
+    """Renders `template` and builds the JSON body for Brevo's POST /smtp/email."""
+    html_content, text_content = email_templates.render(template, **context)
+    return {
+        "sender": {"name": FROM_NAME, "email": FROM_EMAIL},
+        "to": to,
+        "subject": subject,
+        "htmlContent": html_content,
+        "textContent": text_content,
+    }
 
+
+def compose_student_confirmation(application_data: dict):
+    """Composes a confirmation email to the student."""
     student_email = application_data.get('email')
     student_name = application_data.get('first_name', 'student')
-    
+
     subject = 'Your Application to Al-Mursalaat has been received!'
-    html_content = f"""
-    <h3>Assalamu Alaikum, {student_name}!</h3>
-    <p>Thank you for your application to Al-Mursalaat.</p>
-    <p>We have successfully received your details and will be in touch with you shortly regarding the next steps.</p>
-    <p><strong>Course Applied For:</strong> {application_data.get('preferred_course')}</p>
-    <p>If you have any questions, please feel free to reply to this email.</p>
-    <br>
-    <p>Sincerely,</p>
-    <p>The Al-Mursalaat Team</p>
-    """
-
-    # Create the email object for Brevo
-    sender = {"name": FROM_NAME, "email": FROM_EMAIL}
     to = [{"email": student_email, "name": student_name}]
-    
-    send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(to=to, sender=sender, subject=subject, html_content=html_content)
-
-    try:
-        # Send the email
-        api_response = api_instance.send_transac_email(send_smtp_email)
-        print(f"Student confirmation email sent to {student_email}. Response: {api_response}")
-    except ApiException as e:
-        print(f"Error sending student confirmation email: {e}")
+    return _message(to, subject, "student_confirmation",
+                    student_name=student_name, preferred_course=application_data.get('preferred_course'))
 
 
-def send_admin_notification(application_data: dict):
-    """Sends a notification email to the admin with the new application details using Brevo."""
-    if not BREVO_API_KEY:
-        print("ERROR: BREVO_API_KEY not found. Cannot send email.")
-        return
-
-    # Create a formatted string or HTML table of the application data
-    details = ""
-    for key, value in application_data.items():
-        if not key.startswith('_'):
-            details += f"<strong>{key.replace('_', ' ').title()}:</strong> {value}<br>"
+def compose_admin_notification(application_data: dict):
+    """Composes a notification email to the admin with the new application details."""
+    fields = [(key, value) for key, value in application_data.items() if not key.startswith('_')]
 
     subject = f"New Application from {application_data.get('first_name')} {application_data.get('last_name')}"
-    html_content = f"""
-    <h3>New Student Application Received</h3>
-    <p>A new application has been submitted through the website.</p>
-    <hr>
-    {details}
-    """
-
-    sender = {"name": FROM_NAME, "email": FROM_EMAIL}
     to = [{"email": ADMIN_EMAIL, "name": "Al-Mursalaat Admin"}]
-    
-    send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(to=to, sender=sender, subject=subject, html_content=html_content)
+    return _message(to, subject, "admin_notification", fields=fields)
 
-    try:
-        api_response = api_instance.send_transac_email(send_smtp_email)
-        print(f"Admin notification sent to {ADMIN_EMAIL}. Response: {api_response}")
-    except ApiException as e:
-        print(f"Error sending admin notification email: {e}")
 
+def compose_admin_digest(applications: list):
+    """Composes one summary email to the admin covering several new applications."""
+    subject = f"{len(applications)} New Application{'s' if len(applications) != 1 else ''} - Al-Mursalaat"
+    to = [{"email": ADMIN_EMAIL, "name": "Al-Mursalaat Admin"}]
+    return _message(to, subject, "admin_digest", applications=applications)
 
-def send_admin_credentials_email(admin_data: dict, temp_password: str):
-    """Sends a welcome email to a new admin with their temporary password using Brevo."""
-    if not BREVO_API_KEY:
-        print("ERROR: BREVO_API_KEY not found. Cannot send email.")
-        return
 
+def compose_admin_credentials_email(admin_data: dict, temp_password: str):
+    """Composes a welcome email to a new admin with their temporary password."""
     admin_email = admin_data.get('email')
     admin_name = admin_data.get('name', 'Admin')
 
     subject = 'Your New Admin Account for Al-Mursalaat'
-    html_content = f"""
-    <h3>Welcome to the Al-Mursalaat Admin Team, {admin_name}!</h3>
-    <p>An account has been created for you. You can log in to the admin panel using the following credentials:</p>
-    <ul>
-        <li><strong>Username:</strong> {admin_email}</li>
-        <li><strong>Temporary Password:</strong> {temp_password}</li>
-    </ul>
-    <p>It is strongly recommended that you change your password after your first login.</p>
-    <br>
-    <p>Sincerely,</p>
-    <p>The Al-Mursalaat Team</p>
-    """
-
-    sender = {"name": FROM_NAME, "email": FROM_EMAIL}
     to = [{"email": admin_email, "name": admin_name}]
-    
-    send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(to=to, sender=sender, subject=subject, html_content=html_content)
+    return _message(to, subject, "admin_credentials",
+                    admin_name=admin_name, admin_email=admin_email, temp_password=temp_password)
 
-    try:
-        api_response = api_instance.send_transac_email(send_smtp_email)
-        print(f"Admin credentials email sent to {admin_email}. Response: {api_response}")
-    except ApiException as e:
-        print(f"Error sending admin credentials email: {e}")
-
-
-def send_teacher_credentials_email(teacher_data: dict, temp_password: str):
-    """Sends a welcome email to a new teacher with their temporary password using Brevo."""
-    if not BREVO_API_KEY:
-        print("ERROR: BREVO_API_KEY not found. Cannot send email.")
-        return
 
+def compose_teacher_credentials_email(teacher_data: dict, temp_password: str):
+    """Composes a welcome email to a new teacher with their temporary password."""
     teacher_email = teacher_data.get('email')
     teacher_name = teacher_data.get('name', 'Teacher')
 
     subject = 'Your New Teacher Account for Al-Mursalaat'
-    html_content = f"""
-    <h3>Assalamu Alaikum, {teacher_name}!</h3>
-    <p>Welcome to the Al-Mursalaat teaching team. An account has been created for your portal.</p>
-    <p>Your login credentials are:</p>
-    <ul>
-        <li><strong>Username:</strong> {teacher_email}</li>
-        <li><strong>Temporary Password:</strong> {temp_password}</li>
-    </ul>
-    <p>Please keep these safe. You will be able to access your teacher dashboard soon.</p>
-    <br>
-    <p>Sincerely,</p>
-    <p>The Al-Mursalaat Team</p>
-    """
-    
-    sender = {"name": FROM_NAME, "email": FROM_EMAIL}
     to = [{"email": teacher_email, "name": teacher_name}]
-    
-    send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(to=to, sender=sender, subject=subject, html_content=html_content)
+    return _message(to, subject, "teacher_credentials",
+                    teacher_name=teacher_name, teacher_email=teacher_email, temp_password=temp_password)
 
-    try:
-        api_response = api_instance.send_transac_email(send_smtp_email)
-        print(f"Teacher credentials email sent to {teacher_email}. Response: {api_response}")
-    except ApiException as e:
-        print(f"Error sending teacher credentials email: {e}")
-
-def send_forgot_password_email(email: str, temp_password: str):
-    """Sends a temporary password to a user who forgot theirs."""
-    if not BREVO_API_KEY:
-        print("ERROR: BREVO_API_KEY not found.")
-        return
 
+def compose_forgot_password_email(email: str, temp_password: str):
+    """Composes a temporary password email for a user who forgot theirs."""
     subject = 'Password Reset - Al-Mursalaat'
-    html_content = f"""
-    <h3>Password Reset Request</h3>
-    <p>We received a request to reset your password for Al-Mursalaat.</p>
-    <p>Your new <strong>Temporary Password</strong> is: <span style="font-size: 18px; color: #2d89ef;">{temp_password}</span></p>
-    <p>Please log in and change this password immediately in your profile settings.</p>
-    <br>
-    <p>If you did not request this, please contact support.</p>
-    """
-
-    sender = {"name": FROM_NAME, "email": FROM_EMAIL}
     to = [{"email": email}]
-    
-    send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(to=to, sender=sender, subject=subject, html_content=html_content)
-
-    try:
-        api_instance.send_transac_email(send_smtp_email)
-        print(f"Forgot password email sent to {email}")
-    except ApiException as e:
-        print(f"Error sending forgot password email: {e}")
+    return _message(to, subject, "forgot_password", temp_password=temp_password)
 
-def send_manual_admission_email(student_data: dict):
-    """Sends a welcome email to a student added manually by the admin."""
-    if not BREVO_API_KEY:
-        print("ERROR: BREVO_API_KEY not found. Cannot send email.")
-        return
 
+def compose_manual_admission_email(student_data: dict):
+    """Composes a welcome email to a student added manually by the admin."""
     student_email = student_data.get('email')
     student_name = student_data.get('first_name', 'Student')
     course_name = student_data.get('preferred_course', 'Selected Course')
 
     subject = 'Welcome to Al-Mursalaat - Admission Confirmed!'
-    html_content = f"""
-    <div style="font-family: sans-serif; max-width: 600px; margin: auto; border: 1px solid #eee; padding: 20px;">
-        <h2 style="color: #2c3e50; text-align: center;">Welcome to Al-Mursalaat</h2>
-        <p>Assalamu Alaikum, {student_name}!</p>
-        <p>We are pleased to inform you that your admission to <strong>Al-Mursalaat Online</strong> has been confirmed.</p>
-        <div style="background: #f4fbf4; padding: 15px; border-radius: 5px; border-left: 4px solid #28a745; margin: 20px 0;">
-            <p style="margin: 0;"><strong>Course:</strong> {course_name}</p>
-            <p style="margin: 5px 0 0 0;"><strong>Status:</strong> Admitted & Enrolled</p>
-        </div>
-        <p>Our team will contact you shortly to provide your class schedule and link you with your teacher.</p>
-        <p>If you have any questions, feel free to reply directly to this email.</p>
-        <br>
-        <p>JazakAllah Khair,<br><strong>The Al-Mursalaat Team</strong></p>
-    </div>
-    """
-
-    sender = {"name": FROM_NAME, "email": FROM_EMAIL}
     to = [{"email": student_email, "name": student_name}]
-    
-    send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(to=to, sender=sender, subject=subject, html_content=html_content)
-
-    try:
-        api_instance.send_transac_email(send_smtp_email)
-        print(f"Manual admission email sent to {student_email}")
-    except ApiException as e:
-        print(f"Error sending manual admission email: {e}")
\ No newline at end of file
+    return _message(to, subject, "manual_admission", student_name=student_name, course_name=course_name)
+
+
+# Outbox 'kind' (kept from the old send_* function names) -> composer
+COMPOSERS = {
+    "send_student_confirmation": compose_student_confirmation,
+    "send_admin_notification": compose_admin_notification,
+    "send_admin_digest": compose_admin_digest,
+    "send_admin_credentials_email": compose_admin_credentials_email,
+    "send_teacher_credentials_email": compose_teacher_credentials_email,
+    "send_forgot_password_email": compose_forgot_password_email,
+    "send_manual_admission_email": compose_manual_admission_email,
+}
+
+
+def compose(kind: str, payload: dict) -> dict:
+    """Builds the Brevo message for an outbox row."""
+    composer = COMPOSERS.get(kind)
+    if composer is None:
+        raise ValueError(f"Unknown email kind: {kind}")
+    return composer(**payload)
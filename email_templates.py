@@ -0,0 +1,54 @@
+# email_templates.py
+
+import os
+from functools import lru_cache
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+from markupsafe import Markup
+
+# Email bodies live in templates/email/<name>.html and <name>.txt (plain-text alternate).
+# Files starting with '_' are static fragments (e.g. the signature) shared between templates.
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "email")
+
+env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(enabled_extensions=("html",), default_for_string=True),
+    undefined=StrictUndefined,
+    trim_blocks=True,
+    lstrip_blocks=True,
+    auto_reload=False, # Templates only change on deploy; skip the mtime check on every render
+)
+
+_compiled = {}
+
+
+def compile_all():
+    """
+    Compiles every email template once. Called at startup by the email worker,
+    the only process that renders emails (the API just queues them in the outbox).
+    """
+    for name in env.list_templates(extensions=["html", "txt"]):
+        _compiled[name] = env.get_template(name)
+    return len(_compiled)
+
+
+def _get(name: str):
+    template = _compiled.get(name)
+    if template is None:
+        template = _compiled[name] = env.get_template(name)
+    return template
+
+
+@lru_cache(maxsize=None)
+def fragment(name: str) -> Markup:
+    """Renders a static fragment once and reuses the output afterwards."""
+    return Markup(_get(name).render().strip())
+
+
+env.globals["fragment"] = fragment
+
+
+def render(name: str, **context):
+    """Renders `<name>.html` and `<name>.txt`. Returns (html, text)."""
+    html = _get(f"{name}.html").render(**context)
+    text = _get(f"{name}.txt").render(**context)
+    return html, text
@@ -0,0 +1,84 @@
+# email_worker.py
+# Separate process that delivers the email outbox (see email_outbox.py).
+#
+#   python email_worker.py
+#
+# It claims due rows, sends them concurrently over one pooled Brevo
+# connection (brevo_transport.py), and records the result; failures are
+# retried with exponential backoff.
+
+import asyncio
+import json
+import os
+import time
+import announcements
+import email_outbox
+import email_sender
+import email_templates
+import models
+from brevo_transport import BrevoTransport, BREVO_MAX_CONCURRENCY
+from database import SessionLocal, engine
+
+EMAIL_WORKER_BATCH_SIZE = int(os.getenv("EMAIL_WORKER_BATCH_SIZE", "50"))
+EMAIL_WORKER_POLL_SECONDS = float(os.getenv("EMAIL_WORKER_POLL_SECONDS", "2"))
+EMAIL_WORKER_PURGE_SECONDS = float(os.getenv("EMAIL_WORKER_PURGE_SECONDS", "600"))
+
+
+async def deliver(transport: BrevoTransport, kind: str, payload: dict):
+    """Sends one outbox email. Returns (ok, error message)."""
+    try:
+        await transport.send(email_sender.compose(kind, payload))
+        return True, None
+    except Exception as e:
+        return False, str(e)
+
+
+async def process_batch(db, transport: BrevoTransport = None, deliver_fn=None, limit: int = EMAIL_WORKER_BATCH_SIZE):
+    """
+    Claims one batch, sends it, and records the results. Returns the number of rows handled.
+    Concurrency is bounded by the transport (BREVO_MAX_CONCURRENCY). Tests may pass an
+    async `deliver_fn(kind, payload) -> (ok, error)` instead of a transport.
+    """
+    rows = email_outbox.claim_batch(db, limit=limit)
+    if not rows:
+        return 0
+
+    if deliver_fn is None:
+        deliver_fn = lambda kind, payload: deliver(transport, kind, payload)
+    results = await asyncio.gather(*(deliver_fn(row.kind, json.loads(row.payload or "{}")) for row in rows))
+
+    for row, (ok, error) in zip(rows, results):
+        if ok:
+            email_outbox.mark_sent(db, row)
+        else:
+            email_outbox.mark_failed(db, row, error)
+    db.commit()
+    return len(rows)
+
+
+async def run_forever():
+    models.Base.metadata.create_all(bind=engine)
+    print(f"--- EMAIL WORKER: Compiled {email_templates.compile_all()} email templates ---")
+    async with BrevoTransport() as transport:
+        print(f"--- EMAIL WORKER: Started (max concurrency={BREVO_MAX_CONCURRENCY}) ---")
+        last_purge = 0.0
+        while True:
+            db = SessionLocal()
+            try:
+                if time.monotonic() - last_purge >= EMAIL_WORKER_PURGE_SECONDS:
+                    email_outbox.purge_expired_dispatch_keys(db)
+                    last_purge = time.monotonic()
+                email_outbox.flush_admin_digest(db, recipient=email_sender.ADMIN_EMAIL)
+                handled = await process_batch(db, transport)
+                handled += await announcements.process_next_batch(db, transport)
+            except Exception as e:
+                print(f"--- EMAIL WORKER ERROR: {e} ---")
+                handled = 0
+            finally:
+                db.close()
+            if not handled:
+                await asyncio.sleep(EMAIL_WORKER_POLL_SECONDS)
+
+
+if __name__ == "__main__":
+    asyncio.run(run_forever())
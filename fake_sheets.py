@@ -0,0 +1,70 @@
+# fake_sheets.py
+# In-memory stand-in for a gspread Worksheet, for tests and local runs of
+# sheets_sync.py / sheets.SheetAppender without Google credentials.
+
+from gspread.utils import a1_range_to_grid_range
+
+
+class FakeWorksheet:
+    """Implements the subset of gspread.Worksheet the app uses, and counts API calls."""
+
+    def __init__(self, rows: int = 1000, cols: int = 26, title: str = "Sheet1"):
+        self.title = title
+        self.row_count = rows
+        self.col_count = cols
+        self.cells = {} # (row, col) -> value, 1-based like Sheets
+        self.calls = {}
+
+    def _count(self, name: str):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _last_row(self):
+        return max((r for r, _ in self.cells), default=0)
+
+    def _write(self, row: int, col: int, values: list):
+        if row > self.row_count:
+            raise ValueError(f"Range exceeds grid limits: row {row} > {self.row_count}")
+        for offset, value in enumerate(values):
+            if value in ("", None):
+                self.cells.pop((row, col + offset), None)
+            else:
+                self.cells[(row, col + offset)] = value
+
+    # --- gspread API ---
+
+    def add_rows(self, rows: int):
+        self._count("add_rows")
+        self.row_count += rows
+
+    def append_rows(self, values: list, value_input_option=None, **kwargs):
+        self._count("append_rows")
+        start = self._last_row() + 1
+        self.row_count = max(self.row_count, start + len(values) - 1)
+        for i, row in enumerate(values):
+            self._write(start + i, 1, row)
+
+    def append_row(self, values: list, value_input_option=None, **kwargs):
+        self.append_rows([values], value_input_option)
+
+    def batch_update(self, data: list, value_input_option=None, **kwargs):
+        self._count("batch_update")
+        for item in data:
+            grid = a1_range_to_grid_range(item["range"])
+            for i, row in enumerate(item["values"]):
+                self._write(grid["startRowIndex"] + 1 + i, grid["startColumnIndex"] + 1, row)
+
+    def col_values(self, col: int, **kwargs):
+        self._count("col_values")
+        values = [self.cells.get((r, col), "") for r in range(1, self._last_row() + 1)]
+        while values and values[-1] == "":
+            values.pop()
+        return [str(v) if v != "" else "" for v in values]
+
+    def get_all_values(self, **kwargs):
+        self._count("get_all_values")
+        last_col = max((c for _, c in self.cells), default=0)
+        return [[str(self.cells.get((r, c), "")) for c in range(1, last_col + 1)] for r in range(1, self._last_row() + 1)]
+
+    def update_cell(self, row: int, col: int, value):
+        self._count("update_cell")
+        self._write(row, col, [value])
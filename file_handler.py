@@ -1,14 +1,20 @@
 import os
-import shutil
 import uuid
+import hashlib
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from fastapi import UploadFile
+from fastapi import UploadFile, HTTPException
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
+import image_variants
+import crud
+import storage
+import file_ops
 
 load_dotenv()
 
-# Define storage directories
-UPLOADS_DIR = Path("uploads")
+# Define storage directories (used by the local backend and for image variants)
+UPLOADS_DIR = storage.UPLOADS_DIR
 TEACHER_PHOTOS_DIR = UPLOADS_DIR / "teacher_photos"
 TEACHER_CVS_DIR = UPLOADS_DIR / "teacher_cvs"
 
@@ -21,96 +27,227 @@ ADMIN_CVS_DIR = UPLOADS_DIR / "admin_cvs"
 ADMIN_PHOTOS_DIR.mkdir(parents=True, exist_ok=True)
 ADMIN_CVS_DIR.mkdir(parents=True, exist_ok=True)
 
-async def _save_file_locally(file: UploadFile, directory: Path, subdir_name: str) -> str:
+# Uploads are spooled here while they are checked and hashed, then handed to the
+# storage backend (same filesystem as UPLOADS_DIR, so the local backend just renames)
+SPOOL_DIR = UPLOADS_DIR / ".incoming"
+SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+
+# A released file whose content was uploaded again within this window is not
+# deleted right away (see _release)
+UPLOAD_RELEASE_GRACE_SECONDS = int(os.getenv("UPLOAD_RELEASE_GRACE_SECONDS", "600"))
+
+# --- Upload Limits ---
+# Uploads are streamed to disk in UPLOAD_CHUNK_BYTES chunks and rejected as soon
+# as they break a limit: 413 when too large, 415 for an unexpected type.
+UPLOAD_CHUNK_BYTES = 64 * 1024
+MAX_PHOTO_BYTES = int(os.getenv("MAX_PHOTO_BYTES", str(5 * 1024 * 1024)))
+MAX_CV_BYTES = int(os.getenv("MAX_CV_BYTES", str(10 * 1024 * 1024)))
+
+PHOTO_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+}
+CV_TYPES = {".pdf": "application/pdf"}
+
+# subdir_name -> (max bytes, allowed extension -> content type)
+UPLOAD_LIMITS = {
+    "teacher_photos": (MAX_PHOTO_BYTES, PHOTO_TYPES),
+    "admin_photos": (MAX_PHOTO_BYTES, PHOTO_TYPES),
+    "teacher_cvs": (MAX_CV_BYTES, CV_TYPES),
+    "admin_cvs": (MAX_CV_BYTES, CV_TYPES),
+}
+
+# Leading bytes of each allowed type, checked on the first chunk
+MAGIC_BYTES = {
+    "image/jpeg": (b"\xff\xd8\xff",),
+    "image/png": (b"\x89PNG\r\n\x1a\n",),
+    "image/gif": (b"GIF87a", b"GIF89a"),
+    "image/webp": (b"RIFF",), # ...followed by the size and b"WEBP"
+    "application/pdf": (b"%PDF-",),
+}
+
+
+def _matches_type(chunk: bytes, content_type: str) -> bool:
+    if not chunk.startswith(MAGIC_BYTES[content_type]):
+        return False
+    return content_type != "image/webp" or chunk[8:12] == b"WEBP"
+
+
+def _check_type(file: UploadFile, allowed: dict) -> str:
+    """Validates the extension and declared content type. Returns the file extension."""
+    file_ext = os.path.splitext(file.filename or "")[1].lower()
+    if file_ext not in allowed:
+        raise HTTPException(status_code=415, detail=f"Unsupported file type '{file_ext or 'none'}'. Allowed: {', '.join(sorted(allowed))}.")
+    declared = (file.content_type or "").split(";")[0].strip().lower()
+    if declared and declared != "application/octet-stream" and declared != allowed[file_ext]:
+        raise HTTPException(status_code=415, detail=f"Content type '{declared}' does not match '{file_ext}'.")
+    return file_ext
+
+
+def _stream_to_spool(source, file_ext: str, max_bytes: int, content_type: str):
+    """
+    Copies `source` into a spool file in fixed-size chunks (runs in a worker thread),
+    hashing it on the way. A rejected upload is removed before the error is raised.
+    Returns (spool path, sha256 hex digest).
+    """
+    tmp_path = SPOOL_DIR / f".tmp-{uuid.uuid4()}{file_ext}"
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        with open(tmp_path, "wb") as out:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                if written == 0 and not _matches_type(chunk, content_type):
+                    raise HTTPException(status_code=415, detail=f"File content is not a valid {content_type}.")
+                written += len(chunk)
+                if written > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {max_bytes // (1024 * 1024)} MB.")
+                digest.update(chunk)
+                out.write(chunk)
+        if written == 0:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty.")
+        return tmp_path, digest.hexdigest()
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def _store(tmp_path: Path, key: str):
     """
-    Saves a file locally with a unique name and returns the static URL.
+    Hands a spooled upload to the storage backend under its content-hash key.
+    Identical content is kept once: the backend drops the copy if the key already exists.
     """
     try:
-        # Generate unique filename
-        # Preserve original extension
-        file_ext = os.path.splitext(file.filename)[1]
-        unique_filename = f"{uuid.uuid4()}{file_ext}"
-        
-        file_path = directory / unique_filename
-        
-        # Async read
+        storage.backend.save(key, tmp_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+async def _save_file(db, file: UploadFile, subdir_name: str, owner: str = None) -> str:
+    """
+    Saves a file through the storage backend under its content hash, records it
+    in the upload manifest and returns its URL.
+    Raises HTTPException 413/415 when the upload breaks the limits for `subdir_name`.
+    """
+    max_bytes, allowed = UPLOAD_LIMITS[subdir_name]
+    file_ext = _check_type(file, allowed)
+    # Reject early when the size is already known from the multipart part
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File too large. Maximum size is {max_bytes // (1024 * 1024)} MB.")
+
+    try:
         await file.seek(0)
-        content = await file.read()
-        
-        
-        # Save file
-        with open(file_path, "wb") as f:
-            f.write(content)
-            
-        # Return URL (mapped to /uploads in main.py)
-        # URL format: /uploads/subdir_name/filename
-        return f"/uploads/{subdir_name}/{unique_filename}"
-        
+        # The blocking copy and upload run in a thread so they never stall the event loop
+        tmp_path, digest = await run_in_threadpool(_stream_to_spool, file.file, file_ext, max_bytes, allowed[file_ext])
+        key = f"{subdir_name}/{digest}{file_ext}"
+        try:
+            # Recorded (or marked as referenced again) before the content is stored,
+            # so a concurrent release of the same content keeps the file; see _release
+            crud.record_upload(db, key, subdir_name, tmp_path.stat().st_size, digest, owner=owner)
+        except Exception:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        await run_in_threadpool(_store, tmp_path, key)
+        if allowed is PHOTO_TYPES:
+            # Thumbnails/WebP are made off the request path, once the row using the photo is committed
+            file_ops.after_commit(db, _generate_variants, key)
+
+        # URL format: /uploads/subdir_name/<sha256>.<ext> (served by /api/files/* in main.py)
+        return storage.url_for_key(key)
+
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error saving file locally: {e}")
+        print(f"Error saving file to storage: {e}")
         return None
 
-async def save_teacher_photo(file: UploadFile) -> str:
+async def save_teacher_photo(db, file: UploadFile, owner: str = None) -> str:
     """
-    Saves a teacher photo locally and returns the URL.
+    Saves a teacher photo and returns the URL.
     """
-    return await _save_file_locally(file, TEACHER_PHOTOS_DIR, "teacher_photos")
+    return await _save_file(db, file, "teacher_photos", owner=owner)
 
-async def save_teacher_cv(file: UploadFile) -> str:
+async def save_teacher_cv(db, file: UploadFile, owner: str = None) -> str:
     """
-    Saves a teacher CV locally and returns the URL.
+    Saves a teacher CV and returns the URL.
     """
-    return await _save_file_locally(file, TEACHER_CVS_DIR, "teacher_cvs")
+    return await _save_file(db, file, "teacher_cvs", owner=owner)
 
-async def save_admin_photo(file: UploadFile) -> str:
+async def save_admin_photo(db, file: UploadFile, owner: str = None) -> str:
     """
-    Saves an admin photo locally and returns the URL.
+    Saves an admin photo and returns the URL.
     """
-    return await _save_file_locally(file, ADMIN_PHOTOS_DIR, "admin_photos")
+    return await _save_file(db, file, "admin_photos", owner=owner)
 
-async def save_admin_cv(file: UploadFile) -> str:
+async def save_admin_cv(db, file: UploadFile, owner: str = None) -> str:
     """
-    Saves an admin CV locally and returns the URL.
+    Saves an admin CV and returns the URL.
     """
-    return await _save_file_locally(file, ADMIN_CVS_DIR, "admin_cvs")
+    return await _save_file(db, file, "admin_cvs", owner=owner)
 
-def delete_teacher_photo(photo_url: str):
+def _generate_variants(db, key: str):
+    file_path = storage.backend.local_path(key)
+    if file_path is not None and not image_variants.variant_path(file_path, "thumb").exists():
+        image_variants.schedule_variants(file_path) # Resizing itself runs in the image process pool
+
+def release_file(db, file_url: str):
+    """
+    Drops one reference to an uploaded file. Call it before committing the row
+    change: the release runs in the file-ops pool after the commit (and not at all
+    if it rolls back). Files are content-addressed and may be shared by several
+    users/teachers rows, so the file is only deleted once no row references it.
+    """
+    if file_url:
+        file_ops.after_commit(db, _release, file_url)
+
+def _release(db, file_url: str):
+    if crud.count_file_references(db, file_url) != 0:
+        return
+    # The same content uploaded again lately may be about to be referenced by a row
+    # that is not committed yet (the upload found the file already stored and
+    # dropped its own copy). Such files are left to gc_uploads, which collects them
+    # once the grace period has passed and no row references them.
+    key = storage.key_from_url(file_url)
+    since = datetime.now(timezone.utc) - timedelta(seconds=UPLOAD_RELEASE_GRACE_SECONDS)
+    if key is not None and crud.get_reuploaded_keys(db, since, keys=[key]):
+        print(f"--- FILE OPS: Kept recently re-uploaded {key} for the upload GC ---")
+        return
+    _delete_file(db, file_url)
+
+def delete_teacher_photo(db, photo_url: str):
     """
-    Deletes the teacher photo from local storage.
-    Expects URL like: /static/teacher_photos/uuid.jpg
+    Releases a teacher (or admin) photo; see release_file.
+    Expects URL like: /uploads/teacher_photos/<sha256>.jpg
     """
-    _delete_file_locally(photo_url)
+    release_file(db, photo_url)
 
-def delete_teacher_cv(cv_url: str):
+def delete_teacher_cv(db, cv_url: str):
     """
-    Deletes the teacher CV from local storage.
-    Expects URL like: /static/teacher_cvs/uuid.pdf
+    Releases a teacher (or admin) CV; see release_file.
+    Expects URL like: /uploads/teacher_cvs/<sha256>.pdf
     """
-    _delete_file_locally(cv_url)
+    release_file(db, cv_url)
 
-def _delete_file_locally(file_url: str):
-    if not file_url:
+def _delete_file(db, file_url: str):
+    key = storage.key_from_url(file_url)
+    if key is None:
+        if file_url:
+            print(f"URL does not match storage pattern: {file_url}")
         return
-        
+
     try:
-        # Extract relative path from URL
-        # Assumption: URL starts with /uploads/
-        if file_url.startswith("/uploads/"):
-            relative_path = file_url.replace("/uploads/", "", 1)
-            # Prevent directory traversal attacks (basic check)
-            if ".." in relative_path:
-                print(f"Security Warning: Attempted directory traversal in delete: {file_url}")
-                return
-                
-            file_path = UPLOADS_DIR / relative_path
-            
-            if file_path.exists():
-                os.remove(file_path)
-                print(f"Deleted local file: {file_path}")
-            else:
-                print(f"File not found for deletion: {file_path}")
+        file_path = storage.backend.local_path(key)
+        if storage.backend.delete(key):
+            print(f"Deleted stored file: {key}")
         else:
-            print(f"URL does not match local storage pattern: {file_url}")
-            
+            print(f"File not found for deletion: {key}")
+        if file_path is not None:
+            image_variants.delete_variants(file_path)
+        crud.delete_upload_record(db, key)
     except Exception as e:
-        print(f"Error deleting local file: {e}")
+        print(f"Error deleting stored file: {e}")
@@ -0,0 +1,88 @@
+# file_ops.py
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Post-commit file operations. Requests only queue storage work (releasing a
+# replaced photo, generating variants) on their DB session; the queue runs in
+# a thread pool once that session commits, and is dropped if it rolls back.
+# So a failed commit never leaves rows pointing at deleted files, and request
+# latency does not depend on disk or bucket latency.
+#
+# Each operation is called as fn(session, *args) with its own short-lived
+# session on the same database (the request's session belongs to the request).
+
+FILE_OPS_WORKERS = int(os.getenv("FILE_OPS_WORKERS", "4"))
+
+_PENDING_KEY = "file_ops.pending"
+_pool = None
+_pool_lock = threading.Lock()
+_futures = set()
+
+
+def get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=FILE_OPS_WORKERS, thread_name_prefix="file-ops")
+        return _pool
+
+
+def after_commit(db: Session, fn, *args):
+    """Queues fn(session, *args) to run in the pool once `db` commits its current transaction."""
+    if not db.in_transaction():
+        db.begin() # So a rollback or close before any query still drops the queue
+    db.info.setdefault(_PENDING_KEY, []).append((fn, args))
+
+
+def _run(bind, fn, args):
+    try:
+        with Session(bind=bind) as session:
+            fn(session, *args)
+    except Exception as e:
+        print(f"--- FILE OPS: {getattr(fn, '__name__', fn)}{args} failed: {e} ---")
+
+
+def _discard(future):
+    with _pool_lock:
+        _futures.discard(future)
+
+
+@event.listens_for(Session, "after_commit")
+def _submit_pending(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    bind = session.get_bind()
+    pool = get_pool()
+    for fn, args in pending:
+        future = pool.submit(_run, bind, fn, args)
+        with _pool_lock:
+            _futures.add(future)
+        future.add_done_callback(_discard)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_pending(session, transaction):
+    # Runs after after_commit, so anything left here was rolled back or closed
+    if transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
+
+
+def wait(timeout: float = None):
+    """Blocks until every submitted operation has finished (tests, shutdown)."""
+    with _pool_lock:
+        futures = list(_futures)
+    wait_futures(futures, timeout=timeout)
+
+
+def shutdown():
+    """Finishes queued operations and stops the pool."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
@@ -0,0 +1,203 @@
+# file_serving.py
+
+import hashlib
+import os
+import re
+import stat
+import threading
+import anyio
+from collections import OrderedDict
+from pathlib import Path
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, RedirectResponse, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+import file_handler
+import storage
+
+# Uploaded files never change once written: originals are named after their
+# sha256 (older ones after a uuid) and a replaced photo gets a new name, so
+# responses can be cached by browsers for a year without revalidation.
+# Conditional requests (If-None-Match) still get a 304 without touching the
+# file, and Range requests (PDF viewers) are answered by FileResponse.
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Small files (thumbnails) are kept in memory so hot list views skip the disk
+FILE_CACHE_MAX_BYTES = int(os.getenv("FILE_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+FILE_CACHE_ITEM_MAX_BYTES = int(os.getenv("FILE_CACHE_ITEM_MAX_BYTES", str(64 * 1024)))
+
+MEDIA_TYPES = {**file_handler.PHOTO_TYPES, **file_handler.CV_TYPES}
+
+_CONTENT_HASH = re.compile(r"[0-9a-f]{64}")
+
+
+def media_type_for(path: Path) -> str:
+    return MEDIA_TYPES.get(path.suffix.lower(), "application/octet-stream")
+
+
+def etag_for(path: Path, st: os.stat_result) -> str:
+    """Strong ETag: the content hash for content-addressed files, else size and mtime."""
+    if _CONTENT_HASH.fullmatch(path.stem):
+        return f'"{path.stem}"'
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    etag = etag[2:] if etag.startswith("W/") else etag
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+class _LRUCache:
+    """Byte-bounded LRU of small file bodies, keyed by path, size and mtime."""
+
+    def __init__(self, max_bytes: int, item_max_bytes: int):
+        self.max_bytes = max_bytes
+        self.item_max_bytes = item_max_bytes
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            body = self._items.get(key)
+            if body is None:
+                self.stats["misses"] += 1
+                return None
+            self._items.move_to_end(key)
+            self.stats["hits"] += 1
+            return body
+
+    def put(self, key, body: bytes):
+        if len(body) > self.item_max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                return
+            self._items[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+
+cache = _LRUCache(FILE_CACHE_MAX_BYTES, FILE_CACHE_ITEM_MAX_BYTES)
+
+
+class SendfileResponse(FileResponse):
+    """
+    FileResponse that hands the file to the server (ASGI `http.response.pathsend`)
+    when the server supports it, so the body is sent with sendfile() instead of
+    being read into Python in chunks. Falls back to the normal streaming otherwise.
+    """
+
+    async def __call__(self, scope, receive, send):
+        # Range and HEAD requests (and servers without the extension) take the
+        # regular FileResponse path; only the public stat/headers API is used here
+        pathsend = "http.response.pathsend" in scope.get("extensions", {})
+        if not pathsend or scope["method"].upper() != "GET" or Headers(scope=scope).get("range") is not None:
+            await super().__call__(scope, receive, send)
+            return
+        if self.stat_result is None:
+            try:
+                self.set_stat_headers(await anyio.to_thread.run_sync(os.stat, self.path))
+            except FileNotFoundError:
+                raise RuntimeError(f"File at path {self.path} does not exist.")
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
+        if self.background is not None:
+            await self.background()
+
+
+def _read(path: Path) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _conditional(request: Request, etag: str):
+    """Caching headers for a stored file, and a 304 response if the client already has it."""
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return headers, Response(status_code=304, headers=headers)
+    return headers, None
+
+
+async def serve_file(request: Request, path: Path, media_type: str = None, not_found: str = "File not found."):
+    """
+    Serves an uploaded file with a strong ETag and immutable caching.
+    Answers If-None-Match with 304, Range with 206 (via FileResponse), and
+    serves small files from the in-memory LRU.
+    """
+    try:
+        st = path.stat()
+    except (FileNotFoundError, NotADirectoryError):
+        raise HTTPException(status_code=404, detail=not_found)
+    if not stat.S_ISREG(st.st_mode):
+        raise HTTPException(status_code=404, detail=not_found)
+
+    headers, not_modified = _conditional(request, etag_for(path, st))
+    if not_modified:
+        return not_modified
+
+    media_type = media_type or media_type_for(path)
+    if st.st_size <= cache.item_max_bytes and "range" not in request.headers:
+        key = (str(path), st.st_size, st.st_mtime_ns)
+        body = cache.get(key)
+        if body is None:
+            body = await run_in_threadpool(_read, path)
+            cache.put(key, body)
+        return Response(body, media_type=media_type, headers={**headers, "Accept-Ranges": "bytes"})
+
+    return SendfileResponse(path, media_type=media_type, headers=headers, stat_result=st)
+
+
+def _read_key(key: str) -> bytes:
+    with storage.backend.open(key) as f:
+        return f.read()
+
+
+async def serve_upload(request: Request, key: str, media_type: str = None, not_found: str = "File not found."):
+    """
+    Serves a stored upload from whichever storage backend is configured:
+    local files as above, object storage as a redirect to a short-lived signed
+    URL, anything else (the in-memory backend) by reading it through the backend.
+    """
+    name = Path(key)
+    if ".." in key or name.name.startswith("."):
+        raise HTTPException(status_code=404, detail=not_found) # Traversal, spool and variant files
+    backend = storage.backend
+    path = backend.local_path(key)
+    if path is not None:
+        return await serve_file(request, path, media_type=media_type, not_found=not_found)
+
+    content_etag = f'"{name.stem}"' if _CONTENT_HASH.fullmatch(name.stem) else None
+    if content_etag:
+        _, not_modified = _conditional(request, content_etag)
+        if not_modified:
+            return not_modified
+
+    url = await run_in_threadpool(backend.url, key)
+    if url:
+        # The signed URL expires, so the redirect itself must not be cached
+        return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-store"})
+
+    try:
+        body = await run_in_threadpool(_read_key, key)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=not_found)
+    headers, not_modified = _conditional(request, content_etag or f'"{hashlib.sha256(body).hexdigest()}"')
+    if not_modified:
+        return not_modified
+    return Response(body, media_type=media_type or media_type_for(name), headers=headers)
@@ -0,0 +1,145 @@
+# gc_uploads.py
+# Scheduled job: deletes stored uploads (photos/CVs) that no users/teachers row
+# references any more - left behind by failed saves, crashed requests or a
+# release that lost a race. Files younger than the grace period are kept, so
+# an upload whose row is not committed yet is never collected.
+#
+# Run it from cron, e.g. nightly:
+#   python gc_uploads.py --dry-run          # only report what would be deleted
+#   python gc_uploads.py                    # delete orphans older than UPLOAD_GC_GRACE_SECONDS
+#   python gc_uploads.py --grace-hours 1
+
+import argparse
+import os
+import time
+from datetime import datetime, timezone
+
+import crud
+import file_handler
+import image_variants
+import models
+import storage
+from database import SessionLocal, engine
+
+UPLOAD_GC_GRACE_SECONDS = int(os.getenv("UPLOAD_GC_GRACE_SECONDS", str(24 * 3600)))
+UPLOAD_GC_BATCH_SIZE = int(os.getenv("UPLOAD_GC_BATCH_SIZE", "500"))
+REPORT_SAMPLE_SIZE = 20
+
+
+def _delete_batch(db, backend, keys: list, since: datetime) -> int:
+    """Deletes one batch of orphans, re-checking first that none got referenced (or re-uploaded) meanwhile."""
+    still_referenced = crud.get_referenced_file_urls(db, urls=[storage.url_for_key(key) for key in keys])
+    reuploaded = crud.get_reuploaded_keys(db, since, keys=keys)
+    keys = [key for key in keys if storage.url_for_key(key) not in still_referenced and key not in reuploaded]
+    for key in keys:
+        file_path = backend.local_path(key)
+        backend.delete(key)
+        if file_path is not None:
+            image_variants.delete_variants(file_path)
+    if keys:
+        crud.delete_upload_records(db, keys)
+    return len(keys)
+
+
+def _clean_spool(cutoff: float, dry_run: bool) -> int:
+    """Removes spool files of uploads that never finished (crashed requests)."""
+    removed = 0
+    with os.scandir(file_handler.SPOOL_DIR) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                if not dry_run:
+                    os.remove(entry.path)
+                removed += 1
+    return removed
+
+
+def _clean_variants(live: set, cutoff: float, dry_run: bool) -> int:
+    """Removes resized photo variants (local storage only) whose original is gone."""
+    removed = 0
+    variants_dir = file_handler.UPLOADS_DIR / image_variants.VARIANTS_DIRNAME
+    for kind in file_handler.UPLOAD_LIMITS:
+        try:
+            entries = os.scandir(variants_dir / kind)
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                stem = entry.name.split(".", 1)[0] # <stem>.<size>.webp
+                if f"{kind}/{stem}" in live or entry.stat().st_mtime > cutoff:
+                    continue
+                if not dry_run:
+                    os.remove(entry.path)
+                removed += 1
+    return removed
+
+
+def collect_garbage(db, dry_run: bool = True, grace_seconds: int = UPLOAD_GC_GRACE_SECONDS,
+                    batch_size: int = UPLOAD_GC_BATCH_SIZE):
+    """
+    Streams the stored keys of every upload kind, set-diffs them against the
+    referenced URLs and deletes orphans older than `grace_seconds` in batches.
+    Returns a report; with dry_run nothing is deleted.
+    """
+    backend = storage.backend
+    referenced = crud.get_referenced_file_urls(db)
+    cutoff = time.time() - grace_seconds
+    since = datetime.fromtimestamp(cutoff, timezone.utc)
+    # Same content uploaded again lately: its new row may not be committed yet
+    reuploaded = crud.get_reuploaded_keys(db, since)
+    report = {
+        "dry_run": dry_run, "scanned": 0, "referenced": 0, "recent": 0,
+        "orphans": 0, "orphan_bytes": 0, "deleted": 0, "spool_files": 0, "variant_files": 0, "sample": [],
+    }
+
+    batch, live = [], set() # live: '<kind>/<stem>' of the originals that are kept
+    for kind in file_handler.UPLOAD_LIMITS:
+        for key, size, mtime in backend.list_keys(f"{kind}/"):
+            report["scanned"] += 1
+            if storage.url_for_key(key) in referenced:
+                report["referenced"] += 1
+                live.add(key.rsplit(".", 1)[0])
+                continue
+            if mtime > cutoff or key in reuploaded:
+                report["recent"] += 1 # Maybe an upload whose row is not committed yet
+                live.add(key.rsplit(".", 1)[0])
+                continue
+            report["orphans"] += 1
+            report["orphan_bytes"] += size
+            if len(report["sample"]) < REPORT_SAMPLE_SIZE:
+                report["sample"].append(key)
+            if not dry_run:
+                batch.append(key)
+                if len(batch) >= batch_size:
+                    report["deleted"] += _delete_batch(db, backend, batch, since)
+                    batch = []
+    if batch:
+        report["deleted"] += _delete_batch(db, backend, batch, since)
+
+    report["spool_files"] = _clean_spool(cutoff, dry_run)
+    if isinstance(backend, storage.LocalStorage):
+        report["variant_files"] = _clean_variants(live, cutoff, dry_run)
+    return report
+
+
+def run(dry_run: bool, grace_seconds: int, batch_size: int):
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        report = collect_garbage(db, dry_run=dry_run, grace_seconds=grace_seconds, batch_size=batch_size)
+        action = "Would delete" if dry_run else "Deleted"
+        count = report["orphans"] if dry_run else report["deleted"]
+        print(f"--- UPLOAD GC: {action} {count} orphaned files ({report['orphan_bytes']} bytes) of {report['scanned']} scanned ---")
+        for key in report["sample"]:
+            print(f"    {key}")
+        return report
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete uploaded files no user or teacher references.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the orphans.")
+    parser.add_argument("--grace-hours", type=float, default=UPLOAD_GC_GRACE_SECONDS / 3600, help="Keep orphans younger than this.")
+    parser.add_argument("--batch-size", type=int, default=UPLOAD_GC_BATCH_SIZE)
+    args = parser.parse_args()
+    run(args.dry_run, int(args.grace_hours * 3600), args.batch_size)
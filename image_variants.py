@@ -0,0 +1,95 @@
+# image_variants.py
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from PIL import Image, ImageOps
+
+# Resized WebP copies of uploaded photos, so list views don't download
+# full-resolution originals. They are generated in a process pool right
+# after upload, or lazily on the first ?size= request for older files,
+# and kept on disk next to the uploads:
+#   uploads/teacher_photos/<name>.jpg -> uploads/.variants/teacher_photos/<name>.<size>.webp
+
+VARIANT_SIZES = {"thumb": 128, "small": 320, "medium": 800} # Longest side in pixels
+VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+VARIANTS_DIRNAME = ".variants"
+
+_pool = None
+
+
+def variant_path(original: Path, size: str) -> Path:
+    """Where the `size` variant of an uploaded photo is cached."""
+    return original.parent.parent / VARIANTS_DIRNAME / original.parent.name / f"{original.stem}.{size}.webp"
+
+
+def generate_variant(original: str, size: str) -> str:
+    """Writes one WebP variant (runs in a worker process). Returns its path."""
+    target = variant_path(Path(original), size)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with Image.open(original) as img:
+        img = ImageOps.exif_transpose(img) # Respect phone camera rotation
+        img.thumbnail((VARIANT_SIZES[size], VARIANT_SIZES[size]))
+        if img.mode in ("P", "LA", "PA") or "transparency" in img.info:
+            img = img.convert("RGBA")
+        elif img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGB")
+        tmp = target.with_name(f".tmp-{os.getpid()}-{target.name}")
+        img.save(tmp, "WEBP", quality=VARIANT_QUALITY, method=4)
+    os.replace(tmp, target)
+    return str(target)
+
+
+def generate_all_variants(original: str):
+    """Writes every size for one photo. Unreadable images are skipped."""
+    try:
+        return [generate_variant(original, size) for size in VARIANT_SIZES]
+    except Exception as e:
+        print(f"--- IMAGES: Could not generate variants for {original}: {e} ---")
+        return []
+
+
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    # The pool is created lazily from the event loop or a file-ops thread of a
+    # multi-threaded server; forking such a process can copy a held lock into the
+    # child and deadlock it, so workers are started by a forkserver (spawn on Windows)
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def schedule_variants(original: Path):
+    """Queues all variants of a freshly uploaded photo; does not wait for them."""
+    get_pool().submit(generate_all_variants, str(original))
+
+
+async def get_variant(original: Path, size: str) -> Path:
+    """Returns the cached variant, generating it in the pool first if it is missing or stale."""
+    target = variant_path(original, size)
+    if not target.exists() or target.stat().st_mtime < original.stat().st_mtime:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(get_pool(), generate_variant, str(original), size)
+    return target
+
+
+def delete_variants(original: Path):
+    for size in VARIANT_SIZES:
+        variant_path(original, size).unlink(missing_ok=True)
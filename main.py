@@ -1,7 +1,8 @@
 # main.py
+import hashlib
 from datetime import datetime, date, timedelta
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Request, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, Depends, HTTPException, Request, UploadFile, File, Form
+from fastapi.responses import Response
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from sqlalchemy.orm import Session
@@ -24,7 +25,18 @@ import schemas
 from database import SessionLocal, engine
 import sheets
 import email_sender
+import email_outbox
 import file_handler
+import image_variants
+import file_serving
+import file_ops
+import serializers
+import compression
+import storage
+import gc_uploads
+import course_registry
+import announcements
+from jinja2 import TemplateError
 from fastapi.security import OAuth2PasswordRequestForm
 
 load_dotenv()
@@ -47,7 +59,8 @@ ALGORITHM = "HS256"
 app = FastAPI(
     title="Al-Mursalaat API",
     description="API for handling student applications.",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=serializers.ORJSONResponse
 )
 
 def seed_default_courses():
@@ -67,8 +80,8 @@ def seed_default_courses():
         
         print("--- Checking Default Courses ---")
         for course_name in default_courses:
-            # Check if it exists
-            existing_course = crud.get_course_by_name(db, course_name)
+            # Check if it exists (served from the in-memory course registry)
+            existing_course = course_registry.registry.get_by_name(db, course_name)
             if not existing_course:
                 print(f"Creating course: {course_name}")
                 # Create the course using the schema
@@ -83,6 +96,30 @@ def seed_default_courses():
         db.close()
 
 
+@app.on_event("startup")
+def seed_courses_on_startup():
+    seed_default_courses()
+
+
+@app.on_event("startup")
+def start_sheets_appender():
+    if sheets.SHEET_ID:
+        sheets.appender.start()
+
+
+@app.on_event("shutdown")
+def stop_sheets_appender():
+    # Writes the rows still in the buffer before the process exits
+    sheets.appender.stop()
+
+
+@app.on_event("shutdown")
+def stop_file_ops():
+    # Finishes queued deletes/variant jobs first, they may submit to the image pool
+    file_ops.shutdown()
+    image_variants.shutdown_pool()
+
+
 @app.on_event("startup")
 def create_supreme_admin_on_startup():
     """Checks for and creates the supreme admin on server startup."""
@@ -167,11 +204,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/brotli for JSON responses above COMPRESSION_MIN_BYTES (uploaded files are skipped)
+app.add_middleware(compression.CompressionMiddleware)
+
 # Mount static files for uploaded teacher photos and CVs
 BASE_DIR = Path(__file__).parent
 STATIC_DIR = BASE_DIR / "Frontend" / "public"
 app.mount("/bucket", StaticFiles(directory=str(STATIC_DIR / "bucket")), name="bucket")
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+app.mount("/uploads", StaticFiles(directory=str(storage.UPLOADS_DIR)), name="uploads")
 
 def get_db():
     db = SessionLocal()
@@ -204,6 +244,26 @@ async def get_current_admin(request: Request, db: Session = Depends(get_db)):
     except InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token: Could not validate credentials.")
 
+# --- Conditional GET (list and stats endpoints) ---
+# The ETag of a view is derived from the version counters of the resources it
+# reads (bumped by every crud write), the query string and any per-caller scope.
+# A matching If-None-Match is answered with 304 after that one counter lookup,
+# before the view's own queries run. Browsers revalidate on every use (no-cache).
+
+VERSIONED_CACHE_CONTROL = "private, no-cache"
+
+def _versioned_etag(request: Request, db: Session, resources: tuple, *scope) -> str:
+    versions = crud.get_resource_versions(db, resources)
+    key = "|".join([f"{name}={versions[name]}" for name in sorted(versions)] + [request.url.query] + [str(s) for s in scope])
+    return 'W/"' + hashlib.sha1(key.encode("utf-8")).hexdigest()[:20] + '"'
+
+def _not_modified(request: Request, etag: str):
+    """304 response if the client's copy is current, else None."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and file_serving.etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": VERSIONED_CACHE_CONTROL})
+    return None
+
 # --- API Endpoints ---
 
 @app.get("/")
@@ -213,111 +273,105 @@ def read_root():
 # --- File Serving API Endpoints ---
 # These endpoints serve uploaded files (photos/CVs) with proper content-type headers
 
-# Use absolute path based on main.py location to avoid working directory issues
-UPLOADS_DIR = BASE_DIR / "uploads"
+# Same directory file_handler writes to (UPLOADS_DIR env, default next to main.py)
+UPLOADS_DIR = storage.UPLOADS_DIR
 
 @app.get("/api/files/debug")
-async def debug_file_paths():
-    """Debug endpoint to check file paths and availability."""
-    import os
-    
-    def get_files_with_sizes(directory: Path):
-        """Get files with their sizes in bytes."""
-        if not directory.exists():
-            return []
-        files = []
-        for f in directory.glob("*"):
-            files.append({
-                "name": f.name,
-                "size_bytes": f.stat().st_size,
-                "size_kb": round(f.stat().st_size / 1024, 2)
-            })
-        return files
-    
+def debug_file_paths(db: Session = Depends(get_db), current_admin: dict = Depends(get_current_admin)):
+    """Debug endpoint to check the storage configuration and the latest stored files."""
+    if current_admin.role != "supreme-admin":
+        raise HTTPException(status_code=403, detail="Forbidden: Not enough permissions.")
+
+    def latest_files(kind: str):
+        """Most recent manifest entries of one kind, with their sizes in bytes."""
+        return [{
+            "name": entry.key.rsplit("/", 1)[-1],
+            "size_bytes": entry.size_bytes,
+            "size_kb": round(entry.size_bytes / 1024, 2)
+        } for entry in crud.get_upload_manifest(db, kind=kind)]
+
     return {
         "BASE_DIR": str(BASE_DIR),
         "UPLOADS_DIR": str(UPLOADS_DIR),
         "UPLOADS_EXISTS": UPLOADS_DIR.exists(),
         "WORKING_DIR": os.getcwd(),
-        "teacher_photos_exists": (UPLOADS_DIR / "teacher_photos").exists(),
-        "teacher_cvs_exists": (UPLOADS_DIR / "teacher_cvs").exists(),
-        "admin_photos_exists": (UPLOADS_DIR / "admin_photos").exists(),
-        "admin_cvs_exists": (UPLOADS_DIR / "admin_cvs").exists(),
-        "teacher_photos_files": get_files_with_sizes(UPLOADS_DIR / "teacher_photos"),
-        "teacher_cvs_files": get_files_with_sizes(UPLOADS_DIR / "teacher_cvs"),
+        "STORAGE_BACKEND": storage.STORAGE_BACKEND,
+        "teacher_photos_files": latest_files("teacher_photos"),
+        "teacher_cvs_files": latest_files("teacher_cvs"),
     }
 
+@app.get("/api/admin/storage-stats")
+def read_storage_stats(db: Session = Depends(get_db), current_admin: dict = Depends(get_current_admin)):
+    """Stored file count and bytes, in total and per kind, from the upload manifest."""
+    if current_admin.role not in ["admin", "supreme-admin"]:
+        raise HTTPException(status_code=403, detail="Forbidden: Not enough permissions.")
+    return crud.get_storage_stats(db)
+
+@app.post("/api/admin/storage-gc")
+def run_storage_gc(dry_run: bool = True, db: Session = Depends(get_db), current_admin: dict = Depends(get_current_admin)):
+    """Reports (or with dry_run=false deletes) stored files no user or teacher references. See gc_uploads.py."""
+    if current_admin.role != "supreme-admin":
+        raise HTTPException(status_code=403, detail="Forbidden: Not enough permissions.")
+    return gc_uploads.collect_garbage(db, dry_run=dry_run)
+
+async def _serve_photo_variant(request: Request, file_path: Path, size: str):
+    """Serves a resized WebP copy (?size=thumb|small|medium), generating and caching it on first use."""
+    if size not in image_variants.VARIANT_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {list(image_variants.VARIANT_SIZES)}.")
+    try:
+        variant = await image_variants.get_variant(file_path, size)
+    except Exception as e:
+        print(f"--- IMAGES: Serving original, variant failed for {file_path}: {e} ---")
+        return await file_serving.serve_file(request, file_path)
+    return await file_serving.serve_file(request, variant, media_type="image/webp")
+
+async def _serve_photo(request: Request, subdir: str, filename: str, size: Optional[str]):
+    key = f"{subdir}/{filename}"
+    if size:
+        if size not in image_variants.VARIANT_SIZES:
+            raise HTTPException(status_code=400, detail=f"size must be one of {list(image_variants.VARIANT_SIZES)}.")
+        file_path = storage.backend.local_path(key)
+        if file_path is not None and file_path.is_file():
+            return await _serve_photo_variant(request, file_path, size)
+        # Variants are only generated for local storage; other backends serve the original
+    return await file_serving.serve_upload(request, key, not_found="Photo not found.")
+
 @app.get("/api/files/teacher-photo/{filename}")
-async def get_teacher_photo(filename: str):
+async def get_teacher_photo(filename: str, request: Request, size: Optional[str] = None):
     """Serve a teacher's photo file."""
-    file_path = UPLOADS_DIR / "teacher_photos" / filename
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail=f"Photo not found at {file_path}")
-    
-    # Determine content type based on extension
-    ext = file_path.suffix.lower()
-    content_types = {
-        ".jpg": "image/jpeg",
-        ".jpeg": "image/jpeg",
-        ".png": "image/png",
-        ".gif": "image/gif",
-        ".webp": "image/webp"
-    }
-    media_type = content_types.get(ext, "application/octet-stream")
-    
-    return FileResponse(file_path, media_type=media_type)
+    return await _serve_photo(request, "teacher_photos", filename, size)
 
 @app.get("/api/files/teacher-cv/{filename}")
-async def get_teacher_cv(filename: str):
+async def get_teacher_cv(filename: str, request: Request):
     """Serve a teacher's CV file."""
-    file_path = UPLOADS_DIR / "teacher_cvs" / filename
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail=f"CV not found at {file_path}")
-    
-    return FileResponse(file_path, media_type="application/pdf")
+    return await file_serving.serve_upload(request, f"teacher_cvs/{filename}", media_type="application/pdf", not_found="CV not found.")
 
 @app.get("/api/files/admin-photo/{filename}")
-async def get_admin_photo(filename: str):
+async def get_admin_photo(filename: str, request: Request, size: Optional[str] = None):
     """Serve an admin's photo file."""
-    file_path = UPLOADS_DIR / "admin_photos" / filename
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail=f"Photo not found at {file_path}")
-    
-    ext = file_path.suffix.lower()
-    content_types = {
-        ".jpg": "image/jpeg",
-        ".jpeg": "image/jpeg",
-        ".png": "image/png",
-        ".gif": "image/gif",
-        ".webp": "image/webp"
-    }
-    media_type = content_types.get(ext, "application/octet-stream")
-    
-    return FileResponse(file_path, media_type=media_type)
+    return await _serve_photo(request, "admin_photos", filename, size)
 
 @app.get("/api/files/admin-cv/{filename}")
-async def get_admin_cv(filename: str):
+async def get_admin_cv(filename: str, request: Request):
     """Serve an admin's CV file."""
-    file_path = UPLOADS_DIR / "admin_cvs" / filename
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail=f"CV not found at {file_path}")
-    
-    return FileResponse(file_path, media_type="application/pdf")
+    return await file_serving.serve_upload(request, f"admin_cvs/{filename}", media_type="application/pdf", not_found="CV not found.")
 
 
 @app.post("/submit-application/", response_model=schemas.Application, dependencies=[Depends(RateLimiter(times=3, minutes=2))])
-def submit_application(application: schemas.ApplicationCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def submit_application(application: schemas.ApplicationCreate, db: Session = Depends(get_db)):
     if crud.get_application_by_email(db, email=application.email):
         raise HTTPException(status_code=400, detail="Email already exists.")
     # Smart Link: Connects student to the Course Table automatically
     new_application = crud.create_application(db=db, application=application)
     
     # Prepare data for email
-    app_data = schemas.Application.from_orm(new_application).model_dump()
+    app_data = schemas.Application.model_validate(new_application).model_dump(mode="json")
     
-    # Send emails in background
-    background_tasks.add_task(email_sender.send_student_confirmation, application_data=app_data)
-    background_tasks.add_task(email_sender.send_admin_notification, application_data=app_data)
+    # Queue emails in the outbox; email_worker.py sends them
+    email_outbox.enqueue(db, "send_student_confirmation", recipient=new_application.email, entity_id=new_application.id, application_data=app_data)
+    email_outbox.notify_admin_of_application(db, app_data, recipient=email_sender.ADMIN_EMAIL)
+    # Buffered in memory; the sheets appender thread writes rows in batches
+    sheets.append_to_sheet(app_data)
     
     return new_application
 
@@ -355,9 +409,16 @@ def login_for_access_token(
 # --- Admin/User Endpoints ---
 
 @app.get("/api/admin/users/", response_model=list[schemas.User])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_admin: dict = Depends(get_current_admin)):
-    users = crud.get_users(db, skip=skip, limit=limit)
-    return users
+def read_users(request: Request, skip: int = 0, limit: int = 100, fields: Optional[str] = None, db: Session = Depends(get_db), current_admin: dict = Depends(get_current_admin)):
+    selected = serializers.parse_fields(schemas.User, fields)
+    etag = _versioned_etag(request, db, (crud.USERS,))
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    users = crud.get_users(db, skip=skip, limit=limit, fields=selected)
+    response = serializers.respond(serializers.list_adapter(schemas.User, selected), users)
+    response.headers.update({"ETag": etag, "Cache-Control": VERSIONED_CACHE_CONTROL})
+    return response
 
 @app.post("/api/admin/create-admin/", response_model=schemas.User, status_code=201)
 async def create_admin_user(
@@ -369,14 +430,9 @@ async def create_admin_user(
     role: str = Form("admin"), # Default to admin, but supreme-admin can set it? Actually logic sets it to 'admin' via schema usually but let's allow flexibility or default.
     photo: Optional[UploadFile] = File(None),
     cv: Optional[UploadFile] = File(None),
-    background_tasks: BackgroundTasks = None,
     db: Session = Depends(get_db),
     current_admin: dict = Depends(get_current_admin)
 ):
-    # Initialize background tasks if not provided
-    if background_tasks is None:
-        background_tasks = BackgroundTasks()
-
     if current_admin.role != "supreme-admin":
         raise HTTPException(status_code=403, detail="Forbidden: Not enough permissions.")
     
@@ -388,9 +444,9 @@ async def create_admin_user(
     photo_url = None
     cv_url = None
     if photo:
-        photo_url = await file_handler.save_admin_photo(photo)
+        photo_url = await file_handler.save_admin_photo(db, photo, owner=email)
     if cv:
-        cv_url = await file_handler.save_admin_cv(cv)
+        cv_url = await file_handler.save_admin_cv(db, cv, owner=email)
         
     alphabet = string.ascii_letters + string.digits
     temp_password = ''.join(secrets.choice(alphabet) for i in range(10))
@@ -408,7 +464,7 @@ async def create_admin_user(
     )
     
     new_user = crud.create_user(db=db, user=user_schema, password=temp_password)
-    background_tasks.add_task(email_sender.send_admin_credentials_email, admin_data=schemas.User.from_orm(new_user).model_dump(), temp_password=temp_password)
+    email_outbox.enqueue(db, "send_admin_credentials_email", recipient=new_user.email, entity_id=new_user.id, version=temp_password, admin_data=schemas.User.model_validate(new_user).model_dump(mode="json"), temp_password=temp_password)
     return new_user
 
 @app.patch("/api/admin/users/{user_id}", response_model=schemas.User)
@@ -440,23 +496,24 @@ async def update_admin_user(
 
     # Handle Photo Re-upload
     if photo:
-        if db_user.profile_photo_url:
-            file_handler.delete_teacher_photo(db_user.profile_photo_url) # Reusing delete because it's generic enough or add delete_admin_photo? Let's use delete_teacher_photo as it calls _delete_file_locally
-        new_photo_url = await file_handler.save_admin_photo(photo)
+        new_photo_url = await file_handler.save_admin_photo(db, photo, owner=db_user.email)
         if new_photo_url:
             update_data['profile_photo_url'] = new_photo_url
 
     # Handle CV Re-upload
     if cv:
-        if db_user.cv_url:
-            file_handler.delete_teacher_cv(db_user.cv_url)
-        new_cv_url = await file_handler.save_admin_cv(cv)
+        new_cv_url = await file_handler.save_admin_cv(db, cv, owner=db_user.email)
         if new_cv_url:
             update_data['cv_url'] = new_cv_url
 
     if not update_data and not photo and not cv:
         return db_user
 
+    # Old files are released once the update commits (they may be shared)
+    if 'profile_photo_url' in update_data:
+        file_handler.delete_teacher_photo(db, db_user.profile_photo_url)
+    if 'cv_url' in update_data:
+        file_handler.delete_teacher_cv(db, db_user.cv_url)
     updated_user = crud.update_user(db=db, user_id=user_id, user_update_data=update_data)
     return updated_user
 
@@ -469,6 +526,8 @@ def delete_admin_user(user_id: int, db: Session = Depends(get_db), current_admin
         raise HTTPException(status_code=404, detail="User not found.")
     if user_to_delete.email == current_admin.email:
         raise HTTPException(status_code=400, detail="Action not allowed: You cannot delete your own account.")
+    file_handler.delete_teacher_photo(db, user_to_delete.profile_photo_url)
+    file_handler.delete_teacher_cv(db, user_to_delete.cv_url)
     crud.delete_user(db=db, user_id=user_id)
     return user_to_delete
 
@@ -485,7 +544,7 @@ def delete_admin_photo(user_id: int, db: Session = Depends(get_db), current_admi
         raise HTTPException(status_code=404, detail="User not found.")
     
     if db_user.profile_photo_url:
-        file_handler.delete_teacher_photo(db_user.profile_photo_url)  # Uses generic delete
+        file_handler.delete_teacher_photo(db, db_user.profile_photo_url)  # Uses generic delete, runs after the commit
         crud.update_user(db=db, user_id=user_id, user_update_data={'profile_photo_url': None})
     
     return {"message": "Photo deleted successfully."}
@@ -501,7 +560,7 @@ def delete_admin_cv(user_id: int, db: Session = Depends(get_db), current_admin:
         raise HTTPException(status_code=404, detail="User not found.")
     
     if db_user.cv_url:
-        file_handler.delete_teacher_cv(db_user.cv_url)  # Uses generic delete
+        file_handler.delete_teacher_cv(db, db_user.cv_url)  # Uses generic delete, runs after the commit
         crud.update_user(db=db, user_id=user_id, user_update_data={'cv_url': None})
     
     return {"message": "CV deleted successfully."}
@@ -517,7 +576,7 @@ def delete_teacher_photo(teacher_id: int, db: Session = Depends(get_db), current
         raise HTTPException(status_code=404, detail="Teacher not found.")
     
     if db_teacher.profile_photo_url:
-        file_handler.delete_teacher_photo(db_teacher.profile_photo_url)
+        file_handler.delete_teacher_photo(db, db_teacher.profile_photo_url)
         crud.update_teacher(db=db, teacher_id=teacher_id, teacher_update_data={'profile_photo_url': None})
     
     return {"message": "Photo deleted successfully."}
@@ -533,7 +592,7 @@ def delete_teacher_cv(teacher_id: int, db: Session = Depends(get_db), current_ad
         raise HTTPException(status_code=404, detail="Teacher not found.")
     
     if db_teacher.cv_url:
-        file_handler.delete_teacher_cv(db_teacher.cv_url)
+        file_handler.delete_teacher_cv(db, db_teacher.cv_url)
         crud.update_teacher(db=db, teacher_id=teacher_id, teacher_update_data={'cv_url': None})
     
     return {"message": "CV deleted successfully."}
@@ -541,7 +600,6 @@ def delete_teacher_cv(teacher_id: int, db: Session = Depends(get_db), current_ad
 @app.post("/api/forgot-pass")
 async def forgot_password(
     request_data: schemas.ForgetPasswordRequest,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
@@ -557,8 +615,8 @@ async def forgot_password(
         # but your frontend expects error details.
         raise HTTPException(status_code=404, detail="Email not found in our records.")
 
-    # Send Email in background so the user doesn't wait for the SMTP server
-    background_tasks.add_task(email_sender.send_forgot_password_email, email=email, temp_password=temp_password)
+    # Queue the email so the user doesn't wait for the email provider
+    email_outbox.enqueue(db, "send_forgot_password_email", recipient=email, entity_id=email, version=temp_password, email=email, temp_password=temp_password)
     
     return {"message": "If this email exists, a temporary password has been sent."}
 
@@ -589,24 +647,36 @@ def change_current_user_password(
 
 @app.get("/api/admin/teachers/", response_model=list[schemas.TeacherWithStudents])
 def read_teachers(
+    request: Request,
     skip: int = 0, 
     limit: int = 100, 
+    fields: Optional[str] = None,
     db: Session = Depends(get_db),
     # The type hint here is now a database model, not a dictionary
     current_admin: models.User = Depends(get_current_admin)
 ):
     """
     Retrieves a list of teachers, filtered by the logged-in admin's gender.
-    Supreme admins get all teachers.
+    Supreme admins get all teachers. `fields=name,email` returns only those keys (and id).
     """
+    selected = serializers.parse_fields(schemas.TeacherWithStudents, fields)
+    # Normal admins get a gender-filtered list, so the ETag is scoped to it
+    scope = "all" if current_admin.role == "supreme-admin" else current_admin.gender
+    etag = _versioned_etag(request, db, (crud.TEACHERS, crud.STUDENTS, crud.SCHEDULES), scope)
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
     if current_admin.role == "supreme-admin":
         # Supreme admin sees all teachers
-        teachers = crud.get_teachers(db, skip=skip, limit=limit)
+        teachers = crud.get_teachers(db, skip=skip, limit=limit, fields=selected)
     else:
         # Normal admins only see teachers of the same gender
-        teachers = crud.get_teachers_by_gender(db, gender=current_admin.gender, skip=skip, limit=limit)
+        teachers = crud.get_teachers_by_gender(db, gender=current_admin.gender, skip=skip, limit=limit, fields=selected)
     
-    return teachers
+    # Serialized straight to JSON bytes (response_model is kept for the OpenAPI docs)
+    response = serializers.respond(serializers.list_adapter(schemas.TeacherWithStudents, selected), teachers)
+    response.headers.update({"ETag": etag, "Cache-Control": VERSIONED_CACHE_CONTROL})
+    return response
 
 @app.post("/api/admin/teachers/", response_model=schemas.Teacher, status_code=201)
 async def create_new_teacher(
@@ -617,15 +687,10 @@ async def create_new_teacher(
     gender: str = Form(...),
     db: Session = Depends(get_db),
     current_admin: dict = Depends(get_current_admin),
-    background_tasks: BackgroundTasks = None,
     whatsapp_number: Optional[str] = Form(None),
     photo: Optional[UploadFile] = File(None),
     cv: Optional[UploadFile] = File(None)
 ):
-    # Initialize background tasks if not provided
-    if background_tasks is None:
-        background_tasks = BackgroundTasks()
-    
     if current_admin.role != "supreme-admin":
         raise HTTPException(status_code=403, detail="Forbidden: Not enough permissions.")
     
@@ -638,10 +703,10 @@ async def create_new_teacher(
     cv_url = None
     
     if photo:
-        photo_url = await file_handler.save_teacher_photo(photo)
+        photo_url = await file_handler.save_teacher_photo(db, photo, owner=email)
     
     if cv:
-        cv_url = await file_handler.save_teacher_cv(cv)
+        cv_url = await file_handler.save_teacher_cv(db, cv, owner=email)
     
     # Create teacher data object
     teacher_data = schemas.TeacherCreate(
@@ -658,8 +723,8 @@ async def create_new_teacher(
     alphabet = string.ascii_letters + string.digits
     temp_password = ''.join(secrets.choice(alphabet) for i in range(10))
     new_teacher = crud.create_teacher(db=db, teacher=teacher_data, password=temp_password)
-    background_tasks.add_task(email_sender.send_teacher_credentials_email, teacher_data=schemas.Teacher.from_orm(new_teacher).model_dump(), temp_password=temp_password)
-    background_tasks.add_task(email_sender.send_teacher_credentials_email, teacher_data=schemas.Teacher.from_orm(new_teacher).model_dump(), temp_password=temp_password)
+    teacher_dict = schemas.Teacher.model_validate(new_teacher).model_dump(mode="json")
+    email_outbox.enqueue(db, "send_teacher_credentials_email", recipient=new_teacher.email, entity_id=new_teacher.id, version=temp_password, teacher_data=teacher_dict, temp_password=temp_password)
     return new_teacher
 
 @app.patch("/api/admin/teachers/{teacher_id}", response_model=schemas.Teacher)
@@ -693,27 +758,26 @@ async def update_teacher_details(
 
     # Handle Photo Re-upload
     if photo:
-        # Delete old photo if exists
-        if db_teacher.profile_photo_url:
-            file_handler.delete_teacher_photo(db_teacher.profile_photo_url)
-        # Upload new photo
-        new_photo_url = await file_handler.save_teacher_photo(photo)
+        # Upload new photo first, so a rejected upload keeps the old one
+        new_photo_url = await file_handler.save_teacher_photo(db, photo, owner=db_teacher.email)
         if new_photo_url:
             update_data['profile_photo_url'] = new_photo_url
 
     # Handle CV Re-upload
     if cv:
-        # Delete old CV if exists
-        if db_teacher.cv_url:
-            file_handler.delete_teacher_cv(db_teacher.cv_url)
-        # Upload new CV
-        new_cv_url = await file_handler.save_teacher_cv(cv)
+        # Upload new CV first, so a rejected upload keeps the old one
+        new_cv_url = await file_handler.save_teacher_cv(db, cv, owner=db_teacher.email)
         if new_cv_url:
             update_data['cv_url'] = new_cv_url
 
     if not update_data and not photo and not cv:
         return db_teacher # Nothing to update
 
+    # Release old files if exist, once the update commits (only deleted when no other row shares them)
+    if 'profile_photo_url' in update_data:
+        file_handler.delete_teacher_photo(db, db_teacher.profile_photo_url)
+    if 'cv_url' in update_data:
+        file_handler.delete_teacher_cv(db, db_teacher.cv_url)
     updated_teacher = crud.update_teacher(db=db, teacher_id=teacher_id, teacher_update_data=update_data)
     return updated_teacher
 
@@ -725,14 +789,13 @@ def delete_a_teacher(teacher_id: int, db: Session = Depends(get_db), current_adm
     if db_teacher is None:
         raise HTTPException(status_code=404, detail="Teacher not found.")
     
-    # Delete associated files if they exist
-    if db_teacher.profile_photo_url:
-        file_handler.delete_teacher_photo(db_teacher.profile_photo_url)
-    if db_teacher.cv_url:
-        file_handler.delete_teacher_cv(db_teacher.cv_url)
-    
+    # Release associated files if they exist, once the delete commits (kept while another row shares them)
+    file_handler.delete_teacher_photo(db, db_teacher.profile_photo_url)
+    file_handler.delete_teacher_cv(db, db_teacher.cv_url)
+
+    deleted_teacher = schemas.Teacher.model_validate(db_teacher)
     crud.delete_teacher(db=db, teacher_id=teacher_id)
-    return db_teacher
+    return deleted_teacher
 
 @app.get("/api/teacher/me", response_model=schemas.TeacherWithStudents)
 def get_teacher_me(
@@ -749,16 +812,22 @@ def get_teacher_me(
 # --- Student Endpoints ---
 
 @app.get("/api/admin/students/", response_model=list[schemas.Application])
-def read_students(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_admin: dict = Depends(get_current_admin)):
-    students = crud.get_applications(db, skip=skip, limit=limit)
+def read_students(request: Request, skip: int = 0, limit: int = 100, fields: Optional[str] = None, db: Session = Depends(get_db), current_admin: dict = Depends(get_current_admin)):
+    selected = serializers.parse_fields(schemas.Application, fields)
+    etag = _versioned_etag(request, db, (crud.STUDENTS, crud.TEACHERS, crud.SCHEDULES))
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    students = crud.get_applications(db, skip=skip, limit=limit, fields=selected)
     #for student in students:
         #print(f"DEBUG: Student ID {student.id}, Teacher Object: {student.teacher}")
-    return students
+    response = serializers.respond(serializers.list_adapter(schemas.Application, selected), students)
+    response.headers.update({"ETag": etag, "Cache-Control": VERSIONED_CACHE_CONTROL})
+    return response
 
 @app.post("/api/admin/add-student/", response_model=schemas.Application, status_code=201)
 def add_student_by_admin(
     application: schemas.ApplicationCreate, 
-    background_tasks: BackgroundTasks,  # Add this
     db: Session = Depends(get_db), 
     current_admin: dict = Depends(get_current_admin)
 ):
@@ -770,13 +839,13 @@ def add_student_by_admin(
     # Save the student to the database
     new_student = crud.create_application(db=db, application=application)
     
-    # Send the "Admitted" email in the background
+    # Queue the "Admitted" email
     student_dict = {
         "email": new_student.email,
         "first_name": new_student.first_name,
         "preferred_course": new_student.preferred_course
     }
-    background_tasks.add_task(email_sender.send_manual_admission_email, student_data=student_dict)
+    email_outbox.enqueue(db, "send_manual_admission_email", recipient=new_student.email, entity_id=new_student.id, student_data=student_dict)
     
     return new_student
 
@@ -791,6 +860,99 @@ def assign_student(student_id: int, assignment: schemas.StudentAssign, db: Sessi
     updated_student = crud.assign_teacher_and_shift(db=db, student_id=student_id, teacher_id=assignment.teacher_id, shift=assignment.shift)
     return updated_student
 
+@app.post("/api/admin/students/auto-assign", response_model=schemas.AutoAssignResult)
+def auto_assign_students(request: schemas.AutoAssignRequest, db: Session = Depends(get_db), current_admin: dict = Depends(get_current_admin)):
+    """
+    Assigns all unassigned Approved/Pending students in one go.
+    Send dry_run=true first to preview the diff, then dry_run=false to save it.
+    """
+    if current_admin.role not in ["admin", "supreme-admin"]:
+        raise HTTPException(status_code=403, detail="Forbidden: Not enough permissions.")
+
+    # Same rule as read_teachers: normal admins only handle their own gender
+    gender = None if current_admin.role == "supreme-admin" else current_admin.gender
+    return crud.auto_assign_students(db, capacity=request.capacity, gender=gender, shift=request.shift, dry_run=request.dry_run)
+
+@app.post("/api/admin/students/bulk", response_model=schemas.StudentBulkResult)
+def bulk_student_action(request: schemas.StudentBulkAction, db: Session = Depends(get_db), current_admin: dict = Depends(get_current_admin)):
+    """
+    Runs one action ('assign', 'status', 'archive' or 'delete') on many students in a single statement
+    ('archive' keeps the attendance history; see crud.archive_applications).
+    Unknown ids are reported per-id instead of failing the whole batch.
+    """
+    if current_admin.role not in ["admin", "supreme-admin"]:
+        raise HTTPException(status_code=403, detail="Forbidden: Not enough permissions.")
+
+    if request.action == "assign":
+        if request.teacher_id is None or not request.shift:
+            raise HTTPException(status_code=400, detail="teacher_id and shift are required for 'assign'.")
+        if not crud.get_teacher(db, teacher_id=request.teacher_id):
+            raise HTTPException(status_code=404, detail="Teacher not found.")
+    elif request.action == "status":
+        if request.status not in crud.STUDENT_STATUSES:
+            raise HTTPException(status_code=400, detail=f"status must be one of {crud.STUDENT_STATUSES}.")
+
+    ids = list(dict.fromkeys(request.ids)) # De-duplicate, keep order
+    found = crud.get_existing_application_ids(db, ids)
+    targets = [i for i in ids if i in found]
+
+    affected = 0
+    if targets:
+        if request.action == "assign":
+            affected = crud.bulk_assign_teacher_and_shift(db, targets, teacher_id=request.teacher_id, shift=request.shift)
+        elif request.action == "status":
+            affected = crud.bulk_update_status(db, targets, status=request.status)
+        elif request.action == "archive":
+            affected = crud.archive_applications(db, targets)
+        else:
+            affected = crud.delete_applications(db, targets)
+
+    results = [
+        {"id": i, "ok": i in found, "detail": None if i in found else "Student not found."}
+        for i in ids
+    ]
+    return {"action": request.action, "affected": affected, "results": results}
+
+@app.post("/api/admin/announcements/", response_model=schemas.AnnouncementJob, status_code=202)
+def create_announcement(announcement: schemas.AnnouncementCreate, db: Session = Depends(get_db), current_admin: dict = Depends(get_current_admin)):
+    """
+    Queues an announcement to every student matching the filters (course, shift, teacher, status).
+    The email worker sends it in paced batches; poll GET /api/admin/announcements/{id} for progress.
+    """
+    if current_admin.role not in ["admin", "supreme-admin"]:
+        raise HTTPException(status_code=403, detail="Forbidden: Not enough permissions.")
+    if announcement.teacher_id is not None and not crud.get_teacher(db, teacher_id=announcement.teacher_id):
+        raise HTTPException(status_code=404, detail="Teacher not found.")
+
+    # Normal admins only reach students of their own gender
+    gender = None if current_admin.role == "supreme-admin" else current_admin.gender
+    try:
+        return announcements.create_job(db, announcement, created_by=current_admin.email, gender=gender)
+    except TemplateError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid announcement template: {e}")
+
+@app.get("/api/admin/announcements/", response_model=List[schemas.AnnouncementJob])
+def read_announcements(skip: int = 0, limit: int = 50, db: Session = Depends(get_db), current_admin: dict = Depends(get_current_admin)):
+    if current_admin.role not in ["admin", "supreme-admin"]:
+        raise HTTPException(status_code=403, detail="Forbidden: Not enough permissions.")
+    return db.query(models.AnnouncementJob).order_by(models.AnnouncementJob.id.desc()).offset(skip).limit(limit).all()
+
+@app.get("/api/admin/announcements/{job_id}", response_model=schemas.AnnouncementJob)
+def read_announcement(job_id: int, db: Session = Depends(get_db), current_admin: dict = Depends(get_current_admin)):
+    if current_admin.role not in ["admin", "supreme-admin"]:
+        raise HTTPException(status_code=403, detail="Forbidden: Not enough permissions.")
+    job = db.query(models.AnnouncementJob).filter(models.AnnouncementJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Announcement not found.")
+    return job
+
+@app.get("/api/admin/email-stats")
+def read_email_stats(db: Session = Depends(get_db), current_admin: dict = Depends(get_current_admin)):
+    """Outbox counts by status, plus emails dropped as duplicates by their idempotency key."""
+    if current_admin.role != "supreme-admin":
+        raise HTTPException(status_code=403, detail="Forbidden: Not enough permissions.")
+    return email_outbox.get_stats(db)
+
 @app.delete("/api/admin/students/{student_id}", response_model=schemas.Application)
 def delete_student(student_id: int, db: Session = Depends(get_db), current_admin: dict = Depends(get_current_admin)):
     if current_admin.role not in ["admin", "supreme-admin"]:
@@ -799,14 +961,22 @@ def delete_student(student_id: int, db: Session = Depends(get_db), current_admin
     db_student = crud.get_application_by_id(db, application_id=student_id)
     if not db_student:
         raise HTTPException(status_code=404, detail="Student not found.")
-        
+
+    # Serialize before deleting: the children are removed by the database,
+    # so they cannot be lazy-loaded from the deleted row afterwards.
+    deleted_student = schemas.Application.model_validate(db_student)
     crud.delete_application(db=db, student_id=student_id)
-    return db_student
+    return deleted_student
 
 # --- Dashboard Stats Endpoint ---
 
 @app.get("/api/admin/dashboard-stats/")
-def get_dashboard_stats(db: Session = Depends(get_db), current_admin: dict = Depends(get_current_admin)):
+def get_dashboard_stats(request: Request, response: Response, db: Session = Depends(get_db), current_admin: dict = Depends(get_current_admin)):
+    etag = _versioned_etag(request, db, (crud.STUDENTS, crud.TEACHERS))
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    response.headers.update({"ETag": etag, "Cache-Control": VERSIONED_CACHE_CONTROL})
     total_students = db.query(models.Application).count()
     total_teachers = db.query(models.Teacher).count()
     unassigned_students = db.query(models.Application).filter(models.Application.teacher_id == None, models.Application.status == 'Approved').count()
@@ -892,14 +1062,9 @@ def read_session_attendance(
     Retrieves session attendance records for a teacher within a date range.
     e.g., /admin/session-attendance/?teacher_id=1&start_date=2025-10-26&end_date=2025-11-01
     """
-    session_attendances = db.query(models.Attendance).join(
-        models.Schedule, models.Attendance.schedule_id == models.Schedule.id
-    ).filter(
-        models.Schedule.teacher_id == teacher_id,
-        models.Attendance.class_date >= start_date,
-        models.Attendance.class_date <= end_date,
-        models.Attendance.schedule_id != None
-    ).all()
+    session_attendances = crud.get_session_attendance_for_teacher(
+        db=db, teacher_id=teacher_id, start_date=start_date, end_date=end_date
+    )
     return session_attendances
 
 @app.post("/api/admin/session-attendance/", response_model=schemas.Attendance, status_code=201)
@@ -940,6 +1105,8 @@ def update_session_attendance(
     """Updates an existing session attendance record."""
     db_attendance = db.query(models.Attendance).filter(models.Attendance.id == attendance_id).first()
     if not db_attendance:
+        if crud.get_archived_attendance(db, attendance_id):
+            raise HTTPException(status_code=409, detail="Archived attendance records are read-only.")
         raise HTTPException(status_code=404, detail="Attendance record not found.")
     
     return crud.update_attendance(
@@ -951,6 +1118,7 @@ def update_session_attendance(
 
 @app.get("/api/admin/attendance-count/", response_model=schemas.AttendanceStats)
 def get_attendance_count(
+    request: Request, response: Response,
     teacher_id: int, year: int, month: int, 
     db: Session=Depends(get_db), current_admin=Depends(get_current_admin)
 ):
@@ -959,6 +1127,11 @@ def get_attendance_count(
     'Quran Learning (Kayda)': {'Present': 5, 'Late': 0},
     'Quran Reading (Nazra)': {'Present': 7}
     """
+    etag = _versioned_etag(request, db, (crud.ATTENDANCE, crud.STUDENTS))
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    response.headers.update({"ETag": etag, "Cache-Control": VERSIONED_CACHE_CONTROL})
     return crud.get_attendance_count_by_month(db, teacher_id, year, month)
 
 # new api endpoints
@@ -1013,22 +1186,40 @@ def migrate_schedules_to_per_day(db: Session=Depends(get_db), current_admin=Depe
         schedule.day_of_week = days[0]
         migrated_count += 1
     
+    if migrated_count:
+        crud.bump_versions(db, crud.SCHEDULES)
     db.commit()
     return {"message": f"Successfully migrated {migrated_count} schedules into separate per-day records."}
 
 @app.get("/api/teacher/my-attendance-stats", response_model=schemas.AttendanceStats)
 def get_my_stats(
+    request: Request, response: Response,
     year: int, month: int, 
     db: Session=Depends(get_db), current_user=Depends(get_current_admin)
 ):
     """Teacher sees their own stats for the month."""
     if current_user.role != "teacher": raise HTTPException(403)
+    etag = _versioned_etag(request, db, (crud.ATTENDANCE, crud.STUDENTS), current_user.id)
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+    response.headers.update({"ETag": etag, "Cache-Control": VERSIONED_CACHE_CONTROL})
     return crud.get_attendance_count_by_month(db, current_user.id, year, month)
 
-# @app.get("/api/courses/", response_model=List[schemas.Course])
-# def read_courses(db: Session = Depends(get_db)):
-#     """Used by frontend dropdowns to show available courses."""
-#     return crud.get_courses(db)
+@app.get("/api/courses/", response_model=List[schemas.Course])
+def read_courses(request: Request, response: Response, db: Session = Depends(get_db)):
+    """
+    Used by frontend dropdowns to show available courses.
+    Served from the in-memory course registry; unchanged lists answer 304 via ETag.
+    """
+    courses = crud.get_courses(db)
+    etag = course_registry.registry.etag
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=300"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and file_serving.etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return courses
 
 # @app.post("/api/admin/courses/", response_model=schemas.Course, status_code=201)
 # def create_course(
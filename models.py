@@ -1,6 +1,6 @@
 # models.py
 
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Date, Time
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Date, Time, Index, Text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
@@ -50,15 +50,16 @@ class Application(Base):
     gender = Column(String)
     whatsapp_number = Column(String, nullable=True)
     shift = Column(String, nullable=True)
-    teacher_id = Column(Integer, ForeignKey("teachers.id"), nullable=True)
+    teacher_id = Column(Integer, ForeignKey("teachers.id", ondelete="SET NULL"), nullable=True)
     teacher = relationship("Teacher", back_populates="students")
     course= relationship("Course", back_populates="applications")
-    attendances = relationship("Attendance", back_populates="student")
     # Timestamps are handled automatically by the database
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    attendances = relationship("Attendance", back_populates="student", cascade="all, delete-orphan")
-    schedules = relationship("Schedule", back_populates="student", cascade="all, delete-orphan")
+    # passive_deletes: the database removes children via ON DELETE CASCADE,
+    # so deleting a student never loads years of attendance into memory.
+    attendances = relationship("Attendance", back_populates="student", cascade="all, delete-orphan", passive_deletes=True)
+    schedules = relationship("Schedule", back_populates="student", cascade="all, delete-orphan", passive_deletes=True)
 
 class User(Base):
     """
@@ -95,22 +96,26 @@ class Teacher(Base):
     profile_photo_url = Column(String, nullable=True)
     cv_url = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    students = relationship("Application", back_populates="teacher")
-    attendances = relationship("Attendance", back_populates="teacher")
-    schedules = relationship("Schedule", back_populates="teacher")
+    students = relationship("Application", back_populates="teacher", passive_deletes=True)
+    attendances = relationship("Attendance", back_populates="teacher", cascade="all", passive_deletes=True)
+    schedules = relationship("Schedule", back_populates="teacher", cascade="all", passive_deletes=True)
 
 class Attendance(Base):
     __tablename__ = "attendances"
+    # Archived rows keep their id, so ids must never be reused (SQLite reuses
+    # the highest rowid without AUTOINCREMENT; Postgres sequences never do)
+    __table_args__ = {"sqlite_autoincrement": True}
+    archived = False # Rows read from attendances_archive are read-only
 
     id = Column(Integer, primary_key=True, index=True)
     class_date = Column(Date, nullable=False)
     status = Column(String, nullable=False)  # e.g., 'Present', 'Absent', 'Late' (student status)
     teacher_status = Column(String, nullable=True)  # e.g., 'Present', 'Absent', 'Late' (teacher status)
-    schedule_id = Column(Integer, ForeignKey("schedules.id"), nullable=True)  # For session-based attendance
+    schedule_id = Column(Integer, ForeignKey("schedules.id", ondelete="SET NULL"), nullable=True)  # For session-based attendance
     notes = Column(String, nullable=True)
 
-    student_id = Column(Integer, ForeignKey("applications.id"), nullable=False)
-    teacher_id = Column(Integer, ForeignKey("teachers.id"), nullable=False)
+    student_id = Column(Integer, ForeignKey("applications.id", ondelete="CASCADE"), nullable=False)
+    teacher_id = Column(Integer, ForeignKey("teachers.id", ondelete="CASCADE"), nullable=False)
 
     student = relationship("Application", back_populates="attendances")
     teacher = relationship("Teacher", back_populates="attendances")
@@ -118,6 +123,40 @@ class Attendance(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+class AttendanceArchive(Base):
+    """
+    Cold storage for attendance older than the archival horizon (see archive_attendance.py).
+    Same columns as 'attendances'; rows keep their original id.
+    On Postgres the table is range-partitioned by month on class_date,
+    so a date-range read only scans the partitions it needs.
+    """
+    __tablename__ = "attendances_archive"
+    __table_args__ = (
+        Index("ix_attendances_archive_teacher_date", "teacher_id", "class_date"),
+        Index("ix_attendances_archive_student_date", "student_id", "class_date"),
+        Index("ix_attendances_archive_class_date", "class_date"), # max(class_date): the archive watermark
+        {"postgresql_partition_by": "RANGE (class_date)"},
+    )
+    archived = True
+
+    # Postgres requires the partition key to be part of the primary key
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    class_date = Column(Date, primary_key=True)
+    status = Column(String, nullable=False)
+    teacher_status = Column(String, nullable=True)
+    schedule_id = Column(Integer, ForeignKey("schedules.id", ondelete="SET NULL"), nullable=True, index=True)
+    notes = Column(String, nullable=True)
+
+    student_id = Column(Integer, ForeignKey("applications.id", ondelete="CASCADE"), nullable=False)
+    teacher_id = Column(Integer, ForeignKey("teachers.id", ondelete="CASCADE"), nullable=False)
+
+    student = relationship("Application", viewonly=True)
+    teacher = relationship("Teacher", viewonly=True)
+
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class Schedule(Base):
     __tablename__ = "schedules"
 
@@ -127,8 +166,130 @@ class Schedule(Base):
     end_time = Column(Time, nullable=False)
     zoom_link = Column(String, nullable=True)
 
-    student_id = Column(Integer, ForeignKey("applications.id"), nullable=False)
-    teacher_id = Column(Integer, ForeignKey("teachers.id"), nullable=False)
+    student_id = Column(Integer, ForeignKey("applications.id", ondelete="CASCADE"), nullable=False)
+    teacher_id = Column(Integer, ForeignKey("teachers.id", ondelete="CASCADE"), nullable=False)
 
     student = relationship("Application", back_populates="schedules")
     teacher = relationship("Teacher", back_populates="schedules")
+
+class EmailOutbox(Base):
+    """
+    Persistent queue of outgoing emails. Request handlers insert a row;
+    email_worker.py claims, sends and retries them in a separate process.
+    """
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False) # email_sender function, e.g. 'send_student_confirmation'
+    recipient = Column(String, nullable=True)
+    payload = Column(Text, nullable=True) # JSON keyword arguments; cleared once sent
+    status = Column(String, nullable=False, default="pending") # 'pending', 'sending', 'sent', 'failed'
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class AdminDigestItem(Base):
+    """
+    New applications waiting to be summarized in the next admin digest email
+    (ADMIN_NOTIFICATION_MODE=digest). Rows are deleted when the digest is queued.
+    """
+    __tablename__ = "admin_digest_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    payload = Column(Text, nullable=False) # JSON application data, as for send_admin_notification
+    created_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class AnnouncementJob(Base):
+    """
+    A bulk announcement to a group of students. The recipients are selected
+    once when the job is created; email_worker.py sends them in batches and
+    advances `cursor` so progress survives restarts.
+    """
+    __tablename__ = "announcement_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False) # Sandboxed Jinja template, e.g. "Dear {{ first_name }}, ..."
+    audience = Column(Text, nullable=True) # JSON filters used to pick the recipients
+    recipients = Column(Text, nullable=True) # JSON [{email, name, context}]; cleared when done
+    status = Column(String, nullable=False, default="pending") # 'pending', 'running', 'done', 'failed'
+    total_recipients = Column(Integer, nullable=False, default=0)
+    cursor = Column(Integer, nullable=False, default=0) # Index of the next recipient to send
+    sent_count = Column(Integer, nullable=False, default=0)
+    failed_count = Column(Integer, nullable=False, default=0)
+    batch_attempts = Column(Integer, nullable=False, default=0)
+    next_run_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    last_error = Column(String, nullable=True)
+    created_by = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class EmailDispatchKey(Base):
+    """
+    Idempotency keys for queued emails: sha256 of (kind, recipient, entity id, version).
+    A second enqueue with a live key is dropped; keys expire after EMAIL_IDEMPOTENCY_TTL_SECONDS.
+    """
+    __tablename__ = "email_dispatch_keys"
+
+    key = Column(String(64), primary_key=True)
+    kind = Column(String, nullable=False)
+    duplicates = Column(Integer, nullable=False, default=0) # Suppressed re-sends, reported as a metric
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class SheetSyncState(Base):
+    """
+    Bookkeeping for sheets_sync.py: the high-water mark of the last run and a
+    snapshot of which sheet row holds which application (with a hash of what
+    was written), so each run only pushes changed rows.
+    """
+    __tablename__ = "sheet_sync_state"
+
+    name = Column(String, primary_key=True) # e.g. 'applications'
+    high_water_mark = Column(DateTime(timezone=True), nullable=True) # max(updated_at, created_at) already pushed
+    snapshot = Column(Text, nullable=True) # JSON {application_id: [row, hash, status]}
+    next_row = Column(Integer, nullable=False, default=2) # Row 1 is the header
+    last_run_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class UploadManifest(Base):
+    """
+    One row per stored upload (keys are content-addressed, so a file shared by
+    several users/teachers has one row). Written by file_handler on save and
+    removed when the file is deleted; storage stats are aggregated from here
+    instead of walking the upload directories.
+    """
+    __tablename__ = "upload_manifest"
+
+    key = Column(String, primary_key=True) # e.g. 'teacher_cvs/<sha256>.pdf'
+    kind = Column(String, nullable=False, index=True) # teacher_photos, teacher_cvs, admin_photos, admin_cvs
+    size_bytes = Column(Integer, nullable=False)
+    digest = Column(String(64), nullable=False)
+    owner = Column(String, nullable=True) # Email of the account it was first uploaded for
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Set whenever the same content is uploaded again. The upload GC's grace period
+    # also counts from here, so the stored file itself is never touched (variants
+    # and ETags are keyed on its mtime)
+    reuploaded_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class ResourceVersion(Base):
+    """
+    A counter per cached resource ('students', 'teachers', ...), bumped in the
+    same transaction as every crud write to it. List and stats endpoints derive
+    their ETags from these, so an unchanged view is answered with a 304 after
+    one small lookup instead of re-running its queries.
+    """
+    __tablename__ = "resource_versions"
+
+    resource = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
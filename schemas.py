@@ -1,7 +1,7 @@
 # schemas.py
 
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime, date, time
 
 # --- Course Schemas (New) ---
@@ -114,6 +114,7 @@ class Attendance(AttendanceBase):
     id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
+    archived: bool = False # Moved to cold storage; read-only
 
     class Config:
         from_attributes = True
@@ -174,7 +175,71 @@ class AttendanceStats(BaseModel):
 class StudentAssign(BaseModel):
     teacher_id: int
     shift: str
+
+class StudentBulkAction(BaseModel):
+    ids: List[int] = Field(..., min_length=1)
+    action: Literal["assign", "status", "archive", "delete"]
+    teacher_id: Optional[int] = None # Required for 'assign'
+    shift: Optional[str] = None # Required for 'assign'
+    status: Optional[str] = None # Required for 'status'
+
+class BulkItemResult(BaseModel):
+    id: int
+    ok: bool
+    detail: Optional[str] = None
+
+class StudentBulkResult(BaseModel):
+    action: str
+    affected: int
+    results: List[BulkItemResult]
+
+class AutoAssignRequest(BaseModel):
+    capacity: int = Field(..., gt=0) # Max students per teacher, counting existing ones
+    shift: Optional[str] = None # Only fill this shift
+    dry_run: bool = True # Preview the diff without saving it
+
+class AutoAssignment(BaseModel):
+    student_id: int
+    student_name: str
+    teacher_id: int
+    teacher_name: str
+    shift: Optional[str] = None
+    previous_status: Optional[str] = None
+
+class AutoAssignSkipped(BaseModel):
+    student_id: int
+    student_name: str
+    reason: str
+
+class AutoAssignResult(BaseModel):
+    dry_run: bool
+    capacity: int
+    assignments: List[AutoAssignment] = []
+    unassigned: List[AutoAssignSkipped] = []
     
+class AnnouncementCreate(BaseModel):
+    subject: str = Field(..., min_length=1, max_length=200)
+    body: str = Field(..., min_length=1) # Plain text; may use {{ first_name }}, {{ course }}, {{ shift }}, {{ teacher }}...
+    course_id: Optional[int] = None
+    shift: Optional[str] = None
+    teacher_id: Optional[int] = None
+    status: Optional[str] = "Approved" # Student status to include; None for every status
+
+class AnnouncementJob(BaseModel):
+    id: int
+    subject: str
+    status: str
+    total_recipients: int
+    sent_count: int
+    failed_count: int
+    last_error: Optional[str] = None
+    created_by: Optional[str] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 class PasswordUpdate(BaseModel):
     current_password: str
     new_password: str
@@ -0,0 +1,100 @@
+# serializers.py
+
+import typing
+from functools import lru_cache
+from typing import Optional
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ConfigDict, EmailStr, TypeAdapter, create_model
+import schemas
+
+# Fast path for large list responses. FastAPI's default route validates the
+# returned ORM rows against response_model, turns the result into Python dicts,
+# runs jsonable_encoder over them and json.dumps the lot. Here a TypeAdapter built
+# once at import reads the rows with from_attributes and pydantic-core writes
+# JSON bytes directly; ORJSONResponse sends those bytes untouched.
+#
+# The adapters use read-only copies of the response schemas in which EmailStr
+# is a plain str: addresses were validated when they were written, and
+# re-running email-validator on every row was most of the serialization time.
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON encoded with orjson. Bytes (from a precompiled serializer) are sent as they are."""
+
+    def render(self, content) -> bytes:
+        if isinstance(content, (bytes, bytearray)):
+            return bytes(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+_output_models = {}
+
+
+def _output_type(tp):
+    if tp is EmailStr:
+        return str
+    if isinstance(tp, type) and issubclass(tp, BaseModel):
+        return output_model(tp)
+    args = typing.get_args(tp)
+    if not args:
+        return tp
+    origin = typing.get_origin(tp)
+    if origin is typing.Union:
+        return typing.Union[tuple(_output_type(arg) for arg in args)]
+    return origin[tuple(_output_type(arg) for arg in args)]
+
+
+def output_model(model: type[BaseModel]) -> type[BaseModel]:
+    """Copy of a response schema (and its nested schemas) that reads ORM rows without re-validating emails."""
+    if model not in _output_models:
+        fields = {name: (_output_type(info.annotation), info) for name, info in model.model_fields.items()}
+        _output_models[model] = create_model(
+            f"{model.__name__}Out", __config__=ConfigDict(from_attributes=True), **fields,
+        )
+    return _output_models[model]
+
+
+# --- Sparse Fieldsets ---
+# `?fields=id,first_name,teacher` on a listing returns only those keys. The
+# matching schema (a subset of the full one) and its adapter are built on
+# first use and cached per field set; "id" is always included.
+
+def parse_fields(model: type[BaseModel], fields: Optional[str]) -> Optional[frozenset]:
+    """Parses a comma-separated `fields` parameter. None means all fields. Raises 400 for unknown names."""
+    if not fields:
+        return None
+    selected = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = selected - set(model.model_fields)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(model.model_fields)}.")
+    return frozenset(selected | {"id"})
+
+
+@lru_cache(maxsize=256)
+def list_adapter(model: type[BaseModel], fields: Optional[frozenset] = None) -> TypeAdapter:
+    """TypeAdapter for a list of `model`, restricted to `fields` when given."""
+    full = output_model(model)
+    if fields is None:
+        return TypeAdapter(list[full])
+    sparse = create_model(
+        f"{full.__name__}Sparse", __config__=ConfigDict(from_attributes=True),
+        **{name: (info.annotation, info) for name, info in full.model_fields.items() if name in fields},
+    )
+    return TypeAdapter(list[sparse])
+
+
+# --- Precompiled serializers (one per list response model) ---
+students = list_adapter(schemas.Application)
+teachers = list_adapter(schemas.TeacherWithStudents)
+users = list_adapter(schemas.User)
+
+
+def dump(adapter: TypeAdapter, rows) -> bytes:
+    """Validates ORM rows against the adapter's model and returns the JSON bytes."""
+    return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+
+def respond(adapter: TypeAdapter, rows) -> ORJSONResponse:
+    return ORJSONResponse(dump(adapter, rows))
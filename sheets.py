@@ -1,10 +1,10 @@
 # sheets.py
 
 import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime
-import json
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 # Load environment variables from a .env file
@@ -21,70 +21,168 @@ CREDS_FILE = 'credentials.json'
 SHEET_ID = os.getenv("GOOGLE_SHEET_ID")
 WORKSHEET_NAME = 'Sheet1'
 
+# Buffered appends: rows are written with one append_rows call once
+# SHEETS_BATCH_SIZE rows are waiting or the oldest has waited SHEETS_FLUSH_SECONDS.
+SHEETS_BATCH_SIZE = int(os.getenv("SHEETS_BATCH_SIZE", "20"))
+SHEETS_FLUSH_SECONDS = float(os.getenv("SHEETS_FLUSH_SECONDS", "10"))
+SHEETS_MAX_BUFFER = int(os.getenv("SHEETS_MAX_BUFFER", "5000")) # Oldest rows are dropped beyond this if Google is down
 
-def append_to_sheet(application_data: dict):
+
+# --- Long-lived Client ---
+# gspread.service_account() uses google-auth credentials, which refresh the
+# access token by themselves, so the client, spreadsheet and worksheet are
+# opened once per process and reused.
+_lock = threading.Lock()
+_client = None
+_worksheets = {}
+
+
+def get_worksheet(name: str = WORKSHEET_NAME):
+    """Returns the cached worksheet, authorizing and opening it on first use."""
+    global _client
+    with _lock:
+        if name not in _worksheets:
+            if _client is None:
+                _client = gspread.service_account(filename=CREDS_FILE, scopes=SCOPE)
+            print(f"--- [SHEETS] Opening worksheet '{name}' of sheet {SHEET_ID} ---")
+            _worksheets[name] = _client.open_by_key(SHEET_ID).worksheet(name)
+        return _worksheets[name]
+
+
+def reset_client():
+    """Forgets the cached client and worksheets so the next call reconnects (e.g. after a rename)."""
+    global _client
+    with _lock:
+        _client = None
+        _worksheets.clear()
+
+
+def application_row(application_data: dict):
+    """Builds the sheet row for an application. Matches the order of columns in the Google Sheet."""
+    return [
+        application_data.get('id', ''),
+        str(application_data.get('created_at') or datetime.now()),
+        application_data.get('first_name', ''),
+        application_data.get('last_name', ''),
+        application_data.get('gender', ''),
+        application_data.get('age', ''),
+        application_data.get('email', ''),
+        application_data.get('phone_number', ''),
+        application_data.get('whatsapp_number', ''),
+        application_data.get('country', ''),
+        application_data.get('parent_name', ''),
+        application_data.get('relationship_with_student', application_data.get('relationship', '')),
+        application_data.get('preferred_course', ''),
+        application_data.get('previous_experience', ''),
+        application_data.get('learning_goals', '')
+    ]
+
+
+class SheetAppender:
     """
-    Appends a new row with application data to the Google Sheet.
+    Background thread that batches rows into append_rows calls.
+    add() only puts the row in memory; a failed flush keeps the rows and retries.
     """
-    # --- STEP 1: ADD MORE LOGGING ---
-    print("--- [SHEETS] Task started. ---")
 
+    def __init__(self, worksheet_fn=get_worksheet, batch_size: int = SHEETS_BATCH_SIZE,
+                 flush_seconds: float = SHEETS_FLUSH_SECONDS, max_buffer: int = SHEETS_MAX_BUFFER):
+        self.worksheet_fn = worksheet_fn
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_buffer = max_buffer
+        self._rows = []
+        self._oldest = None
+        self._retry_at = 0.0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.stats = {"buffered": 0, "appended": 0, "flushes": 0, "errors": 0, "dropped": 0}
+
+    def add(self, row: list):
+        with self._cond:
+            if len(self._rows) >= self.max_buffer:
+                self._rows.pop(0)
+                self.stats["dropped"] += 1
+            self._rows.append(row)
+            self._oldest = self._oldest or time.monotonic()
+            self.stats["buffered"] = len(self._rows)
+            if len(self._rows) >= self.batch_size:
+                self._cond.notify()
+
+    def _due(self):
+        if not self._rows:
+            return False
+        if not self._stopping and time.monotonic() < self._retry_at:
+            return False # Back off after a failed flush
+        if self._stopping or len(self._rows) >= self.batch_size:
+            return True
+        return self._oldest is not None and time.monotonic() - self._oldest >= self.flush_seconds
+
+    def flush(self):
+        """Writes everything buffered with one append_rows call. Returns the number of rows written."""
+        with self._cond:
+            rows, oldest = self._rows, self._oldest
+            self._rows, self._oldest = [], None
+        if not rows:
+            return 0
+        try:
+            self.worksheet_fn().append_rows(rows, value_input_option="USER_ENTERED")
+        except Exception as e:
+            print(f"--- [SHEETS] Append of {len(rows)} rows failed, will retry: {e} ---")
+            if isinstance(e, gspread.exceptions.WorksheetNotFound):
+                reset_client()
+            with self._cond:
+                self._rows = (rows + self._rows)[-self.max_buffer:]
+                # The re-buffered rows are older than anything added meanwhile
+                self._oldest = oldest if self._oldest is None else min(oldest, self._oldest)
+                self._retry_at = time.monotonic() + self.flush_seconds
+                self.stats["errors"] += 1
+                self.stats["buffered"] = len(self._rows)
+            return 0
+        with self._cond:
+            self.stats["appended"] += len(rows)
+            self.stats["flushes"] += 1
+            self.stats["buffered"] = len(self._rows)
+        print(f"--- [SHEETS] Appended {len(rows)} rows ---")
+        return len(rows)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._due() and not self._stopping:
+                    self._cond.wait(timeout=self.flush_seconds)
+                stopping = self._stopping
+            self.flush()
+            if stopping:
+                return
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="sheets-appender", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """Flushes what is left and stops the thread."""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        self._thread = None
+
+
+appender = SheetAppender()
+
+
+def append_to_sheet(application_data: dict):
+    """
+    Queues a new row with application data for the Google Sheet.
+    The row is written by the background appender (started on app startup).
+    """
     if not SHEET_ID:
         print("--- [SHEETS] ERROR: GOOGLE_SHEET_ID not found in environment variables. Cannot write to sheet.")
         return False
-
-    print(f"--- [SHEETS] Using Sheet ID: {SHEET_ID}")
-
-    try:
-        print("--- [SHEETS] Attempting to authorize with credentials...")
-        creds = ServiceAccountCredentials.from_json_keyfile_name(CREDS_FILE, SCOPE)
-        client = gspread.authorize(creds)
-        print("--- [SHEETS] Authorization successful.")
-
-        print("--- [SHEETS] Opening spreadsheet by key...")
-        spreadsheet = client.open_by_key(SHEET_ID)
-        print("--- [SHEETS] Spreadsheet opened successfully.")
-
-        print(f"--- [SHEETS] Opening worksheet: {WORKSHEET_NAME}...")
-        worksheet = spreadsheet.worksheet(WORKSHEET_NAME)
-        print("--- [SHEETS] Worksheet opened successfully.")
-
-        # Match the order of columns in your Google Sheet
-        print("--- [SHEETS] Preparing row data...")
-        row = [
-            application_data.get('id', ''),
-            str(application_data.get('created_at', str(datetime.now()))),
-            application_data.get('first_name', ''),
-            application_data.get('last_name', ''),
-            application_data.get('gender', ''),
-            application_data.get('age', ''),
-            application_data.get('email', ''),
-            application_data.get('phone_number', ''),
-            application_data.get('whatsapp_number', ''),
-            application_data.get('country', ''),
-            application_data.get('parent_name', ''),
-            application_data.get('relationship', ''),
-            application_data.get('preferred_course', ''),
-            application_data.get('previous_experience', ''),
-            application_data.get('learning_goals', '')
-        ]
-        print(f"--- [SHEETS] Row data prepared: {row}")
-        
-        print("--- [SHEETS] Appending row to sheet...")
-        worksheet.append_row(row)
-        print(f"--- [SHEETS] SUCCESS: Successfully wrote application ID {application_data.get('id')} to Google Sheet.")
-        return True
-
-    # --- STEP 2: CATCH SPECIFIC ERRORS ---
-    except gspread.exceptions.SpreadsheetNotFound:
-        print(f"--- [SHEETS] FATAL ERROR: Spreadsheet not found. Check SHEET_ID and sharing permissions.")
-        return False
-    except gspread.exceptions.WorksheetNotFound:
-        print(f"--- [SHEETS] FATAL ERROR: Worksheet '{WORKSHEET_NAME}' not found.")
-        return False
-    except Exception as e:
-        # This will print the exact error message to our log
-        print(f"--- [SHEETS] A FATAL UNEXPECTED ERROR occurred: {e}")
-        # Also print the type of error for more detail
-        print(f"--- [SHEETS] Error Type: {type(e)}")
-        return False
+    appender.add(application_row(application_data))
+    return True
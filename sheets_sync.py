@@ -0,0 +1,186 @@
+# sheets_sync.py
+# Scheduled job: mirrors the 'applications' table into a worksheet the office
+# works from, and optionally pulls status edits made in the sheet back.
+#
+# Only rows changed since the last run (high-water mark on updated_at/created_at)
+# are compared, and only rows whose content differs from what was last written
+# are pushed, as one batched update of contiguous ranges.
+#
+# Run it from cron, e.g. every 5 minutes:
+#   python sheets_sync.py
+#   python sheets_sync.py --pull-status     # also apply Status edits from the sheet
+#   python sheets_sync.py --full            # re-read the sheet's ids and re-push everything
+
+import argparse
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from gspread.utils import rowcol_to_a1
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import crud
+import models
+import sheets
+from database import SessionLocal, engine
+
+SYNC_NAME = "applications"
+SHEETS_SYNC_WORKSHEET = os.getenv("SHEETS_SYNC_WORKSHEET", "Applications")
+SYNC_OVERLAP_SECONDS = int(os.getenv("SHEETS_SYNC_OVERLAP_SECONDS", "2"))
+
+# Same columns as the intake sheet (sheets.application_row), plus the fields the office edits
+HEADER = [
+    "ID", "Submitted At", "First Name", "Last Name", "Gender", "Age", "Email", "Phone Number",
+    "WhatsApp Number", "Country", "Parent Name", "Relationship", "Preferred Course",
+    "Previous Experience", "Learning Goals", "Status", "Shift",
+]
+STATUS_COL = HEADER.index("Status") + 1
+
+
+def _changed_at():
+    return func.coalesce(models.Application.updated_at, models.Application.created_at)
+
+
+def sync_row(application: models.Application):
+    """The sheet row for one application; None becomes an empty cell."""
+    data = {column.name: getattr(application, column.name) for column in models.Application.__table__.columns}
+    row = sheets.application_row(data) + [application.status, application.shift]
+    return ["" if value is None else value for value in row]
+
+
+def _row_hash(row: list) -> str:
+    return hashlib.sha1(json.dumps(row, default=str).encode()).hexdigest()
+
+
+def _ranges(rows: dict):
+    """Groups {row_number: values} into contiguous A1 ranges for batch_update."""
+    data, start, block = [], None, []
+    for number in sorted(rows):
+        if block and number != start + len(block):
+            data.append({"range": f"A{start}:{rowcol_to_a1(start + len(block) - 1, len(HEADER))}", "values": block})
+            block = []
+        if not block:
+            start = number
+        block.append(rows[number])
+    if block:
+        data.append({"range": f"A{start}:{rowcol_to_a1(start + len(block) - 1, len(HEADER))}", "values": block})
+    return data
+
+
+def _read_snapshot(worksheet):
+    """Rebuilds the row snapshot from the sheet's ID column (first run or --full)."""
+    snapshot = {}
+    ids = worksheet.col_values(1)
+    for number, value in enumerate(ids[1:], start=2):
+        if str(value).isdigit():
+            snapshot[str(value)] = [number, None, None]
+    return snapshot, max(len(ids) + 1, 2)
+
+
+def pull_status_edits(db: Session, worksheet, state: models.SheetSyncState, snapshot: dict):
+    """
+    Applies Status edits made in the sheet. An edit only wins if the application
+    was not changed in the database since the last sync; otherwise the next push
+    overwrites the sheet. Returns the number of applications updated.
+    """
+    column = worksheet.col_values(STATUS_COL)
+    edits = {}
+    for app_id, (number, _, pushed_status) in snapshot.items():
+        value = column[number - 1].strip() if number - 1 < len(column) else ""
+        if pushed_status is not None and value != pushed_status and value in crud.STUDENT_STATUSES:
+            edits[int(app_id)] = value
+    if not edits:
+        return 0
+
+    query = db.query(models.Application).filter(models.Application.id.in_(list(edits)))
+    if state.high_water_mark is not None:
+        query = query.filter(_changed_at() <= state.high_water_mark)
+    applied = 0
+    for application in query:
+        application.status = edits[application.id]
+        applied += 1
+    if applied:
+        crud.bump_versions(db, crud.STUDENTS)
+    db.commit()
+    return applied
+
+
+def run_sync(db: Session, worksheet, pull_status: bool = False, full: bool = False):
+    """Runs one incremental sync. Returns a dict of counts."""
+    state = db.get(models.SheetSyncState, SYNC_NAME)
+    if state is None:
+        state = models.SheetSyncState(name=SYNC_NAME, next_row=2)
+        db.add(state)
+    if full:
+        state.high_water_mark = None
+        state.snapshot = None
+
+    if state.snapshot is None:
+        snapshot, state.next_row = _read_snapshot(worksheet)
+    else:
+        snapshot = json.loads(state.snapshot)
+
+    pulled = pull_status_edits(db, worksheet, state, snapshot) if pull_status and snapshot else 0
+
+    query = db.query(models.Application)
+    if state.high_water_mark is not None:
+        # Re-check a small overlap so rows committed within the same second (timestamps
+        # are second-precision on some databases) are not missed; unchanged ones are skipped by hash
+        query = query.filter(_changed_at() >= state.high_water_mark - timedelta(seconds=SYNC_OVERLAP_SECONDS))
+    changed = query.order_by(models.Application.id).populate_existing().all()
+
+    updates, high_water_mark = {}, state.high_water_mark
+    for application in changed:
+        row = sync_row(application)
+        row_hash = _row_hash(row)
+        entry = snapshot.get(str(application.id))
+        if entry and entry[1] == row_hash:
+            continue
+        if entry is None:
+            entry = [state.next_row, None, None]
+            state.next_row += 1
+        entry[1], entry[2] = row_hash, application.status
+        snapshot[str(application.id)] = entry
+        updates[entry[0]] = row
+        stamp = application.updated_at or application.created_at
+        if stamp is not None and (high_water_mark is None or stamp > high_water_mark):
+            high_water_mark = stamp
+
+    # Rows of deleted applications are blanked (once the live ids are known, with one id-only query)
+    live_ids = {str(i) for (i,) in db.query(models.Application.id)}
+    for app_id in [i for i in snapshot if i not in live_ids]:
+        updates[snapshot.pop(app_id)[0]] = [""] * len(HEADER)
+
+    if state.high_water_mark is None:
+        updates.setdefault(1, HEADER) # First run (or --full): write the header too
+    if updates:
+        if state.next_row - 1 > worksheet.row_count:
+            worksheet.add_rows(state.next_row - 1 - worksheet.row_count)
+        worksheet.batch_update(_ranges(updates), value_input_option="USER_ENTERED")
+
+    state.high_water_mark = high_water_mark
+    state.snapshot = json.dumps(snapshot)
+    state.last_run_at = datetime.now(timezone.utc)
+    db.commit()
+    return {"pushed": len(updates), "pulled": pulled, "checked": len(changed)}
+
+
+def run(pull_status: bool, full: bool):
+    models.Base.metadata.create_all(bind=engine)
+    worksheet = sheets.get_worksheet(SHEETS_SYNC_WORKSHEET)
+    db = SessionLocal()
+    try:
+        result = run_sync(db, worksheet, pull_status=pull_status, full=full)
+        print(f"--- SHEETS SYNC: {result} ---")
+        return result
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mirror applications into the office Google Sheet.")
+    parser.add_argument("--pull-status", action="store_true", help="Apply Status edits made in the sheet.")
+    parser.add_argument("--full", action="store_true", help="Re-read the sheet and re-push every row.")
+    args = parser.parse_args()
+    run(args.pull_status, args.full)
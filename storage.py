@@ -0,0 +1,234 @@
+# storage.py
+
+import io
+import mimetypes
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Uploaded photos and CVs are stored through a backend chosen with STORAGE_BACKEND:
+#   local  - files under UPLOADS_DIR (default; one app node, or a shared volume)
+#   s3     - any S3-compatible bucket (AWS, MinIO, R2...); needs `pip install boto3`
+#   memory - in-process dict, for tests
+# Keys look like "<kind>/<sha256>.<ext>"; the database keeps "/uploads/<key>" URLs,
+# which do not depend on the backend.
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+UPLOADS_DIR = Path(os.getenv("UPLOADS_DIR", str(Path(__file__).parent / "uploads")))
+
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") # e.g. http://minio:9000; unset for AWS
+S3_REGION = os.getenv("S3_REGION")
+S3_PREFIX = os.getenv("S3_PREFIX", "uploads/")
+S3_SIGNED_URL_SECONDS = int(os.getenv("S3_SIGNED_URL_SECONDS", "300"))
+S3_MULTIPART_CHUNK_BYTES = int(os.getenv("S3_MULTIPART_CHUNK_BYTES", str(8 * 1024 * 1024)))
+
+
+def key_from_url(file_url: str):
+    """'/uploads/teacher_cvs/x.pdf' -> 'teacher_cvs/x.pdf'. None for foreign or unsafe URLs."""
+    if not file_url or not file_url.startswith("/uploads/"):
+        return None
+    key = file_url[len("/uploads/"):]
+    if ".." in key or key.startswith("/"):
+        print(f"Security Warning: Attempted directory traversal with storage key: {file_url}")
+        return None
+    return key
+
+
+def url_for_key(key: str) -> str:
+    return f"/uploads/{key}"
+
+
+class LocalStorage:
+    """Files under a local (or mounted) directory."""
+
+    def __init__(self, root: Path = UPLOADS_DIR):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def local_path(self, key: str) -> Path:
+        return self.root / key
+
+    def exists(self, key: str) -> bool:
+        return self.local_path(key).is_file()
+
+    def save(self, key: str, source: Path) -> bool:
+        """
+        Moves a fully written spool file into place. Returns False (and drops the
+        spool file) when the key already exists, i.e. the content is already stored.
+        """
+        target = self.local_path(key)
+        if target.exists():
+            Path(source).unlink(missing_ok=True)
+            return False
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.replace(source, target)
+        except OSError:
+            # Spool directory on another filesystem
+            shutil.move(source, target)
+        return True
+
+    def open(self, key: str):
+        return open(self.local_path(key), "rb")
+
+    def delete(self, key: str) -> bool:
+        try:
+            os.remove(self.local_path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def url(self, key: str, expires_in: int = None):
+        return None # Served by the /api/files/* endpoints
+
+    def list_keys(self, prefix: str):
+        """Yields (key, size, mtime) for the files directly under `prefix` ('<kind>/'), streaming the directory."""
+        try:
+            entries = os.scandir(self.root / prefix)
+        except FileNotFoundError:
+            return
+        with entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue # Spool/temporary files
+                st = entry.stat()
+                yield f"{prefix}{entry.name}", st.st_size, st.st_mtime
+
+
+class MemoryStorage:
+    """In-process stand-in for tests. Nothing is written to disk."""
+
+    def __init__(self):
+        self.objects = {}
+        self.saved_at = {}
+        self._lock = threading.Lock()
+
+    def local_path(self, key: str):
+        return None
+
+    def exists(self, key: str) -> bool:
+        return key in self.objects
+
+    def save(self, key: str, source: Path) -> bool:
+        with self._lock:
+            if key in self.objects:
+                Path(source).unlink(missing_ok=True)
+                return False
+            self.objects[key] = Path(source).read_bytes()
+            self.saved_at[key] = time.time()
+        Path(source).unlink(missing_ok=True)
+        return True
+
+    def open(self, key: str):
+        try:
+            return io.BytesIO(self.objects[key])
+        except KeyError:
+            raise FileNotFoundError(key)
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            self.saved_at.pop(key, None)
+            return self.objects.pop(key, None) is not None
+
+    def url(self, key: str, expires_in: int = None):
+        return None
+
+    def list_keys(self, prefix: str):
+        with self._lock:
+            items = [(key, len(body), self.saved_at.get(key, 0)) for key, body in self.objects.items() if key.startswith(prefix)]
+        yield from items
+
+
+class S3Storage:
+    """
+    S3-compatible bucket. Uploads go through boto3's managed transfer, which
+    switches to a multipart upload (S3_MULTIPART_CHUNK_BYTES parts) for large
+    files and streams them from the spool file. Reads are handed to clients as
+    short-lived presigned URLs, so file bytes do not pass through the app.
+    """
+
+    def __init__(self, bucket: str = S3_BUCKET, prefix: str = S3_PREFIX, endpoint_url: str = S3_ENDPOINT_URL,
+                 region: str = S3_REGION, client=None):
+        if not bucket:
+            raise RuntimeError("S3_BUCKET must be set when STORAGE_BACKEND=s3.")
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = client or boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_CHUNK_BYTES, multipart_chunksize=S3_MULTIPART_CHUNK_BYTES,
+        )
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def local_path(self, key: str):
+        return None
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def save(self, key: str, source: Path) -> bool:
+        try:
+            if self.exists(key):
+                return False
+            content_type = mimetypes.guess_type(key)[0]
+            extra = {"ContentType": content_type} if content_type else {}
+            self.client.upload_file(str(source), self.bucket, self._object_key(key),
+                                    ExtraArgs=extra, Config=self.transfer_config)
+            return True
+        finally:
+            Path(source).unlink(missing_ok=True)
+
+    def open(self, key: str):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))["Body"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFoundError(key)
+            raise
+
+    def delete(self, key: str) -> bool:
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        return True
+
+    def url(self, key: str, expires_in: int = None):
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._object_key(key)},
+            ExpiresIn=expires_in or S3_SIGNED_URL_SECONDS,
+        )
+
+    def list_keys(self, prefix: str):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._object_key(prefix)):
+            for obj in page.get("Contents", []):
+                yield obj["Key"][len(self.prefix):], obj["Size"], obj["LastModified"].timestamp()
+
+
+def create_backend(name: str = STORAGE_BACKEND):
+    if name == "local":
+        return LocalStorage()
+    if name == "s3":
+        return S3Storage()
+    if name == "memory":
+        return MemoryStorage()
+    raise RuntimeError(f"Unknown STORAGE_BACKEND '{name}' (expected local, s3 or memory).")
+
+
+backend = create_backend()
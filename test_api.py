@@ -9,8 +9,11 @@ Run with:  pytest test_api.py -v
 
 import os
 import sys
+import asyncio
+import json
+import httpx
 import pytest
-from datetime import datetime, date, time, timedelta
+from datetime import datetime, date, time, timedelta, timezone
 
 # === Environment Setup (BEFORE any project imports) ===
 os.environ["USE_SQLITE"] = "True"
@@ -60,6 +63,24 @@ async def _noop_rate_limiter():
 app.dependency_overrides[RateLimiter(times=3, minutes=2)] = _noop_rate_limiter
 import crud
 import schemas
+import email_outbox
+import email_worker
+import email_sender
+import email_templates
+import announcements
+import sheets
+import file_handler
+import image_variants
+import file_serving
+import storage
+import gc_uploads
+import file_ops
+import compression
+import sheets_sync
+from fake_sheets import FakeWorksheet
+import time as time_module
+import brevo_stub
+from brevo_transport import BrevoTransport
 
 
 # === Dependency Override (belt-and-suspenders with the monkey-patch) ===
@@ -105,6 +126,13 @@ def clear_all_data():
         db.query(models.Teacher).delete()
         db.query(models.User).delete()
         db.query(models.Course).delete()
+        db.query(models.EmailOutbox).delete()
+        db.query(models.AdminDigestItem).delete()
+        db.query(models.AnnouncementJob).delete()
+        db.query(models.EmailDispatchKey).delete()
+        db.query(models.SheetSyncState).delete()
+        db.query(models.UploadManifest).delete()
+        db.query(models.ResourceVersion).delete()
         db.commit()
     finally:
         db.close()
@@ -200,11 +228,44 @@ class TestRootEndpoints:
         assert data["status"] == "ok"
         assert "Al-Mursalaat" in data["message"]
 
-    def test_debug_files_endpoint(self, client):
-        response = client.get("/api/files/debug")
+    def test_debug_files_endpoint(self, client, supreme_admin):
+        _, token = supreme_admin
+        response = client.get("/api/files/debug", cookies=auth_cookies(token))
         assert response.status_code == 200
         assert "BASE_DIR" in response.json()
 
+    def test_debug_files_requires_auth(self, client):
+        assert client.get("/api/files/debug").status_code == 401
+
+
+class TestCourses:
+    def test_list_courses_with_etag(self, client):
+        response = client.get("/api/courses/")
+        assert response.status_code == 200
+        assert len(response.json()) == 4
+        etag = response.headers["etag"]
+        cached = client.get("/api/courses/", headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+
+    def test_weak_and_listed_etags_match(self, client):
+        etag = client.get("/api/courses/").headers["etag"]
+        assert client.get("/api/courses/", headers={"If-None-Match": f'"stale", W/{etag}'}).status_code == 304
+
+    def test_etag_changes_on_course_write(self, client, db):
+        etag = client.get("/api/courses/").headers["etag"]
+        crud.create_course(db, schemas.CourseCreate(name="Arabic Language"))
+        response = client.get("/api/courses/", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert "Arabic Language" in [c["name"] for c in response.json()]
+
+    def test_application_links_course_by_normalized_name(self, db):
+        student = crud.create_application(db, schemas.ApplicationCreate(
+            first_name="Case", last_name="Test", email="case@test.com",
+            phone_number="4040404040", country="BD", preferred_course="  quran READING (nazra) ",
+            age=9, gender="Female",
+        ))
+        assert student.course_id == crud.get_course_by_name(db, "Quran Reading (Nazra)").id
+
 
 class TestAuthentication:
     def test_login_success(self, client, supreme_admin):
@@ -237,6 +298,288 @@ class TestForgotPassword:
         assert response.status_code == 404
 
 
+class TestEmailOutbox:
+    def test_handlers_only_queue_emails(self, client, db, supreme_admin):
+        _, token = supreme_admin
+        client.post("/api/admin/add-student/", json={
+            "first_name": "Queued", "last_name": "Student", "email": "queued@test.com",
+            "phone_number": "5050505050", "country": "BD", "preferred_course": "Islamic Studies",
+            "age": 11, "gender": "Male",
+        }, cookies=auth_cookies(token))
+        client.post("/api/forgot-pass", json={"email": "supreme@test.com"})
+        rows = db.query(models.EmailOutbox).order_by(models.EmailOutbox.id).all()
+        assert [(r.kind, r.recipient, r.status) for r in rows] == [
+            ("send_manual_admission_email", "queued@test.com", "pending"),
+            ("send_forgot_password_email", "supreme@test.com", "pending"),
+        ]
+
+    def test_worker_sends_and_clears_payload(self, db):
+        email_outbox.enqueue(db, "send_forgot_password_email", recipient="a@test.com", email="a@test.com", temp_password="x")
+        sent = []
+
+        async def deliver(kind, payload):
+            sent.append(payload)
+            return True, None
+
+        handled = asyncio.run(email_worker.process_batch(db, deliver_fn=deliver))
+        assert handled == 1
+        assert sent == [{"email": "a@test.com", "temp_password": "x"}]
+        row = db.query(models.EmailOutbox).one()
+        assert row.status == "sent" and row.payload is None
+        assert asyncio.run(email_worker.process_batch(db, deliver_fn=deliver)) == 0
+
+    def test_worker_retries_with_backoff_then_fails(self, db):
+        row = email_outbox.enqueue(db, "send_forgot_password_email", recipient="b@test.com", email="b@test.com", temp_password="y")
+
+        async def failing(kind, payload):
+            return False, "provider down"
+
+        asyncio.run(email_worker.process_batch(db, deliver_fn=failing))
+        db.refresh(row)
+        assert row.status == "pending" and row.attempts == 1 and row.last_error == "provider down"
+        # Not due yet, so the next poll skips it
+        assert asyncio.run(email_worker.process_batch(db, deliver_fn=failing)) == 0
+        for _ in range(email_outbox.MAX_ATTEMPTS - 1):
+            row.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+            db.commit()
+            asyncio.run(email_worker.process_batch(db, deliver_fn=failing))
+            db.refresh(row)
+        assert row.status == "failed"
+        assert row.attempts == email_outbox.MAX_ATTEMPTS
+
+    def test_worker_delivers_through_stub_transport(self, db):
+        stub = brevo_stub.create_stub_app()
+        email_outbox.enqueue(db, "send_forgot_password_email", recipient="c@test.com", email="c@test.com", temp_password="z")
+        email_outbox.enqueue(db, "send_teacher_credentials_email", recipient="t@test.com",
+                             teacher_data={"email": "t@test.com", "name": "T"}, temp_password="w")
+
+        async def run():
+            async with BrevoTransport(api_key="stub", base_url="http://brevo-stub/v3",
+                                      transport=httpx.ASGITransport(app=stub)) as transport:
+                return await email_worker.process_batch(db, transport), transport.stats
+
+        handled, stats = asyncio.run(run())
+        assert handled == 2 and stats == {"in_flight": 0, "sent": 2, "errors": 0}
+        assert [m["to"][0]["email"] for m in stub.state.messages] == ["c@test.com", "t@test.com"]
+        assert "z" in stub.state.messages[0]["htmlContent"]
+        assert {r.status for r in db.query(models.EmailOutbox).all()} == {"sent"}
+
+    def test_transport_surfaces_provider_errors(self, db):
+        email_outbox.enqueue(db, "send_forgot_password_email", recipient="d@test.com", email="d@test.com", temp_password="v")
+        stub = brevo_stub.create_stub_app(failure_rate=1.0)
+
+        async def run():
+            async with BrevoTransport(api_key="stub", base_url="http://brevo-stub/v3",
+                                      transport=httpx.ASGITransport(app=stub)) as transport:
+                await email_worker.process_batch(db, transport)
+
+        asyncio.run(run())
+        row = db.query(models.EmailOutbox).one()
+        assert row.status == "pending" and "503" in row.last_error
+
+    def test_admin_digest_buffers_then_flushes_by_size(self, db, sample_student, monkeypatch):
+        monkeypatch.setattr(email_outbox, "ADMIN_NOTIFICATION_MODE", "digest")
+        monkeypatch.setattr(email_outbox, "ADMIN_DIGEST_MAX_ITEMS", 3)
+        app_data = schemas.Application.model_validate(sample_student).model_dump(mode="json")
+        for _ in range(2):
+            assert email_outbox.notify_admin_of_application(db, app_data, recipient="admin@test.com") is None
+        assert db.query(models.EmailOutbox).count() == 0
+        # Not old enough yet
+        assert email_outbox.flush_admin_digest(db, recipient="admin@test.com") is None
+
+        row = email_outbox.notify_admin_of_application(db, app_data, recipient="admin@test.com")
+        assert row.kind == "send_admin_digest"
+        assert db.query(models.AdminDigestItem).count() == 0
+        message = email_sender.compose(row.kind, json.loads(row.payload))
+        assert message["subject"].startswith("3 New Applications")
+        assert message["htmlContent"].count("student@test.com") == 3
+
+    def test_admin_digest_flushes_by_age(self, db, sample_student, monkeypatch):
+        monkeypatch.setattr(email_outbox, "ADMIN_NOTIFICATION_MODE", "digest")
+        app_data = schemas.Application.model_validate(sample_student).model_dump(mode="json")
+        email_outbox.notify_admin_of_application(db, app_data, recipient="admin@test.com")
+        item = db.query(models.AdminDigestItem).one()
+        item.created_at = datetime.utcnow() - timedelta(seconds=email_outbox.ADMIN_DIGEST_INTERVAL_SECONDS + 1)
+        db.commit()
+        row = email_outbox.flush_admin_digest(db, recipient="admin@test.com")
+        assert row.kind == "send_admin_digest" and len(json.loads(row.payload)["applications"]) == 1
+
+    def test_admin_immediate_mode(self, db, sample_student, monkeypatch):
+        monkeypatch.setattr(email_outbox, "ADMIN_NOTIFICATION_MODE", "immediate")
+        app_data = schemas.Application.model_validate(sample_student).model_dump(mode="json")
+        row = email_outbox.notify_admin_of_application(db, app_data, recipient="admin@test.com")
+        assert row.kind == "send_admin_notification"
+        assert db.query(models.AdminDigestItem).count() == 0
+
+    def test_teacher_credentials_queued_once(self, client, db, supreme_admin):
+        _, token = supreme_admin
+        client.post("/api/admin/teachers/", data={
+            "name": "Once", "email": "once@test.com",
+            "phone_number": "1212121212", "shift": "Morning", "gender": "Female",
+        }, cookies=auth_cookies(token))
+        assert db.query(models.EmailOutbox).filter(models.EmailOutbox.kind == "send_teacher_credentials_email").count() == 1
+
+    def test_duplicate_dispatch_is_suppressed(self, client, db, supreme_admin):
+        args = dict(recipient="Dup@Test.com", entity_id=7, version="pw1", email="dup@test.com", temp_password="pw1")
+        assert email_outbox.enqueue(db, "send_forgot_password_email", **args) is not None
+        assert email_outbox.enqueue(db, "send_forgot_password_email", **{**args, "recipient": "dup@test.com"}) is None
+        # A new version (e.g. a new temporary password) is a different email
+        assert email_outbox.enqueue(db, "send_forgot_password_email", **{**args, "version": "pw2", "temp_password": "pw2"}) is not None
+        assert db.query(models.EmailOutbox).count() == 2
+        stored = db.query(models.EmailDispatchKey.key).all()
+        assert all("pw1" not in key for (key,) in stored)
+
+        _, token = supreme_admin
+        stats = client.get("/api/admin/email-stats", cookies=auth_cookies(token)).json()
+        assert stats["suppressed_duplicates"] == 1 and stats["pending"] == 2
+
+    def test_duplicate_keeps_callers_pending_work(self, db):
+        args = dict(recipient="keep@test.com", entity_id=3, email="keep@test.com", temp_password="x")
+        email_outbox.enqueue(db, "send_forgot_password_email", **args)
+        db.add(models.Course(name="Pending Course"))
+        assert email_outbox.enqueue(db, "send_forgot_password_email", **args) is None
+        db.commit()
+        assert db.query(models.Course).filter(models.Course.name == "Pending Course").count() == 1
+
+    def test_dispatch_key_expires(self, db):
+        args = dict(recipient="ttl@test.com", entity_id=1, email="ttl@test.com", temp_password="x")
+        email_outbox.enqueue(db, "send_forgot_password_email", **args)
+        db.query(models.EmailDispatchKey).update({models.EmailDispatchKey.expires_at: datetime.utcnow() - timedelta(seconds=1)})
+        db.commit()
+        assert email_outbox.enqueue(db, "send_forgot_password_email", **args) is not None
+        assert email_outbox.purge_expired_dispatch_keys(db) == 0
+
+    def test_retry_delay_is_exponential(self):
+        assert [email_outbox.retry_delay(n) for n in (1, 2, 3)] == [30, 60, 120]
+
+
+class TestEmailTemplates:
+    def test_compose_has_html_and_text(self):
+        message = email_sender.compose("send_forgot_password_email", {"email": "a@test.com", "temp_password": "Temp123"})
+        assert message["to"] == [{"email": "a@test.com"}]
+        assert "Temp123" in message["htmlContent"] and "<h3>" in message["htmlContent"]
+        assert "Temp123" in message["textContent"] and "<" not in message["textContent"]
+
+    def test_html_is_autoescaped(self):
+        message = email_sender.compose("send_admin_notification", {"application_data": {
+            "first_name": "<script>x</script>", "last_name": "B", "preferred_course": "Quran", "_internal": "hidden",
+        }})
+        assert "<script>" not in message["htmlContent"]
+        assert "&lt;script&gt;" in message["htmlContent"]
+        assert "<strong>Preferred Course:</strong> Quran<br>" in message["htmlContent"]
+        assert "hidden" not in message["htmlContent"]
+        # The plain-text alternate is not HTML, so it is not escaped
+        assert "First Name: <script>x</script>" in message["textContent"]
+
+    def test_all_templates_compile(self):
+        assert email_templates.compile_all() == len(os.listdir(email_templates.TEMPLATE_DIR))
+
+
+class TestSheetsAppender:
+    class RecordingWorksheet:
+        def __init__(self, fail=False):
+            self.calls = []
+            self.fail = fail
+
+        def append_rows(self, rows, value_input_option=None):
+            if self.fail:
+                raise RuntimeError("quota exceeded")
+            self.calls.append(rows)
+
+    def test_flushes_on_size_and_on_stop(self):
+        worksheet = self.RecordingWorksheet()
+        appender = sheets.SheetAppender(worksheet_fn=lambda: worksheet, batch_size=2, flush_seconds=60)
+        appender.start()
+        for i in range(2):
+            appender.add(sheets.application_row({"id": i, "first_name": f"S{i}"}))
+        for _ in range(100):
+            if worksheet.calls:
+                break
+            time_module.sleep(0.01)
+        appender.add(sheets.application_row({"id": 2, "first_name": "S2"}))
+        appender.stop()
+        assert [[row[0] for row in rows] for rows in worksheet.calls] == [[0, 1], [2]]
+        assert appender.stats["appended"] == 3 and appender.stats["flushes"] == 2
+
+    def test_failed_flush_keeps_rows(self):
+        worksheet = self.RecordingWorksheet(fail=True)
+        appender = sheets.SheetAppender(worksheet_fn=lambda: worksheet, batch_size=10, flush_seconds=60)
+        appender.add(sheets.application_row({"id": 1}))
+        assert appender.flush() == 0
+        assert appender.stats["buffered"] == 1 and appender.stats["errors"] == 1
+        worksheet.fail = False
+        assert appender.flush() == 1
+        assert worksheet.calls[0][0][0] == 1
+
+    def test_thread_retries_after_failed_flush(self):
+        class FailsOnce(self.RecordingWorksheet):
+            def append_rows(self, rows, value_input_option=None):
+                if not self.fail:
+                    self.fail = True
+                    raise RuntimeError("quota exceeded")
+                self.calls.append(rows)
+
+        worksheet = FailsOnce()
+        appender = sheets.SheetAppender(worksheet_fn=lambda: worksheet, batch_size=10, flush_seconds=0.05)
+        appender.start()
+        try:
+            appender.add(sheets.application_row({"id": 1}))
+            for _ in range(200):
+                if worksheet.calls:
+                    break
+                time_module.sleep(0.01)
+            assert appender._thread.is_alive()
+        finally:
+            appender.stop()
+        assert [rows[0][0] for rows in worksheet.calls] == [1]
+        assert appender.stats["errors"] == 1 and appender.stats["appended"] == 1
+
+
+class TestSheetsSync:
+    def _apps(self, db, count=3):
+        return [crud.create_application(db, schemas.ApplicationCreate(
+            first_name=f"Sync{i}", last_name="Student", email=f"sync{i}@test.com", phone_number=f"60000000{i}",
+            country="BD", preferred_course="Islamic Studies", age=10 + i, gender="Female",
+        )) for i in range(count)]
+
+    def test_incremental_push(self, db):
+        apps = self._apps(db)
+        worksheet = FakeWorksheet(rows=3)
+        result = sheets_sync.run_sync(db, worksheet)
+        assert result["pushed"] == 4 # Header + 3 rows
+        values = worksheet.get_all_values()
+        assert values[0][:3] == ["ID", "Submitted At", "First Name"]
+        assert [row[0] for row in values[1:]] == [str(a.id) for a in apps]
+
+        # Nothing changed: no write at all
+        assert sheets_sync.run_sync(db, worksheet)["pushed"] == 0
+        assert worksheet.calls["batch_update"] == 1
+
+        crud.bulk_update_status(db, [apps[1].id], status="Finished")
+        result = sheets_sync.run_sync(db, worksheet)
+        assert result["pushed"] == 1
+        assert worksheet.get_all_values()[2][sheets_sync.STATUS_COL - 1] == "Finished"
+        assert worksheet.calls["batch_update"] == 2
+
+    def test_pull_status_edits(self, db):
+        apps = self._apps(db, count=2)
+        worksheet = FakeWorksheet()
+        sheets_sync.run_sync(db, worksheet)
+        worksheet.update_cell(3, sheets_sync.STATUS_COL, "Approved")
+        result = sheets_sync.run_sync(db, worksheet, pull_status=True)
+        assert result["pulled"] == 1
+        db.refresh(apps[1])
+        assert apps[1].status == "Approved"
+
+    def test_deleted_application_row_is_cleared(self, db):
+        apps = self._apps(db, count=2)
+        worksheet = FakeWorksheet()
+        sheets_sync.run_sync(db, worksheet)
+        crud.delete_applications(db, [apps[0].id])
+        sheets_sync.run_sync(db, worksheet)
+        assert worksheet.col_values(1) == ["ID", "", str(apps[1].id)]
+
+
 class TestChangePassword:
     def test_success(self, client, supreme_admin):
         _, token = supreme_admin
@@ -357,6 +700,13 @@ class TestTeacherCRUD:
         response = client.get("/api/admin/teachers/", cookies=auth_cookies(token))
         assert response.status_code == 200
 
+    def test_list_teachers_sparse_fields(self, client, supreme_admin, teacher_user):
+        teacher, _ = teacher_user
+        _, token = supreme_admin
+        response = client.get("/api/admin/teachers/?fields=name,students", cookies=auth_cookies(token))
+        assert response.status_code == 200
+        assert response.json() == [{"id": teacher.id, "name": teacher.name, "students": []}]
+
     def test_create_teacher(self, client, supreme_admin):
         _, token = supreme_admin
         response = client.post("/api/admin/teachers/", data={
@@ -407,6 +757,18 @@ class TestTeacherCRUD:
         _, token = supreme_admin
         assert client.delete("/api/admin/teachers/99999", cookies=auth_cookies(token)).status_code == 404
 
+    def test_delete_teacher_with_history(self, client, db, supreme_admin, sample_student, teacher_user):
+        teacher, _ = teacher_user
+        _, token = supreme_admin
+        crud.assign_teacher_and_shift(db, sample_student.id, teacher.id, "Morning")
+        crud.create_attendance_record(db, schemas.AttendanceCreate(
+            class_date=date.today(), status="Present", student_id=sample_student.id, teacher_id=teacher.id))
+        response = client.delete(f"/api/admin/teachers/{teacher.id}", cookies=auth_cookies(token))
+        assert response.status_code == 200
+        db.expire_all()
+        assert db.query(models.Attendance).count() == 0
+        assert crud.get_application_by_id(db, sample_student.id).teacher_id is None
+
     def test_gender_filtering(self, client, regular_admin, teacher_user):
         _, token = regular_admin
         response = client.get("/api/admin/teachers/", cookies=auth_cookies(token))
@@ -434,6 +796,38 @@ class TestStudentCRUD:
         response = client.get("/api/admin/students/", cookies=auth_cookies(token))
         assert response.status_code == 200
 
+    def test_list_matches_response_model(self, client, db, supreme_admin, sample_student, teacher_user):
+        teacher, _ = teacher_user
+        sample_student.teacher_id = teacher.id
+        db.commit()
+        _, token = supreme_admin
+        response = client.get("/api/admin/students/", cookies=auth_cookies(token))
+        assert response.headers["content-type"] == "application/json"
+        expected = [schemas.Application.model_validate(s).model_dump(mode="json") for s in crud.get_applications(db)]
+        assert response.json() == expected
+        assert response.json()[0]["teacher"]["email"] == teacher.email
+
+    def test_list_sparse_fields(self, client, supreme_admin, sample_student):
+        _, token = supreme_admin
+        response = client.get("/api/admin/students/?fields=first_name,email", cookies=auth_cookies(token))
+        assert response.status_code == 200
+        assert response.json() == [{"id": sample_student.id, "first_name": sample_student.first_name, "email": sample_student.email}]
+
+    def test_list_sparse_fields_with_relationship(self, client, db, supreme_admin, sample_student, teacher_user):
+        teacher, _ = teacher_user
+        sample_student.teacher_id = teacher.id
+        db.commit()
+        _, token = supreme_admin
+        response = client.get("/api/admin/students/?fields=teacher", cookies=auth_cookies(token))
+        assert set(response.json()[0]) == {"id", "teacher"}
+        assert response.json()[0]["teacher"]["email"] == teacher.email
+
+    def test_list_sparse_fields_unknown(self, client, supreme_admin):
+        _, token = supreme_admin
+        response = client.get("/api/admin/students/?fields=first_name,hashed_password", cookies=auth_cookies(token))
+        assert response.status_code == 400
+        assert "hashed_password" in response.json()["detail"]
+
     def test_add_student(self, client, supreme_admin):
         _, token = supreme_admin
         response = client.post("/api/admin/add-student/", json={
@@ -487,6 +881,230 @@ class TestStudentCRUD:
         _, token = supreme_admin
         assert client.delete("/api/admin/students/99999", cookies=auth_cookies(token)).status_code == 404
 
+    def test_delete_cascades_history(self, client, db, supreme_admin, sample_student, teacher_user):
+        teacher, _ = teacher_user
+        _, token = supreme_admin
+        for offset in range(3):
+            crud.create_attendance_record(db, schemas.AttendanceCreate(
+                class_date=date.today() - timedelta(days=offset), status="Present",
+                student_id=sample_student.id, teacher_id=teacher.id))
+        crud.create_schedule(db, schemas.ScheduleCreate(
+            day_of_week="Monday", start_time=time(9), end_time=time(10),
+            student_id=sample_student.id, teacher_id=teacher.id))
+        response = client.delete(f"/api/admin/students/{sample_student.id}", cookies=auth_cookies(token))
+        assert response.status_code == 200
+        assert len(response.json()["schedules"]) == 1
+        assert db.query(models.Attendance).count() == 0
+        assert db.query(models.Schedule).count() == 0
+
+
+class TestAutoAssign:
+    def _mk_student(self, db, email, gender="Male", shift=None):
+        return crud.create_application(db, schemas.ApplicationCreate(
+            first_name="Auto", last_name=email.split("@")[0], email=email,
+            phone_number="1010101010", country="BD", preferred_course="Islamic Studies",
+            age=10, gender=gender, shift=shift,
+        ))
+
+    def _mk_teacher(self, db, email, gender="Male", shift="Morning"):
+        return crud.create_teacher(db, schemas.TeacherCreate(
+            name=email.split("@")[0], email=email, phone_number="2020202020",
+            shift=shift, gender=gender,
+        ), password="pw123456")
+
+    def test_dry_run_balances_load(self, client, db, supreme_admin):
+        _, token = supreme_admin
+        t1 = self._mk_teacher(db, "t1@test.com")
+        t2 = self._mk_teacher(db, "t2@test.com")
+        for i in range(4):
+            self._mk_student(db, f"s{i}@test.com")
+        response = client.post("/api/admin/students/auto-assign",
+            json={"capacity": 5, "dry_run": True}, cookies=auth_cookies(token))
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["assignments"]) == 4
+        per_teacher = [a["teacher_id"] for a in data["assignments"]]
+        assert per_teacher.count(t1.id) == 2 and per_teacher.count(t2.id) == 2
+        # Dry run must not touch the database
+        db.expire_all()
+        assert all(s.teacher_id is None for s in db.query(models.Application).all())
+
+    def test_respects_gender_shift_and_capacity(self, client, db, supreme_admin):
+        _, token = supreme_admin
+        self._mk_teacher(db, "male@test.com", gender="Male", shift="Morning")
+        female = self._mk_teacher(db, "female@test.com", gender="Female", shift="Evening")
+        self._mk_student(db, "f1@test.com", gender="Female")
+        self._mk_student(db, "f2@test.com", gender="Female", shift="Evening")
+        self._mk_student(db, "f3@test.com", gender="Female", shift="Morning")
+        response = client.post("/api/admin/students/auto-assign",
+            json={"capacity": 1, "dry_run": False}, cookies=auth_cookies(token))
+        data = response.json()
+        assert len(data["assignments"]) == 1
+        assert data["assignments"][0]["teacher_id"] == female.id
+        assert len(data["unassigned"]) == 2
+        db.expire_all()
+        assigned = db.query(models.Application).filter(models.Application.teacher_id != None).all()
+        assert len(assigned) == 1 and assigned[0].status == "Approved"
+
+    def test_regular_admin_limited_to_own_gender(self, client, db, regular_admin):
+        _, token = regular_admin
+        self._mk_teacher(db, "ft@test.com", gender="Female")
+        self._mk_student(db, "fs@test.com", gender="Female")
+        response = client.post("/api/admin/students/auto-assign",
+            json={"capacity": 3}, cookies=auth_cookies(token))
+        assert response.status_code == 200
+        assert response.json()["assignments"] == []
+        assert response.json()["unassigned"] == []
+
+
+class TestBulkStudentActions:
+    def _mk_students(self, db, n):
+        return [crud.create_application(db, schemas.ApplicationCreate(
+            first_name="Bulk", last_name=str(i), email=f"bulk{i}@test.com",
+            phone_number="3030303030", country="BD", preferred_course="Islamic Studies",
+            age=12, gender="Male",
+        )) for i in range(n)]
+
+    def test_bulk_assign(self, client, db, supreme_admin, teacher_user):
+        teacher, _ = teacher_user
+        _, token = supreme_admin
+        ids = [s.id for s in self._mk_students(db, 3)]
+        response = client.post("/api/admin/students/bulk", json={
+            "ids": ids + [99999], "action": "assign", "teacher_id": teacher.id, "shift": "Morning",
+        }, cookies=auth_cookies(token))
+        assert response.status_code == 200
+        data = response.json()
+        assert data["affected"] == 3
+        assert {r["id"]: r["ok"] for r in data["results"]} == {**{i: True for i in ids}, 99999: False}
+        db.expire_all()
+        assert all(s.teacher_id == teacher.id and s.status == "Approved" for s in db.query(models.Application).all())
+
+    def test_bulk_archive_keeps_attendance(self, client, db, supreme_admin, teacher_user):
+        teacher, _ = teacher_user
+        _, token = supreme_admin
+        students = self._mk_students(db, 2)
+        for student in students:
+            crud.create_schedule(db, schemas.ScheduleCreate(
+                day_of_week="Monday", start_time=time(9), end_time=time(10), student_id=student.id, teacher_id=teacher.id))
+            for days_ago in range(3):
+                crud.create_attendance_record(db, schemas.AttendanceCreate(
+                    class_date=date.today() - timedelta(days=days_ago), status="Present",
+                    student_id=student.id, teacher_id=teacher.id))
+        response = client.post("/api/admin/students/bulk", json={"ids": [s.id for s in students], "action": "archive"}, cookies=auth_cookies(token))
+        assert response.json()["affected"] == 2
+        db.expire_all()
+        assert {(s.status, s.teacher_id) for s in db.query(models.Application).all()} == {(crud.ARCHIVED_STATUS, None)}
+        assert db.query(models.Schedule).count() == 0
+        assert db.query(models.Attendance).count() == 6
+
+    def test_bulk_status_validation(self, client, db, supreme_admin):
+        _, token = supreme_admin
+        ids = [s.id for s in self._mk_students(db, 2)]
+        bad = client.post("/api/admin/students/bulk", json={"ids": ids, "action": "status", "status": "Nope"}, cookies=auth_cookies(token))
+        assert bad.status_code == 400
+        ok = client.post("/api/admin/students/bulk", json={"ids": ids, "action": "status", "status": "Finished"}, cookies=auth_cookies(token))
+        assert ok.json()["affected"] == 2
+
+    def test_bulk_delete_cleans_children(self, client, db, supreme_admin, teacher_user):
+        teacher, _ = teacher_user
+        _, token = supreme_admin
+        students = self._mk_students(db, 2)
+        for s in students:
+            crud.create_attendance_record(db, schemas.AttendanceCreate(
+                class_date=date.today(), status="Present", student_id=s.id, teacher_id=teacher.id))
+            crud.create_schedule(db, schemas.ScheduleCreate(
+                day_of_week="Monday", start_time=time(9), end_time=time(10), student_id=s.id, teacher_id=teacher.id))
+        response = client.post("/api/admin/students/bulk", json={
+            "ids": [s.id for s in students], "action": "delete",
+        }, cookies=auth_cookies(token))
+        assert response.json()["affected"] == 2
+        assert db.query(models.Application).count() == 0
+        assert db.query(models.Attendance).count() == 0
+        assert db.query(models.Schedule).count() == 0
+
+    def test_forbidden_for_teacher(self, client, teacher_user):
+        _, token = teacher_user
+        response = client.post("/api/admin/students/bulk", json={"ids": [1], "action": "delete"}, cookies=auth_cookies(token))
+        assert response.status_code == 403
+
+
+class TestAnnouncements:
+    def _students(self, db, teacher):
+        for i, first_name in enumerate(["Amina", "Bilal", "Zaid"]):
+            crud.create_application(db, schemas.ApplicationCreate(
+                first_name=first_name, last_name="Student", email=f"ann{i}@test.com", phone_number=f"70000000{i}",
+                country="BD", preferred_course="Islamic Studies", age=12, gender="Male",
+            ))
+        # Only the first two are assigned to the teacher
+        students = db.query(models.Application).filter(models.Application.email.in_(["ann0@test.com", "ann1@test.com"])).all()
+        crud.bulk_assign_teacher_and_shift(db, [s.id for s in students], teacher_id=teacher.id, shift="Morning")
+
+    def test_create_selects_recipients(self, client, db, supreme_admin, teacher_user):
+        _, token = supreme_admin
+        teacher, _ = teacher_user
+        self._students(db, teacher)
+        response = client.post("/api/admin/announcements/", json={
+            "subject": "Holiday", "body": "Dear {{ first_name }}, no class on Friday.", "teacher_id": teacher.id,
+        }, cookies=auth_cookies(token))
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] == "pending" and job["total_recipients"] == 2
+        progress = client.get(f"/api/admin/announcements/{job['id']}", cookies=auth_cookies(token))
+        assert progress.json()["sent_count"] == 0
+
+    def test_invalid_template(self, client, supreme_admin):
+        _, token = supreme_admin
+        response = client.post("/api/admin/announcements/", json={
+            "subject": "Broken", "body": "Dear {{ first_name ", "status": None,
+        }, cookies=auth_cookies(token))
+        assert response.status_code == 400
+
+    def test_undefined_template_variable(self, client, db, supreme_admin):
+        _, token = supreme_admin
+        response = client.post("/api/admin/announcements/", json={
+            "subject": "Typo", "body": "Dear {{ frist_name }},", "status": None,
+        }, cookies=auth_cookies(token))
+        assert response.status_code == 400
+        assert "frist_name" in response.json()["detail"]
+        assert db.query(models.AnnouncementJob).count() == 0
+
+    def test_teacher_cannot_read_announcements(self, client, db, supreme_admin, teacher_user):
+        job = announcements.create_job(db, schemas.AnnouncementCreate(subject="Hi", body="Hello", status=None), created_by="boss@test.com")
+        _, token = teacher_user
+        assert client.get("/api/admin/announcements/", cookies=auth_cookies(token)).status_code == 403
+        assert client.get(f"/api/admin/announcements/{job.id}", cookies=auth_cookies(token)).status_code == 403
+
+    def test_worker_sends_paced_message_version_batches(self, db, supreme_admin, teacher_user, monkeypatch):
+        teacher, _ = teacher_user
+        self._students(db, teacher)
+        monkeypatch.setattr(announcements, "ANNOUNCEMENT_BATCH_SIZE", 2)
+        job = announcements.create_job(db, schemas.AnnouncementCreate(
+            subject="Schedule change", body="Dear {{ first_name }},\nyour {{ course }} class moves to 5pm.", status=None,
+        ))
+        assert job.total_recipients == 3
+        stub = brevo_stub.create_stub_app()
+
+        async def run():
+            async with BrevoTransport(api_key="stub", base_url="http://brevo-stub/v3",
+                                      transport=httpx.ASGITransport(app=stub)) as transport:
+                first = await announcements.process_next_batch(db, transport)
+                # Paced: the next batch is not due yet
+                paced = await announcements.process_next_batch(db, transport)
+                db.refresh(job)
+                job.next_run_at = datetime.utcnow() - timedelta(seconds=1)
+                db.commit()
+                second = await announcements.process_next_batch(db, transport)
+                return first, paced, second
+
+        assert asyncio.run(run()) == (2, 0, 1)
+        assert stub.state.requests == 2
+        versions = stub.state.messages[0]["messageVersions"]
+        assert [v["to"][0]["email"] for v in versions] == ["ann0@test.com", "ann1@test.com"]
+        assert "Dear Amina,<br>your Islamic Studies class moves to 5pm." in "".join(
+            v["htmlContent"] for m in stub.state.messages for v in m["messageVersions"])
+        db.refresh(job)
+        assert job.status == "done" and job.sent_count == 3 and job.recipients is None
+
 
 class TestSubmitApplication:
     def test_submit(self, client, supreme_admin):
@@ -526,6 +1144,60 @@ class TestDashboardStats:
         assert data["total_students"] >= 1
 
 
+class TestConditionalGet:
+    def test_students_304_until_a_write(self, client, supreme_admin, sample_student):
+        _, token = supreme_admin
+        first = client.get("/api/admin/students/", cookies=auth_cookies(token))
+        etag = first.headers["etag"]
+        assert etag.startswith('W/"')
+        cached = client.get("/api/admin/students/", headers={"If-None-Match": etag}, cookies=auth_cookies(token))
+        assert cached.status_code == 304
+        assert cached.content == b""
+
+        client.post("/api/admin/students/bulk", json={"ids": [sample_student.id], "action": "status", "status": "Finished"}, cookies=auth_cookies(token))
+        changed = client.get("/api/admin/students/", headers={"If-None-Match": etag}, cookies=auth_cookies(token))
+        assert changed.status_code == 200
+        assert changed.headers["etag"] != etag
+        assert changed.json()[0]["status"] == "Finished"
+
+    def test_304_skips_the_listing_query(self, client, supreme_admin, monkeypatch):
+        _, token = supreme_admin
+        etag = client.get("/api/admin/students/", cookies=auth_cookies(token)).headers["etag"]
+        monkeypatch.setattr(crud, "get_applications", lambda *a, **k: pytest.fail("listing query ran"))
+        response = client.get("/api/admin/students/", headers={"If-None-Match": etag}, cookies=auth_cookies(token))
+        assert response.status_code == 304
+
+    def test_etag_depends_on_query_and_caller(self, client, supreme_admin, regular_admin):
+        _, supreme_token = supreme_admin
+        _, admin_token = regular_admin
+        etags = {
+            client.get("/api/admin/teachers/", cookies=auth_cookies(supreme_token)).headers["etag"],
+            client.get("/api/admin/teachers/", cookies=auth_cookies(admin_token)).headers["etag"],
+            client.get("/api/admin/teachers/?limit=5", cookies=auth_cookies(supreme_token)).headers["etag"],
+        }
+        assert len(etags) == 3
+
+    def test_dashboard_stats_invalidated_by_new_teacher(self, client, supreme_admin):
+        _, token = supreme_admin
+        first = client.get("/api/admin/dashboard-stats/", cookies=auth_cookies(token))
+        etag = first.headers["etag"]
+        assert client.get("/api/admin/dashboard-stats/", headers={"If-None-Match": etag}, cookies=auth_cookies(token)).status_code == 304
+        client.post("/api/admin/teachers/", data={
+            "name": "Versioned", "email": "versioned@test.com",
+            "phone_number": "1112223333", "shift": "Morning", "gender": "Female",
+        }, cookies=auth_cookies(token))
+        response = client.get("/api/admin/dashboard-stats/", headers={"If-None-Match": etag}, cookies=auth_cookies(token))
+        assert response.status_code == 200
+        assert response.json()["total_teachers"] == first.json()["total_teachers"] + 1
+
+    def test_bump_versions_rolls_back_with_the_write(self, db):
+        crud.bump_versions(db, crud.STUDENTS)
+        db.commit()
+        crud.bump_versions(db, crud.STUDENTS, crud.TEACHERS)
+        db.rollback()
+        assert crud.get_resource_versions(db, (crud.STUDENTS, crud.TEACHERS)) == {crud.STUDENTS: 1, crud.TEACHERS: 0}
+
+
 class TestAttendance:
     def test_mark(self, client, supreme_admin, sample_student, teacher_user):
         teacher, _ = teacher_user
@@ -576,6 +1248,92 @@ class TestAttendance:
         assert "teacher_by_course" in response.json()
 
 
+class TestAttendanceArchive:
+    def test_archived_rows_still_readable(self, client, db, supreme_admin, sample_student, teacher_user):
+        teacher, _ = teacher_user
+        _, token = supreme_admin
+        old_day = date.today() - timedelta(days=400)
+        crud.create_attendance_record(db, schemas.AttendanceCreate(
+            class_date=old_day, status="Present", student_id=sample_student.id, teacher_id=teacher.id))
+        crud.create_attendance_record(db, schemas.AttendanceCreate(
+            class_date=date.today(), status="Late", student_id=sample_student.id, teacher_id=teacher.id))
+
+        moved = crud.archive_attendance(db, before=date.today() - timedelta(days=365))
+        assert moved == 1
+        assert db.query(models.Attendance).count() == 1
+        assert db.query(models.AttendanceArchive).count() == 1
+        assert crud.get_archive_watermark(db) == old_day
+
+        # Date endpoints read the cold table only when the range needs it
+        assert crud.attendance_tables_for(db, date.today()) == [models.Attendance]
+        response = client.get(f"/api/admin/attendance/?teacher_id={teacher.id}&class_date={old_day.isoformat()}", cookies=auth_cookies(token))
+        assert response.status_code == 200
+        assert [r["status"] for r in response.json()] == ["Present"]
+        response = client.get(
+            f"/api/admin/attendance-count/?teacher_id={teacher.id}&year={old_day.year}&month={old_day.month}",
+            cookies=auth_cookies(token),
+        )
+        assert response.json()["students"][str(sample_student.id)]["counts"] == {"Present": 1}
+
+        # Duplicate checks see archived rows as well
+        duplicate = client.post("/api/admin/attendance/", json={
+            "class_date": old_day.isoformat(), "status": "Present",
+            "student_id": sample_student.id, "teacher_id": teacher.id,
+        }, cookies=auth_cookies(token))
+        assert duplicate.status_code == 400
+
+    def test_student_delete_cascades_to_archive(self, client, db, supreme_admin, sample_student, teacher_user):
+        teacher, _ = teacher_user
+        _, token = supreme_admin
+        crud.create_attendance_record(db, schemas.AttendanceCreate(
+            class_date=date.today() - timedelta(days=500), status="Present",
+            student_id=sample_student.id, teacher_id=teacher.id))
+        crud.archive_attendance(db, before=date.today())
+        client.delete(f"/api/admin/students/{sample_student.id}", cookies=auth_cookies(token))
+        assert db.query(models.AttendanceArchive).count() == 0
+
+    def test_archived_rows_are_read_only(self, client, db, supreme_admin, sample_student, teacher_user):
+        teacher, _ = teacher_user
+        _, token = supreme_admin
+        schedule = crud.create_schedule(db, schemas.ScheduleCreate(
+            day_of_week="Monday", start_time="08:00:00", end_time="09:00:00",
+            student_id=sample_student.id, teacher_id=teacher.id))
+        old_day = date.today() - timedelta(days=400)
+        old = crud.create_attendance_record(db, schemas.AttendanceCreate(
+            class_date=old_day, status="Present", student_id=sample_student.id,
+            teacher_id=teacher.id, schedule_id=schedule.id))
+        hot = crud.create_attendance_record(db, schemas.AttendanceCreate(
+            class_date=date.today(), status="Late", student_id=sample_student.id,
+            teacher_id=teacher.id, schedule_id=schedule.id))
+        old_id, hot_id = old.id, hot.id
+        crud.archive_attendance(db, before=date.today() - timedelta(days=365))
+
+        response = client.get(
+            f"/api/admin/session-attendance/?teacher_id={teacher.id}"
+            f"&start_date={old_day.isoformat()}&end_date={date.today().isoformat()}",
+            cookies=auth_cookies(token),
+        )
+        assert response.status_code == 200
+        assert {r["id"]: r["archived"] for r in response.json()} == {old_id: True, hot_id: False}
+
+        response = client.patch(f"/api/admin/session-attendance/{old_id}", json={"status": "Absent"}, cookies=auth_cookies(token))
+        assert response.status_code == 409
+        assert client.patch("/api/admin/session-attendance/99999", json={"status": "Absent"}, cookies=auth_cookies(token)).status_code == 404
+
+    def test_archived_ids_are_not_reused(self, db, sample_student, teacher_user):
+        teacher, _ = teacher_user
+        newest = crud.create_attendance_record(db, schemas.AttendanceCreate(
+            class_date=date.today() - timedelta(days=400), status="Present",
+            student_id=sample_student.id, teacher_id=teacher.id))
+        archived_id = newest.id
+        crud.archive_attendance(db, before=date.today())
+        assert db.query(models.Attendance).count() == 0
+
+        fresh = crud.create_attendance_record(db, schemas.AttendanceCreate(
+            class_date=date.today(), status="Present", student_id=sample_student.id, teacher_id=teacher.id))
+        assert fresh.id > archived_id
+
+
 class TestScheduleCRUD:
     def test_create(self, client, supreme_admin, sample_student, teacher_user):
         teacher, _ = teacher_user
@@ -726,6 +1484,54 @@ class TestTeacherStats:
         assert response.status_code == 403
 
 
+class TestCompression:
+    def _mk_students(self, db, n):
+        for i in range(n):
+            crud.create_application(db, schemas.ApplicationCreate(
+                first_name="Zipped", last_name=str(i), email=f"zip{i}@test.com",
+                phone_number="3030303030", country="BD", preferred_course="Islamic Studies",
+                age=12, gender="Male", learning_goals="Read the Quran with correct tajweed.",
+            ))
+
+    def test_large_listing_is_gzipped(self, client, db, supreme_admin):
+        self._mk_students(db, 20)
+        _, token = supreme_admin
+        response = client.get("/api/admin/students/", headers={"Accept-Encoding": "gzip"}, cookies=auth_cookies(token))
+        assert response.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert int(response.headers["content-length"]) < len(response.content)
+        assert len(response.json()) == 20
+
+    def test_small_response_and_identity_are_not_compressed(self, client, db, supreme_admin):
+        _, token = supreme_admin
+        assert "content-encoding" not in client.get("/", headers={"Accept-Encoding": "gzip"}).headers
+        self._mk_students(db, 20)
+        response = client.get("/api/admin/students/", headers={"Accept-Encoding": "identity"}, cookies=auth_cookies(token))
+        assert "content-encoding" not in response.headers
+
+    def test_304_and_files_are_not_compressed(self, client, db, supreme_admin):
+        self._mk_students(db, 20)
+        _, token = supreme_admin
+        etag = client.get("/api/admin/students/", cookies=auth_cookies(token)).headers["etag"]
+        cached = client.get("/api/admin/students/", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"}, cookies=auth_cookies(token))
+        assert cached.status_code == 304
+        assert "content-encoding" not in cached.headers
+        filename = TestFileServing()._upload_cv(client, token, b"%PDF-1.4 " + b"x" * 4096)
+        try:
+            response = client.get(f"/api/files/teacher-cv/{filename}", headers={"Accept-Encoding": "gzip"})
+            assert "content-encoding" not in response.headers
+            assert response.content == b"%PDF-1.4 " + b"x" * 4096
+        finally:
+            (file_handler.TEACHER_CVS_DIR / filename).unlink(missing_ok=True)
+
+    def test_choose_encoding(self, monkeypatch):
+        monkeypatch.setattr(compression, "brotli", None)
+        assert compression.choose_encoding("gzip, deflate, br") == "gzip"
+        assert compression.choose_encoding("gzip;q=0, deflate") is None
+        assert compression.choose_encoding("*") == "gzip"
+        assert compression.choose_encoding("") is None
+
+
 class TestFileServing:
     def test_teacher_photo_404(self, client):
         assert client.get("/api/files/teacher-photo/nonexistent.jpg").status_code == 404
@@ -739,6 +1545,376 @@ class TestFileServing:
     def test_admin_cv_404(self, client):
         assert client.get("/api/files/admin-cv/nonexistent.pdf").status_code == 404
 
+    def _upload_cv(self, client, token, content):
+        response = client.post("/api/admin/teachers/", data={
+            "name": "Serve Teacher", "email": "serve@test.com",
+            "phone_number": "4564564567", "shift": "Morning", "gender": "Female",
+        }, files={"cv": ("cv.pdf", content, "application/pdf")}, cookies=auth_cookies(token))
+        return response.json()["cv_url"].rsplit("/", 1)[1]
+
+    def test_etag_and_immutable_caching(self, client, supreme_admin):
+        _, token = supreme_admin
+        filename = self._upload_cv(client, token, b"%PDF-1.4 cached")
+        try:
+            response = client.get(f"/api/files/teacher-cv/{filename}")
+            assert response.status_code == 200
+            assert response.headers["etag"] == f'"{filename[:-4]}"'
+            assert "immutable" in response.headers["cache-control"]
+            again = client.get(f"/api/files/teacher-cv/{filename}", headers={"If-None-Match": response.headers["etag"]})
+            assert again.status_code == 304 and again.content == b""
+            assert client.get(f"/api/files/teacher-cv/{filename}", headers={"If-None-Match": '"other"'}).status_code == 200
+        finally:
+            (file_handler.TEACHER_CVS_DIR / filename).unlink(missing_ok=True)
+
+    def test_sendfile_uses_pathsend_when_supported(self, tmp_path):
+        path = tmp_path / "cv.pdf"
+        path.write_bytes(b"%PDF-1.4 pathsend")
+
+        def call(headers=(), extensions=None):
+            messages = []
+            async def receive():
+                return {"type": "http.request"}
+            async def send(message):
+                messages.append(message)
+            scope = {"type": "http", "method": "GET", "headers": list(headers), "extensions": extensions or {}}
+            asyncio.run(file_serving.SendfileResponse(path)(scope, receive, send))
+            return messages
+
+        sent = call(extensions={"http.response.pathsend": {}})
+        assert [m["type"] for m in sent] == ["http.response.start", "http.response.pathsend"]
+        assert (b"content-length", b"17") in sent[0]["headers"]
+        assert sent[1]["path"] == str(path)
+        # Without the extension, or for a Range request, the body is streamed as usual
+        assert call()[-1]["type"] == "http.response.body"
+        ranged = call(headers=[(b"range", b"bytes=0-3")], extensions={"http.response.pathsend": {}})
+        assert ranged[0]["status"] == 206 and ranged[1]["body"] == b"%PDF"
+
+    def test_range_request(self, client, supreme_admin):
+        _, token = supreme_admin
+        content = b"%PDF-1.4 " + bytes(range(256)) * 4
+        filename = self._upload_cv(client, token, content)
+        try:
+            response = client.get(f"/api/files/teacher-cv/{filename}", headers={"Range": "bytes=10-19"})
+            assert response.status_code == 206
+            assert response.content == content[10:20]
+            assert response.headers["content-range"] == f"bytes 10-19/{len(content)}"
+        finally:
+            (file_handler.TEACHER_CVS_DIR / filename).unlink(missing_ok=True)
+
+    def test_small_files_are_served_from_memory(self, client, supreme_admin):
+        _, token = supreme_admin
+        file_serving.cache.clear()
+        filename = self._upload_cv(client, token, b"%PDF-1.4 hot")
+        try:
+            hits = file_serving.cache.stats["hits"]
+            first = client.get(f"/api/files/teacher-cv/{filename}")
+            second = client.get(f"/api/files/teacher-cv/{filename}")
+            assert first.content == second.content == b"%PDF-1.4 hot"
+            assert file_serving.cache.stats["hits"] == hits + 1
+        finally:
+            (file_handler.TEACHER_CVS_DIR / filename).unlink(missing_ok=True)
+
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + b"\x00" * 256
+
+
+class TestUploadLimits:
+    def _create_teacher(self, client, token, email, **files):
+        return client.post("/api/admin/teachers/", data={
+            "name": "Upload Teacher", "email": email,
+            "phone_number": "1231231234", "shift": "Morning", "gender": "Female",
+        }, files=files, cookies=auth_cookies(token))
+
+    def test_photo_is_streamed_to_disk(self, client, supreme_admin):
+        _, token = supreme_admin
+        response = self._create_teacher(client, token, "up1@test.com", photo=("me.png", PNG_BYTES, "image/png"))
+        assert response.status_code == 201
+        url = response.json()["profile_photo_url"]
+        assert url.startswith("/uploads/teacher_photos/") and url.endswith(".png")
+        path = file_handler.UPLOADS_DIR / url.replace("/uploads/", "", 1)
+        try:
+            assert path.read_bytes() == PNG_BYTES
+            assert not list(file_handler.TEACHER_PHOTOS_DIR.glob(".tmp-*"))
+        finally:
+            path.unlink(missing_ok=True)
+
+    def test_too_large_is_rejected(self, client, db, supreme_admin, monkeypatch):
+        _, token = supreme_admin
+        monkeypatch.setitem(file_handler.UPLOAD_LIMITS, "teacher_cvs", (100, file_handler.CV_TYPES))
+        before = set(file_handler.TEACHER_CVS_DIR.iterdir())
+        response = self._create_teacher(client, token, "up2@test.com", cv=("cv.pdf", b"%PDF-" + b"x" * 500, "application/pdf"))
+        assert response.status_code == 413
+        assert set(file_handler.TEACHER_CVS_DIR.iterdir()) == before
+        assert crud.get_teacher_by_email(db, "up2@test.com") is None
+
+    @pytest.mark.parametrize("filename,content,content_type", [
+        ("cv.exe", b"MZ...", "application/octet-stream"),
+        ("cv.pdf", b"not a pdf at all", "application/pdf"),
+        ("me.pdf", b"%PDF-1.4", "image/png"),
+    ])
+    def test_wrong_type_is_rejected(self, client, supreme_admin, filename, content, content_type):
+        _, token = supreme_admin
+        response = self._create_teacher(client, token, "up3@test.com", cv=(filename, content, content_type))
+        assert response.status_code == 415
+
+
+class TestContentAddressedUploads:
+    def _create_teacher(self, client, token, email, **files):
+        return client.post("/api/admin/teachers/", data={
+            "name": "Shared Teacher", "email": email,
+            "phone_number": "3213214321", "shift": "Morning", "gender": "Male",
+        }, files=files, cookies=auth_cookies(token))
+
+    def test_same_bytes_are_stored_once_and_refcounted(self, client, db, supreme_admin, monkeypatch):
+        import hashlib
+        monkeypatch.setattr(file_handler, "UPLOAD_RELEASE_GRACE_SECONDS", 0)
+        _, token = supreme_admin
+        content = b"%PDF-1.4 shared cv"
+        first = self._create_teacher(client, token, "share1@test.com", cv=("a.pdf", content, "application/pdf")).json()
+        second = self._create_teacher(client, token, "share2@test.com", cv=("b.pdf", content, "application/pdf")).json()
+        assert first["cv_url"] == second["cv_url"] == f"/uploads/teacher_cvs/{hashlib.sha256(content).hexdigest()}.pdf"
+        path = file_handler.UPLOADS_DIR / first["cv_url"].replace("/uploads/", "", 1)
+        try:
+            assert crud.count_file_references(db, first["cv_url"]) == 2
+            # Still referenced by the second teacher
+            assert client.delete(f"/api/admin/teachers/{first['id']}", cookies=auth_cookies(token)).status_code == 200
+            file_ops.wait()
+            assert path.exists()
+            assert client.delete(f"/api/admin/teachers/{second['id']}/cv", cookies=auth_cookies(token)).status_code == 200
+            file_ops.wait()
+            assert not path.exists()
+        finally:
+            path.unlink(missing_ok=True)
+
+    def test_release_leaves_recent_reupload_to_gc(self, client, db, supreme_admin):
+        # The second upload found the file stored already; its row might still be
+        # uncommitted when the last committed reference is released
+        _, token = supreme_admin
+        content = b"%PDF-1.4 raced cv"
+        first = self._create_teacher(client, token, "race1@test.com", cv=("a.pdf", content, "application/pdf")).json()
+        second = self._create_teacher(client, token, "race2@test.com", cv=("b.pdf", content, "application/pdf")).json()
+        path = file_handler.UPLOADS_DIR / first["cv_url"].replace("/uploads/", "", 1)
+        try:
+            for teacher in (first, second):
+                client.delete(f"/api/admin/teachers/{teacher['id']}/cv", cookies=auth_cookies(token))
+            file_ops.wait()
+            assert path.exists()
+            assert crud.count_file_references(db, first["cv_url"]) == 0
+        finally:
+            path.unlink(missing_ok=True)
+
+    def test_reupload_of_same_file_keeps_it(self, client, supreme_admin):
+        _, token = supreme_admin
+        teacher = self._create_teacher(client, token, "share3@test.com", cv=("a.pdf", b"%PDF-1.4 same", "application/pdf")).json()
+        path = file_handler.UPLOADS_DIR / teacher["cv_url"].replace("/uploads/", "", 1)
+        try:
+            response = client.patch(f"/api/admin/teachers/{teacher['id']}", files={
+                "cv": ("again.pdf", b"%PDF-1.4 same", "application/pdf"),
+            }, cookies=auth_cookies(token))
+            assert response.status_code == 200
+            assert response.json()["cv_url"] == teacher["cv_url"]
+            file_ops.wait()
+            assert path.exists()
+        finally:
+            path.unlink(missing_ok=True)
+
+
+class TestStorageBackends:
+    def test_memory_backend_round_trip(self, client, db, supreme_admin, monkeypatch):
+        backend = storage.MemoryStorage()
+        monkeypatch.setattr(storage, "backend", backend)
+        _, token = supreme_admin
+        content = b"%PDF-1.4 in memory"
+        teacher = client.post("/api/admin/teachers/", data={
+            "name": "Memory Teacher", "email": "memory@test.com",
+            "phone_number": "7897897890", "shift": "Morning", "gender": "Male",
+        }, files={"cv": ("cv.pdf", content, "application/pdf")}, cookies=auth_cookies(token)).json()
+        key = storage.key_from_url(teacher["cv_url"])
+        assert backend.objects == {key: content}
+        assert not (file_handler.UPLOADS_DIR / key).exists()
+        assert not list(file_handler.SPOOL_DIR.iterdir())
+
+        filename = key.rsplit("/", 1)[1]
+        response = client.get(f"/api/files/teacher-cv/{filename}")
+        assert response.status_code == 200 and response.content == content
+        assert client.get(f"/api/files/teacher-cv/{filename}", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+        assert client.delete(f"/api/admin/teachers/{teacher['id']}/cv", cookies=auth_cookies(token)).status_code == 200
+        file_ops.wait()
+        assert backend.objects == {}
+        assert client.get(f"/api/files/teacher-cv/{filename}").status_code == 404
+
+    def test_hidden_and_traversal_keys_are_not_served(self, client):
+        assert client.get("/api/files/teacher-cv/.incoming").status_code == 404
+        assert client.get("/api/files/teacher-cv/..").status_code == 404
+        assert storage.key_from_url("/uploads/../main.py") is None
+
+    def test_local_backend_keeps_existing_content(self, tmp_path):
+        backend = storage.LocalStorage(tmp_path / "store")
+        first, second = tmp_path / "a", tmp_path / "b"
+        first.write_bytes(b"one")
+        second.write_bytes(b"two")
+        assert backend.save("kind/x.pdf", first) is True
+        assert backend.save("kind/x.pdf", second) is False
+        assert not second.exists()
+        with backend.open("kind/x.pdf") as f:
+            assert f.read() == b"one"
+        assert backend.delete("kind/x.pdf") and not backend.exists("kind/x.pdf")
+
+
+class TestUploadManifest:
+    def test_manifest_tracks_saves_and_deletes(self, client, db, supreme_admin, monkeypatch):
+        monkeypatch.setattr(storage, "backend", storage.MemoryStorage())
+        _, token = supreme_admin
+        teacher = client.post("/api/admin/teachers/", data={
+            "name": "Manifest Teacher", "email": "manifest@test.com",
+            "phone_number": "8908908901", "shift": "Morning", "gender": "Female",
+        }, files={
+            "photo": ("me.png", PNG_BYTES, "image/png"),
+            "cv": ("cv.pdf", b"%PDF-1.4 manifest", "application/pdf"),
+        }, cookies=auth_cookies(token)).json()
+
+        entry = db.get(models.UploadManifest, storage.key_from_url(teacher["cv_url"]))
+        assert entry.kind == "teacher_cvs" and entry.size_bytes == len(b"%PDF-1.4 manifest")
+        assert entry.owner == "manifest@test.com" and entry.key.startswith(f"teacher_cvs/{entry.digest}")
+
+        stats = client.get("/api/admin/storage-stats", cookies=auth_cookies(token)).json()
+        assert stats["files"] == 2
+        assert stats["bytes"] == len(PNG_BYTES) + len(b"%PDF-1.4 manifest")
+        assert stats["by_kind"]["teacher_photos"] == {"files": 1, "bytes": len(PNG_BYTES)}
+
+        client.delete(f"/api/admin/teachers/{teacher['id']}/cv", cookies=auth_cookies(token))
+        file_ops.wait()
+        stats = client.get("/api/admin/storage-stats", cookies=auth_cookies(token)).json()
+        assert stats["files"] == 1 and "teacher_cvs" not in stats["by_kind"]
+
+    def test_storage_stats_forbidden_for_teacher(self, client, teacher_user):
+        _, token = teacher_user
+        assert client.get("/api/admin/storage-stats", cookies=auth_cookies(token)).status_code == 403
+
+
+class TestFileOps:
+    def test_ops_run_after_commit_only(self, db):
+        ran = []
+        file_ops.after_commit(db, lambda session, name: ran.append(name), "rolled back")
+        db.rollback()
+        file_ops.after_commit(db, lambda session, name: ran.append(name), "committed")
+        assert ran == []
+        db.commit()
+        file_ops.wait()
+        assert ran == ["committed"]
+
+    def test_failed_update_keeps_old_file(self, db, monkeypatch, teacher_user):
+        backend = storage.MemoryStorage()
+        monkeypatch.setattr(storage, "backend", backend)
+        backend.objects["teacher_cvs/old.pdf"] = b"%PDF-old"
+        teacher, _ = teacher_user
+        teacher.cv_url = "/uploads/teacher_cvs/old.pdf"
+        db.commit()
+
+        teacher.cv_url = None
+        file_handler.delete_teacher_cv(db, "/uploads/teacher_cvs/old.pdf")
+        db.rollback() # e.g. the commit failed
+        db.commit()
+        file_ops.wait()
+        assert "teacher_cvs/old.pdf" in backend.objects
+
+        teacher.cv_url = None
+        file_handler.delete_teacher_cv(db, "/uploads/teacher_cvs/old.pdf")
+        db.commit()
+        file_ops.wait()
+        assert backend.objects == {}
+
+
+class TestUploadGC:
+    def _store(self, backend, key, content, age_seconds):
+        spool = file_handler.SPOOL_DIR / f".tmp-test-{key.replace('/', '-')}"
+        spool.write_bytes(content)
+        backend.save(key, spool)
+        backend.saved_at[key] = time_module.time() - age_seconds
+
+    def test_dry_run_then_delete_orphans(self, client, db, supreme_admin, monkeypatch):
+        backend = storage.MemoryStorage()
+        monkeypatch.setattr(storage, "backend", backend)
+        _, token = supreme_admin
+        teacher = client.post("/api/admin/teachers/", data={
+            "name": "GC Teacher", "email": "gc@test.com",
+            "phone_number": "9019019012", "shift": "Morning", "gender": "Male",
+        }, files={"cv": ("cv.pdf", b"%PDF-1.4 kept", "application/pdf")}, cookies=auth_cookies(token)).json()
+        kept = storage.key_from_url(teacher["cv_url"])
+        backend.saved_at[kept] -= 7 * 24 * 3600
+        self._store(backend, "teacher_cvs/old-orphan.pdf", b"%PDF-old", age_seconds=7 * 24 * 3600)
+        self._store(backend, "admin_photos/new-orphan.png", PNG_BYTES, age_seconds=60)
+
+        report = client.post("/api/admin/storage-gc", cookies=auth_cookies(token)).json()
+        assert report["dry_run"] is True
+        assert (report["scanned"], report["referenced"], report["recent"], report["orphans"]) == (3, 1, 1, 1)
+        assert report["sample"] == ["teacher_cvs/old-orphan.pdf"] and report["deleted"] == 0
+        assert "teacher_cvs/old-orphan.pdf" in backend.objects
+
+        report = client.post("/api/admin/storage-gc?dry_run=false", cookies=auth_cookies(token)).json()
+        assert report["deleted"] == 1
+        assert set(backend.objects) == {kept, "admin_photos/new-orphan.png"}
+
+    def test_batch_skips_keys_referenced_since_the_scan(self, db, monkeypatch, supreme_admin):
+        backend = storage.MemoryStorage()
+        self._store(backend, "teacher_cvs/raced.pdf", b"%PDF-raced", age_seconds=7 * 24 * 3600)
+        user, _ = supreme_admin
+        user.cv_url = "/uploads/teacher_cvs/raced.pdf"
+        db.commit()
+        assert gc_uploads._delete_batch(db, backend, ["teacher_cvs/raced.pdf"], datetime.now(timezone.utc) - timedelta(hours=1)) == 0
+        assert "teacher_cvs/raced.pdf" in backend.objects
+
+    def test_reupload_refreshes_manifest_not_file(self, db, monkeypatch):
+        backend = storage.MemoryStorage()
+        monkeypatch.setattr(storage, "backend", backend)
+        self._store(backend, "teacher_cvs/again.pdf", b"%PDF-again", age_seconds=7 * 24 * 3600)
+        crud.record_upload(db, "teacher_cvs/again.pdf", "teacher_cvs", 10, "a" * 64)
+        assert db.get(models.UploadManifest, "teacher_cvs/again.pdf").reuploaded_at is None
+        stored_at = backend.saved_at["teacher_cvs/again.pdf"]
+        # The same content arrives again: the stored object is left alone, the manifest row is refreshed
+        spool = file_handler.SPOOL_DIR / ".tmp-test-again"
+        spool.write_bytes(b"%PDF-again")
+        assert backend.save("teacher_cvs/again.pdf", spool) is False
+        crud.record_upload(db, "teacher_cvs/again.pdf", "teacher_cvs", 10, "a" * 64)
+        assert backend.saved_at["teacher_cvs/again.pdf"] == stored_at
+        report = gc_uploads.collect_garbage(db, dry_run=False)
+        assert (report["recent"], report["deleted"]) == (1, 0)
+        assert "teacher_cvs/again.pdf" in backend.objects
+
+    def test_forbidden_for_admin(self, client, regular_admin):
+        _, token = regular_admin
+        assert client.post("/api/admin/storage-gc", cookies=auth_cookies(token)).status_code == 403
+
+
+class TestPhotoVariants:
+    def test_size_variants_are_webp_and_cached(self, client, db, supreme_admin):
+        from PIL import Image
+        import io
+        buffer = io.BytesIO()
+        Image.new("RGB", (1200, 900), "teal").save(buffer, "JPEG")
+        _, token = supreme_admin
+        response = client.post("/api/admin/teachers/", data={
+            "name": "Photo Teacher", "email": "variants@test.com",
+            "phone_number": "5675675678", "shift": "Morning", "gender": "Female",
+        }, files={"photo": ("big.jpg", buffer.getvalue(), "image/jpeg")}, cookies=auth_cookies(token))
+        url = response.json()["profile_photo_url"]
+        filename = url.rsplit("/", 1)[1]
+        original = file_handler.TEACHER_PHOTOS_DIR / filename
+        try:
+            thumb = client.get(f"/api/files/teacher-photo/{filename}?size=thumb")
+            assert thumb.status_code == 200
+            assert thumb.headers["content-type"] == "image/webp"
+            img = Image.open(io.BytesIO(thumb.content))
+            assert img.format == "WEBP" and max(img.size) == 128
+            assert image_variants.variant_path(original, "thumb").exists()
+            assert client.get(f"/api/files/teacher-photo/{filename}?size=huge").status_code == 400
+            # Full size is still the original upload
+            assert client.get(f"/api/files/teacher-photo/{filename}").content == buffer.getvalue()
+        finally:
+            file_handler._delete_file(db, url)
+        assert not image_variants.variant_path(original, "thumb").exists()
+
 
 class TestPhotoAndCVDeletion:
     def test_delete_admin_photo(self, client, supreme_admin):